@@ -1,9 +1,11 @@
 import numpy as np
 import torch
 from PIL import Image
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, DataLoader
 import torchvision.transforms as transforms
 
+from pdf_extract_kit.utils.page_image import to_bgr
+
 
 class ResizeLongestSide:
     def __init__(self, size):
@@ -23,19 +25,46 @@ class ResizeLongestSide:
         return img.resize((new_width, new_height), Image.BILINEAR)
 
 
+def bgr_tensor(image):
+    """
+    Decode an image path, PIL.Image.Image, PageImage or BGR np.ndarray to a (H, W, 3) uint8 BGR tensor (the input
+    of the YOLO models), the tensors built in DataLoader workers are sent back through shared memory.
+    """
+    return torch.from_numpy(np.ascontiguousarray(to_bgr(image)))
+
+
+def build_dataloader(dataset, batch_size=1, num_workers=0, prefetch_factor=2, pin_memory=False, collate_fn=None):
+    """
+    DataLoader preparing the batches of a dataset in num_workers processes, prefetch_factor batches ahead per worker,
+    so that decoding and preprocessing run while the model runs on the previous batches.
+
+    Args:
+        pin_memory (bool): Batches in page-locked memory, copied asynchronously to the GPU (ignored without CUDA).
+        collate_fn (callable, optional): Merges the samples of a batch, e.g. `list` for images of different sizes.
+    """
+    kwargs = {}
+    if num_workers > 0:
+        kwargs['prefetch_factor'] = prefetch_factor
+    return DataLoader(dataset, batch_size=batch_size, num_workers=num_workers, collate_fn=collate_fn,
+                      pin_memory=pin_memory and torch.cuda.is_available(), **kwargs)
+
+
 class ImageDataset(Dataset):
-    def __init__(self, images, image_ids=None, img_size=1280):
+    def __init__(self, images, image_ids=None, img_size=1280, transform=None):
         """
         Initialize the ImageDataset class.
         
         Args:
-        - images (list): List of image paths or PIL.Image.Image objects.
+        - images (list): List of image paths or PIL.Image.Image objects (or PageImage, np.ndarray with a transform).
         - image_ids (list, optional): List of corresponding image IDs. If None, assumes images are paths.
         - img_size (int): Size to which images' longest side will be resized.
+        - transform (callable, optional): Applied to each image as given, e.g. `bgr_tensor`, instead of converting it
+          to RGB, resizing it and converting it to a tensor.
         """
         self.images = images
         self.image_ids = image_ids if image_ids is not None else images
         self.img_size = img_size
+        self.image_transform = transform
         self.transform = transforms.Compose([
             ResizeLongestSide(self.img_size),
             transforms.ToTensor()
@@ -62,6 +91,8 @@ class ImageDataset(Dataset):
         """
         image = self.images[idx]
         image_id = self.image_ids[idx]
+        if self.image_transform is not None:
+            return self.image_transform(image), image_id
 
         # Check if the image is a path or a PIL.Image object
         if isinstance(image, str):
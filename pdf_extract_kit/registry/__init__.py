@@ -1 +1 @@
-from .registry import TASK_REGISTRY, MODEL_REGISTRY
\ No newline at end of file
+from .registry import TASK_REGISTRY, MODEL_REGISTRY, RASTERIZER_REGISTRY, RESULT_WRITER_REGISTRY
\ No newline at end of file
@@ -18,6 +18,8 @@ class Registry:
     def list_items(self):
         return list(self._registry.keys())
 
-# Create global registries for tasks and models
+# Create global registries for tasks, models, pdf rasterizer backends and result writers
 TASK_REGISTRY = Registry()
-MODEL_REGISTRY = Registry()
\ No newline at end of file
+MODEL_REGISTRY = Registry()
+RASTERIZER_REGISTRY = Registry()
+RESULT_WRITER_REGISTRY = Registry()
\ No newline at end of file
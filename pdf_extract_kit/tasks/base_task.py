@@ -1,10 +1,16 @@
 import os
-from pdf_extract_kit.utils.data_preprocess import load_pdf
+from pdf_extract_kit.utils.data_preprocess import open_pdf
 
 
 class BaseTask:
-    def __init__(self, model):
+    def __init__(self, model, pdf_config=None):
+        """
+        Args:
+            model: task model, must contains predict function.
+            pdf_config (dict, optional): Options of the PDF page source, e.g. dpi, num_workers and prefetch, see `open_pdf`.
+        """
         self.model = model
+        self.pdf_config = pdf_config or {}
 
     def load_images(self, input_data):
         """
@@ -41,16 +47,16 @@ class BaseTask:
 
     def load_pdf_images(self, input_data):
         """
-        Loads images from a single PDF file or directory containing multiple PDF files.
+        Lazily loads images from a single PDF file or directory containing multiple PDF files.
 
         Args:
             input_data (str): Path to a single PDF file or a directory containing PDF files.
 
-        Returns:
-            dict: Dictionary with image IDs (formed by PDF path and page number) as keys and corresponding PIL.Image objects as values.
-                  Note: Loading multiple PDFs at once is not recommended due to high memory consumption. Consider processing one PDF at a time externally using loops or multithreading.
+        Yields:
+            tuple: (image ID, PIL.Image.Image) pairs, the image ID is formed by PDF name and page number.
+                  Note: Pages are rendered on demand and PDFs are opened one at a time, so only the page being consumed is held in memory.
         """
-        pdf_images = {}
+        pdf_paths = []
 
         if os.path.isdir(input_data):
             # If input_data is a directory, check for nested directories
@@ -59,22 +65,19 @@ class BaseTask:
                     raise ValueError("Input directory should not contain nested directories: {}".format(input_data))
                 for file in files:
                     if file.lower().endswith(('.pdf')):
-                        pdf_path = os.path.join(root, file)
-                        images = load_pdf(pdf_path)
-                        for i, img in enumerate(images):
-                            img_id = f"{os.path.splitext(file)[0]}_page_{i+1:04d}"
-                            pdf_images[img_id] = img
-                # images = sorted(images)
+                        pdf_paths.append(os.path.join(root, file))
                 break  # Only process the top-level directory
         else:
             # Determine the type of input data and process accordingly
             if input_data.lower().endswith(('.pdf')):
-                # If input is a single image file
-                images = load_pdf(input_data)
-                for i, img in enumerate(images):
-                    img_id = f"{os.path.splitext(os.path.basename(input_data))[0]}_page_{i+1:04d}"
-                    pdf_images[img_id] = img
+                # If input is a single pdf file
+                pdf_paths = [input_data]
             else:
                 raise ValueError("Unsupported input data format: {}".format(input_data))
 
-        return pdf_images
\ No newline at end of file
+        for pdf_path in pdf_paths:
+            pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+            with open_pdf(pdf_path, **self.pdf_config) as pages:
+                for i, img in enumerate(pages):
+                    img_id = f"{pdf_name}_page_{i+1:04d}"
+                    yield img_id, img
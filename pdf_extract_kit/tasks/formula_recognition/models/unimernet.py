@@ -1,6 +1,9 @@
 import os
 import logging
 import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import torch
@@ -11,6 +14,8 @@ from unimernet.common.config import Config
 from unimernet.processors import load_processor
 
 from pdf_extract_kit.registry import MODEL_REGISTRY
+from pdf_extract_kit.dataset.dataset import MathDataset, build_dataloader
+from pdf_extract_kit.utils.cache import build_result_cache, build_perceptual_cache, hash_image
 
 
 @MODEL_REGISTRY.register('formula_recognition_unimernet')
@@ -26,6 +31,22 @@ class FormulaRecognitionUniMERNet:
         self.model_dir = config['model_path']
         self.cfg_path = config.get('cfg_path', "pdf_extract_kit/configs/unimernet.yaml")
         self.batch_size = config.get('batch_size', 1)
+        # worker processes running the vis_processor of `recognize` ahead of the model, used when there is more than
+        # one batch, the batches are pinned for asynchronous copies to the GPU
+        self.num_workers = config.get('num_workers', 0)
+        self.prefetch_factor = config.get('prefetch_factor', 2)
+        self.pin_memory = config.get('pin_memory', True)
+        # threads reading and preprocessing the image files of `predict`, prefetch_factor batches ahead of the model
+        self.decode_threads = config.get('decode_threads', 4)
+        # Optional on-disk cache of the predicted latex, enabled by `cache_path`
+        self.cache = build_result_cache(config, 'formula_recognition_unimernet',
+                                        os.path.join(self.model_dir, "pytorch_model.pth"), cfg_path=self.cfg_path)
+
+        # Optional in-memory cache of the latex of near identical crops, enabled by `dedup`: used by `predict`, and by
+        # pdf2markdown in front of its formula recognition service, per document or across the run (`scope`)
+        self.dedup = build_perceptual_cache(config.get('dedup', None))
+        self.dedup_scope = (config.get('dedup') or {}).get('scope', 'document')
+        assert self.dedup_scope in ('document', 'run'), f"unknown dedup scope {self.dedup_scope}"
 
         # Load the UniMERNet model
         self.model, self.vis_processor = self.load_model_and_processor()
@@ -44,33 +65,165 @@ class FormulaRecognitionUniMERNet:
         except Exception as e:
             logging.error(f"Error loading model and processor: {e}")
             raise
+
+    def recognize(self, images):
+        """
+        Recognize formula images in batches of batch_size, cached formulas are not recognized again.
+
+        The near identical crops are not grouped here, callers use `dedup.recognize` in front of it (see `predict`).
+
+        Args:
+            images (list): List of PIL.Image.Image formula crops.
+
+        Returns:
+            list: Predicted latex of each image, in input order.
+        """
+        results = [None] * len(images)
+        keys = [hash_image(image) if self.cache is not None else None for image in images]
+        todo = []
+        for idx, key in enumerate(keys):
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                results[idx] = cached
+            else:
+                todo.append(idx)
+        if not todo:
+            return results
+
+        dataset = MathDataset([images[idx] for idx in todo], transform=self.vis_processor)
+        dataloader = build_dataloader(dataset, batch_size=self.batch_size,
+                                      num_workers=self.num_workers if len(todo) > self.batch_size else 0,
+                                      prefetch_factor=self.prefetch_factor, pin_memory=self.pin_memory)
+        preds = []
+        for imgs in dataloader:
+            preds.extend(self.generate(imgs))
+        for idx, pred in zip(todo, preds):
+            results[idx] = pred
+            if self.cache is not None:
+                self.cache.put(keys[idx], pred)
+        return results
     
-    def predict(self, images, result_path):
-        results = []
-        for image_path in images:
+    def generate(self, imgs):
+        """
+        Args:
+            imgs (torch.Tensor): Batch of images preprocessed by the vis_processor.
+
+        Returns:
+            list: Predicted latex of each image.
+        """
+        imgs = imgs.to(self.device, non_blocking=True)
+        output = self.model.generate({'image': imgs})
+        return output['pred_str']
+
+    def load_image(self, image_path):
+        """
+        Read and preprocess an image file, run by the decode threads of `predict`.
+
+        Returns:
+            tuple or None: (latex of the result cache or None, preprocessed image, result cache key, dedup key),
+                None if the image can not be read or preprocessed.
+        """
+        try:
+            cache_key = hash_image(image_path) if self.cache is not None and os.path.exists(image_path) else None
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                return cached, None, cache_key, None
             # Read the image using OpenCV
             open_cv_image = cv2.imread(image_path)
             if open_cv_image is None:
                 logging.error(f"Error: Unable to open image at {image_path}")
-                continue
+                return None
             # Convert the OpenCV image to PIL.Image format
             raw_image = Image.fromarray(cv2.cvtColor(open_cv_image, cv2.COLOR_BGR2RGB))
+            dedup_key = self.dedup.key(raw_image) if self.dedup is not None else None
+            return None, self.vis_processor(raw_image), cache_key, dedup_key
+        except Exception as e:
+            logging.error(f"Error processing image {image_path}: {e}")
+            return None
 
-            try:
-                # Process the image using the visual processor and prepare it for the model
-                image = self.vis_processor(raw_image).unsqueeze(0).to(self.device)
+    def load_images(self, image_paths):
+        """
+        Yield (index, `load_image` result) of the image files in input order, read by decode_threads threads
+        prefetch_factor batches ahead of the consumer.
+        """
+        window = max(self.batch_size * self.prefetch_factor, 1)
+        paths = enumerate(image_paths)
+        with ThreadPoolExecutor(max_workers=max(self.decode_threads, 1), thread_name_prefix="formula_decode") as executor:
+            futures = deque((idx, executor.submit(self.load_image, path)) for idx, path in itertools.islice(paths, window))
+            while futures:
+                idx, future = futures.popleft()
+                for next_idx, path in itertools.islice(paths, 1):
+                    futures.append((next_idx, executor.submit(self.load_image, path)))
+                yield idx, future.result()
 
-                # Generate the prediction using the model
-                output = self.model.generate({"image": image})
-                pred = output["pred_str"][0]
-                logging.info(f'Prediction for {image_path}:\n{pred}')
+    def predict_batch(self, image_paths, batch):
+        """
+        Recognize a batch of preprocessed images of `predict`, the images of a failing batch are recognized one by one.
 
-                # cv2.imshow('Original Image', open_cv_image)
-                # cv2.waitKey(0)
-                # cv2.destroyAllWindows()
+        Args:
+            image_paths (list): Image paths of `predict`.
+            batch (list): (index, preprocessed image, result cache key, dedup key) of the images of the batch.
 
-                results.append(pred)
-            except Exception as e:
-                logging.error(f"Error processing image {image_path}: {e}")
-    
-        return results
\ No newline at end of file
+        Returns:
+            list: Predicted latex of each image of the batch, None for the images which could not be recognized.
+        """
+        imgs = torch.stack([tensor for _, tensor, _, _ in batch])
+        if self.pin_memory and torch.cuda.is_available():
+            imgs = imgs.pin_memory()
+        try:
+            preds = self.generate(imgs)
+        except Exception as e:
+            if len(batch) == 1:
+                logging.error(f"Error processing image {image_paths[batch[0][0]]}: {e}")
+                return [None]
+            return [pred for item in batch for pred in self.predict_batch(image_paths, [item])]
+        for (idx, _, cache_key, _), pred in zip(batch, preds):
+            logging.info(f'Prediction for {image_paths[idx]}:\n{pred}')
+            if self.cache is not None and cache_key is not None:
+                self.cache.put(cache_key, pred)
+        return preds
+
+    def predict_chunk(self, image_paths, chunk, results):
+        """
+        Recognize batch_size preprocessed images of `predict`, with `dedup` the near identical images of the chunk
+        and the images of the dedup cache are not recognized again (see `PerceptualHashCache.recognize`).
+        """
+        if self.dedup is None:
+            preds = self.predict_batch(image_paths, chunk)
+        else:
+            preds = self.dedup.recognize(chunk, lambda batch: self.predict_batch(image_paths, batch),
+                                         keys=[dedup_key for _, _, _, dedup_key in chunk])
+        for (idx, _, _, _), pred in zip(chunk, preds):
+            results[idx] = pred
+
+    def predict(self, images, result_path):
+        """
+        Recognize formula image files in batches of batch_size.
+
+        The files are read and preprocessed by decode_threads threads while the model runs on the previous batches.
+        An image which can not be read or preprocessed is logged and skipped, the other images of its batch are
+        recognized. With `dedup`, the near identical images of a chunk of batch_size images are recognized once.
+
+        Args:
+            images (list): Paths of the formula images.
+            result_path (str): Path to save the prediction results (unused).
+
+        Returns:
+            list: Predicted latex of each image, None for the images which could not be recognized, in input order.
+        """
+        results = [None] * len(images)
+        chunk = []
+        for idx, loaded in self.load_images(images):
+            if loaded is None:
+                continue
+            latex, tensor, cache_key, dedup_key = loaded
+            if latex is not None:
+                results[idx] = latex
+                continue
+            chunk.append((idx, tensor, cache_key, dedup_key))
+            if len(chunk) == self.batch_size:
+                self.predict_chunk(images, chunk, results)
+                chunk = []
+        if chunk:
+            self.predict_chunk(images, chunk, results)
+        return results
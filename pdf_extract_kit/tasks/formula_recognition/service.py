@@ -0,0 +1,72 @@
+from bisect import bisect_right
+
+from pdf_extract_kit.utils.batching import BucketBatchScheduler
+
+
+class FormulaRecognitionService(BucketBatchScheduler):
+    """
+    Formula recognition of the crops of all the pages and documents in flight, in batches of crops of similar shape.
+
+    The decoding of a batch lasts as long as its longest formula, and the length of a formula follows the shape of
+    its crop: the crops are bucketed by aspect ratio and area, each bucket is decoded in its own batches of the
+    batch_size of the model. The latency of the batches and the tokens decoded per second are given by `stats`.
+
+    Example:
+        >>> service = FormulaRecognitionService(mfr_model)
+        >>> latex = service.predict(formula_crops)
+    """
+    def __init__(self, mfr_model, batch_size=None, max_wait=0.05, aspect_ratio_bins=(2, 4, 8), area_bins=(4096, 32768),
+                 name="formula_recognition"):
+        """
+        Args:
+            mfr_model: Formula recognition model, `recognize` takes a list of PIL.Image.Image crops and returns their latex.
+            batch_size (int): Maximum number of crops per batch, the batch_size of the model by default.
+            max_wait (float): Maximum time in seconds a bucket waits for more crops before it runs.
+            aspect_ratio_bins (tuple): Boundaries of the buckets of width / height of the crops.
+            area_bins (tuple): Boundaries of the buckets of area in pixels of the crops.
+        """
+        super().__init__(mfr_model.recognize, self.bucket, batch_size=batch_size or getattr(mfr_model, 'batch_size', 1),
+                         max_wait=max_wait, name=name)
+        self.aspect_ratio_bins = sorted(aspect_ratio_bins)
+        self.area_bins = sorted(area_bins)
+        self.bucket_stats = {}
+
+    def bucket(self, image):
+        """
+        Returns:
+            tuple: (aspect ratio bucket, area bucket) of a PIL.Image.Image crop.
+        """
+        width, height = image.size
+        return bisect_right(self.aspect_ratio_bins, width / max(height, 1)), bisect_right(self.area_bins, width * height)
+
+    def _on_batch(self, items, results, seconds):
+        super()._on_batch(items, results, seconds)
+        # the predicted latex are space separated tokens, cached formulas are counted too, failed crops (no latex) are not
+        num_tokens = sum(len(latex.split()) for latex in results if isinstance(latex, str))
+        key = self.bucket(items[0])
+        with self.stats_lock:
+            stats = self.bucket_stats.setdefault(key, {'batches': 0, 'items': 0, 'tokens': 0, 'seconds': 0.0})
+            stats['batches'] += 1
+            stats['items'] += len(items)
+            stats['tokens'] += num_tokens
+            stats['seconds'] += seconds
+
+    def stats(self):
+        """
+        Returns:
+            dict: Statistics of `BatchScheduler.stats`, the number of decoded tokens and tokens per second, and the same
+                statistics for each bucket in `buckets`, keyed by (aspect ratio bucket, area bucket).
+        """
+        stats = super().stats()
+        with self.stats_lock:
+            bucket_items = sorted((key, dict(bucket_stats)) for key, bucket_stats in self.bucket_stats.items())
+        buckets = {}
+        for key, bucket_stats in bucket_items:
+            bucket_stats['mean_batch_size'] = bucket_stats['items'] / bucket_stats['batches']
+            bucket_stats['mean_batch_latency'] = bucket_stats['seconds'] / bucket_stats['batches']
+            bucket_stats['tokens_per_sec'] = bucket_stats['tokens'] / bucket_stats['seconds'] if bucket_stats['seconds'] else 0.0
+            buckets[key] = bucket_stats
+        stats['tokens'] = sum(bucket_stats['tokens'] for bucket_stats in buckets.values())
+        stats['tokens_per_sec'] = stats['tokens'] / stats['seconds'] if stats['seconds'] else 0.0
+        stats['buckets'] = buckets
+        return stats
@@ -4,8 +4,8 @@ from pdf_extract_kit.tasks.base_task import BaseTask
 
 @TASK_REGISTRY.register("formula_recognition")
 class FormulaRecognitionTask(BaseTask):
-    def __init__(self, model):
-        super().__init__(model)
+    def __init__(self, model, pdf_config=None):
+        super().__init__(model, pdf_config)
 
     def predict(self, input_data, result_path, bboxes=None):
         images = self.load_images(input_data)
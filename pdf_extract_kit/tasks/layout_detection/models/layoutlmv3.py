@@ -5,6 +5,7 @@ from PIL import Image
 
 from pdf_extract_kit.registry.registry import MODEL_REGISTRY
 from pdf_extract_kit.utils.visualization import visualize_bbox
+from pdf_extract_kit.utils.page_image import PageImage
 
 from .layoutlmv3_util.model_init import Layoutlmv3_Predictor
 
@@ -32,29 +33,46 @@ class LayoutDetectionLayoutlmv3:
         }
         self.model = Layoutlmv3_Predictor(config.get('model_path', None))
         self.visualize = config.get('visualize', False)
+        self.batch_size = config.get('batch_size', 1)
 
     def predict(self, images, result_path, image_ids=None):
         """
         Predict layouts in images.
 
         Args:
-            images (list): List of images to be predicted.
+            images (list): List of images to be predicted, predicted in batches of batch_size.
             result_path (str): Path to save the prediction results.
             image_ids (list, optional): List of image IDs corresponding to the images.
 
         Returns:
             list: List of prediction results.
         """
-        if not os.path.exists(result_path):
+        if result_path and not os.path.exists(result_path):
             os.makedirs(result_path)
         
         results = []
-        for idx, im_file in enumerate(images):
-            if isinstance(im_file, Image.Image):
-                im = im_file.convert("RGB")  # extracted PDF pages
+        for start in range(0, len(images), self.batch_size):
+            results.extend(self.predict_batch(images[start:start + self.batch_size], result_path,
+                                              image_ids[start:start + self.batch_size] if image_ids else None))
+        return results
+
+    def predict_batch(self, images, result_path="", image_ids=None):
+        """
+        Predict layouts of a batch of images in one forward pass of the model, see `predict`.
+        """
+        ims = []
+        for im_file in images:
+            if isinstance(im_file, PageImage):
+                im = im_file.rgb  # extracted PDF pages, used without copy
+            elif isinstance(im_file, Image.Image):
+                im = np.array(im_file.convert("RGB"))  # extracted PDF pages
             elif isinstance(im_file, str):
-                im = Image.open(im_file).convert("RGB")  # image path
-            layout_res = self.model(np.array(im), ignore_catids=[])
+                im = np.array(Image.open(im_file).convert("RGB"))  # image path
+            ims.append(im)
+        batch_layout_res = self.model.predict_batch(ims, ignore_catids=[])
+
+        results = []
+        for idx, (im_file, layout_res) in enumerate(zip(images, batch_layout_res)):
             poly = np.array([det["poly"] for det in layout_res["layout_dets"]])
             boxes = poly[:, [0,1,4,5]] 
             scores = np.array([det["score"] for det in layout_res["layout_dets"]])
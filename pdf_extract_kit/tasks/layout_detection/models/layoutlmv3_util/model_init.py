@@ -1,3 +1,5 @@
+import torch
+
 from .visualizer import Visualizer
 from .rcnn_vl import *
 from .backbone import *
@@ -118,24 +120,44 @@ class Layoutlmv3_Predictor(object):
         self.predictor = DefaultPredictor(cfg)
         
     def __call__(self, image, ignore_catids=[]):
-        page_layout_result = {
-            "layout_dets": []
-        }
-        outputs = self.predictor(image)
-        boxes = outputs["instances"].to("cpu")._fields["pred_boxes"].tensor.tolist()
-        labels = outputs["instances"].to("cpu")._fields["pred_classes"].tolist()
-        scores = outputs["instances"].to("cpu")._fields["scores"].tolist()
-        for bbox_idx in range(len(boxes)):
-            if labels[bbox_idx] in ignore_catids:
-                continue
-            page_layout_result["layout_dets"].append({
-                "category_id": labels[bbox_idx],
-                "poly": [
-                    boxes[bbox_idx][0], boxes[bbox_idx][1],
-                    boxes[bbox_idx][2], boxes[bbox_idx][1],
-                    boxes[bbox_idx][2], boxes[bbox_idx][3],
-                    boxes[bbox_idx][0], boxes[bbox_idx][3],
-                ],
-                "score": scores[bbox_idx]
-            })
-        return page_layout_result
\ No newline at end of file
+        return self.predict_batch([image], ignore_catids)[0]
+
+    def predict_batch(self, images, ignore_catids=[]):
+        """
+        Same as DefaultPredictor.__call__, for a batch of images going through the model in one forward pass.
+        """
+        inputs = []
+        for original_image in images:
+            if self.predictor.input_format == "RGB":
+                # whether the model expects BGR inputs or RGB
+                original_image = original_image[:, :, ::-1]
+            height, width = original_image.shape[:2]
+            image = self.predictor.aug.get_transform(original_image).apply_image(original_image)
+            image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+            inputs.append({"image": image, "height": height, "width": width})
+        with torch.no_grad():
+            batch_outputs = self.predictor.model(inputs)
+
+        results = []
+        for outputs in batch_outputs:
+            page_layout_result = {
+                "layout_dets": []
+            }
+            boxes = outputs["instances"].to("cpu")._fields["pred_boxes"].tensor.tolist()
+            labels = outputs["instances"].to("cpu")._fields["pred_classes"].tolist()
+            scores = outputs["instances"].to("cpu")._fields["scores"].tolist()
+            for bbox_idx in range(len(boxes)):
+                if labels[bbox_idx] in ignore_catids:
+                    continue
+                page_layout_result["layout_dets"].append({
+                    "category_id": labels[bbox_idx],
+                    "poly": [
+                        boxes[bbox_idx][0], boxes[bbox_idx][1],
+                        boxes[bbox_idx][2], boxes[bbox_idx][1],
+                        boxes[bbox_idx][2], boxes[bbox_idx][3],
+                        boxes[bbox_idx][0], boxes[bbox_idx][3],
+                    ],
+                    "score": scores[bbox_idx]
+                })
+            results.append(page_layout_result)
+        return results
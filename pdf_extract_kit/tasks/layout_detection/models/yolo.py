@@ -3,7 +3,9 @@ import cv2
 import torch
 from pdf_extract_kit.registry import MODEL_REGISTRY
 from pdf_extract_kit.utils.visualization import visualize_bbox
-from pdf_extract_kit.dataset.dataset import ImageDataset
+from pdf_extract_kit.dataset.dataset import ImageDataset, bgr_tensor, build_dataloader
+from pdf_extract_kit.utils.page_image import PageImage, to_bgr
+from pdf_extract_kit.utils.cache import build_result_cache, hash_image, pack_yolo_result, unpack_yolo_result
 
 @MODEL_REGISTRY.register('layout_detection_yolo')
 class LayoutDetectionYOLO:
@@ -43,17 +45,57 @@ class LayoutDetectionYOLO:
         self.visualize = config.get('visualize', False)
         self.nc = config.get('nc', 10)
         self.workers = config.get('workers', 8)
+        self.batch_size = config.get('batch_size', 1)
+        # worker processes decoding the images of `predict` ahead of the model, used when there is more than one batch
+        self.num_workers = config.get('num_workers', 0)
+        self.prefetch_factor = config.get('prefetch_factor', 2)
+        # number of images to give `predict` at once so that the workers fill their prefetch_factor batches ahead
+        self.chunk_size = self.batch_size * self.num_workers * self.prefetch_factor if self.num_workers > 0 else self.batch_size
+        # Optional on-disk cache of the predictions, enabled by `cache_path`
+        self.cache = build_result_cache(config, 'layout_detection_yolo', config['model_path'],
+                                        img_size=self.img_size, conf_thres=self.conf_thres, iou_thres=self.iou_thres)
         
         if self.iou_thres > 0:
             import torchvision
             self.nms_func = torchvision.ops.nms
 
+    def predict_batch(self, images, arrays=None):
+        """
+        Run one forward pass of the model on a batch of images, cached images are not predicted again.
+
+        Args:
+            images (list): Images of the batch, image paths, PIL.Image.Image or PageImage.
+            arrays (list, optional): BGR arrays of the images, decoded ahead (see `predict`).
+
+        Returns:
+            list: Prediction result of each image, in input order.
+        """
+        results = [None] * len(images)
+        keys = [hash_image(image) if self.cache is not None else None for image in images]
+        todo = []
+        for idx, (image, key) in enumerate(zip(images, keys)):
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                results[idx] = unpack_yolo_result(cached, arrays[idx] if arrays is not None else to_bgr(image))
+            else:
+                todo.append(idx)
+        if todo:
+            # numpy inputs of the YOLO models are BGR, PageImage gives it without going through PIL
+            model_inputs = [arrays[idx] if arrays is not None else images[idx].bgr if isinstance(images[idx], PageImage) else images[idx]
+                            for idx in todo]
+            preds = self.model.predict(model_inputs, imgsz=self.img_size, conf=self.conf_thres, iou=self.iou_thres, verbose=False)
+            for idx, result in zip(todo, preds):
+                results[idx] = result
+                if self.cache is not None:
+                    self.cache.put(keys[idx], pack_yolo_result(result))
+        return results
+
     def predict(self, images, result_path, image_ids=None):
         """
         Predict formulas in images.
 
         Args:
-            images (list): List of images to be predicted.
+            images (list): List of images to be predicted, image paths, PIL.Image.Image or PageImage, predicted in batches of batch_size.
             result_path (str): Path to save the prediction results.
             image_ids (list, optional): List of image IDs corresponding to the images.
 
@@ -61,8 +103,18 @@ class LayoutDetectionYOLO:
             list: List of prediction results.
         """
         results = []
-        for idx, image in enumerate(images):
-            result = self.model.predict(image, imgsz=self.img_size, conf=self.conf_thres, iou=self.iou_thres, verbose=False)[0]
+        if self.num_workers > 0 and len(images) > self.batch_size:
+            # the images are decoded in DataLoader workers while the model runs on the previous batches
+            dataset = ImageDataset(images, image_ids=list(range(len(images))), transform=bgr_tensor)
+            dataloader = build_dataloader(dataset, batch_size=self.batch_size, num_workers=self.num_workers,
+                                          prefetch_factor=self.prefetch_factor, collate_fn=list)
+            for batch in dataloader:
+                results.extend(self.predict_batch([images[idx] for _, idx in batch], [tensor.numpy() for tensor, _ in batch]))
+        else:
+            # batches of batch_size images go through the model in one forward pass
+            for start in range(0, len(images), self.batch_size):
+                results.extend(self.predict_batch(images[start:start + self.batch_size]))
+        for idx, (image, result) in enumerate(zip(images, results)):
             if self.visualize:
                 if not os.path.exists(result_path):
                     os.makedirs(result_path)
@@ -91,5 +143,4 @@ class LayoutDetectionYOLO:
                 
                 # Save the visualized result                
                 cv2.imwrite(os.path.join(result_path, result_name), vis_result)
-            results.append(result)
         return results
\ No newline at end of file
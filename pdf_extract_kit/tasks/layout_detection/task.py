@@ -4,8 +4,8 @@ from pdf_extract_kit.tasks.base_task import BaseTask
 
 @TASK_REGISTRY.register("layout_detection")
 class LayoutDetectionTask(BaseTask):
-    def __init__(self, model):
-        super().__init__(model)
+    def __init__(self, model, pdf_config=None):
+        super().__init__(model, pdf_config)
 
     def predict_images(self, input_data, result_path):
         """
@@ -33,6 +33,17 @@ class LayoutDetectionTask(BaseTask):
         Returns:
             list: List of prediction results.
         """
-        pdf_images = self.load_pdf_images(input_data)
-        # Perform detection
-        return self.model.predict(list(pdf_images.values()), result_path, list(pdf_images.keys()))
\ No newline at end of file
+        results = []
+        # Perform detection in chunks of pages, pages are rendered lazily, a chunk holds several batches when the model
+        # decodes them in worker processes so that the workers run ahead of the model
+        chunk_size = getattr(self.model, 'chunk_size', getattr(self.model, 'batch_size', 1))
+        img_ids, images = [], []
+        for img_id, image in self.load_pdf_images(input_data):
+            img_ids.append(img_id)
+            images.append(image)
+            if len(images) >= chunk_size:
+                results.extend(self.model.predict(images, result_path, img_ids))
+                img_ids, images = [], []
+        if images:
+            results.extend(self.model.predict(images, result_path, img_ids))
+        return results
\ No newline at end of file
@@ -1,5 +1,7 @@
 import time
 import copy
+import threading
+import hashlib
 import logging
 import base64
 import cv2
@@ -12,6 +14,10 @@ from ppocr.utils.logging import get_logger
 from ppocr.utils.utility import check_and_read, alpha_to_color, binarize_img
 from tools.infer.utility import draw_ocr_box_txt, get_rotate_crop_image, get_minarea_rect_crop
 from pdf_extract_kit.registry import MODEL_REGISTRY
+from pdf_extract_kit.utils.page_image import PageImage
+from pdf_extract_kit.utils.cache import build_result_cache, hash_image
+from pdf_extract_kit.utils.geometry import (group_lines, merge_line_x_overlaps, pairwise_overlap_ratio, pairwise_y_overlap_ratio,
+                                            reading_order, subtract_x_intervals)
 logger = get_logger()
 
 def img_decode(content: bytes):
@@ -52,6 +58,8 @@ def check_img(img):
         img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
     if isinstance(img, Image.Image):
         img = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+    if isinstance(img, PageImage):
+        img = img.bgr
     return img
 
 def sorted_boxes(dt_boxes):
@@ -62,33 +70,9 @@ def sorted_boxes(dt_boxes):
     return:
         sorted boxes(array) with shape [4, 2]
     """
-    num_boxes = dt_boxes.shape[0]
-    sorted_boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
-    _boxes = list(sorted_boxes)
-
-    for i in range(num_boxes - 1):
-        for j in range(i, -1, -1):
-            if abs(_boxes[j + 1][0][1] - _boxes[j][0][1]) < 10 and \
-                    (_boxes[j + 1][0][0] < _boxes[j][0][0]):
-                tmp = _boxes[j]
-                _boxes[j] = _boxes[j + 1]
-                _boxes[j + 1] = tmp
-            else:
-                break
-    return _boxes
-
-
-def __is_overlaps_y_exceeds_threshold(bbox1, bbox2, overlap_ratio_threshold=0.8):
-    """Check if two bounding boxes overlap on the y-axis, and if the height of the overlapping region exceeds 80% of the height of the shorter bounding box."""
-    _, y0_1, _, y1_1 = bbox1
-    _, y0_2, _, y1_2 = bbox2
-
-    overlap = max(0, min(y1_1, y1_2) - max(y0_1, y0_2))
-    height1, height2 = y1_1 - y0_1, y1_2 - y0_2
-    max_height = max(height1, height2)
-    min_height = min(height1, height2)
-
-    return (overlap / min_height) > overlap_ratio_threshold
+    if dt_boxes.shape[0] == 0:
+        return []
+    return list(dt_boxes[reading_order(dt_boxes[:, 0, 0], dt_boxes[:, 0, 1])])
 
 
 def bbox_to_points(bbox):
@@ -105,146 +89,31 @@ def points_to_bbox(points):
     return [x0, y0, x1, y1]
 
 
-def merge_intervals(intervals):
-    # Sort the intervals based on the start value
-    intervals.sort(key=lambda x: x[0])
-
-    merged = []
-    for interval in intervals:
-        # If the list of merged intervals is empty or if the current
-        # interval does not overlap with the previous, simply append it.
-        if not merged or merged[-1][1] < interval[0]:
-            merged.append(interval)
-        else:
-            # Otherwise, there is overlap, so we merge the current and previous intervals.
-            merged[-1][1] = max(merged[-1][1], interval[1])
-
-    return merged
-
-
-def remove_intervals(original, masks):
-    # Merge all mask intervals
-    merged_masks = merge_intervals(masks)
-
-    result = []
-    original_start, original_end = original
-
-    for mask in merged_masks:
-        mask_start, mask_end = mask
-
-        # If the mask starts after the original range, ignore it
-        if mask_start > original_end:
-            continue
-
-        # If the mask ends before the original range starts, ignore it
-        if mask_end < original_start:
-            continue
-
-        # Remove the masked part from the original range
-        if original_start < mask_start:
-            result.append([original_start, mask_start - 1])
-
-        original_start = max(mask_end + 1, original_start)
-
-    # Add the remaining part of the original range, if any
-    if original_start <= original_end:
-        result.append([original_start, original_end])
-
-    return result
-
-
 def update_det_boxes(dt_boxes, mfd_res):
-    new_dt_boxes = []
-    for text_box in dt_boxes:
-        text_bbox = points_to_bbox(text_box)
-        masks_list = []
-        for mf_box in mfd_res:
-            mf_bbox = mf_box['bbox']
-            if __is_overlaps_y_exceeds_threshold(text_bbox, mf_bbox):
-                masks_list.append([mf_bbox[0], mf_bbox[2]])
-        text_x_range = [text_bbox[0], text_bbox[2]]
-        text_remove_mask_range = remove_intervals(text_x_range, masks_list)
-        temp_dt_box = []
-        for text_remove_mask in text_remove_mask_range:
-            temp_dt_box.append(bbox_to_points([text_remove_mask[0], text_bbox[1], text_remove_mask[1], text_bbox[3]]))
-        if len(temp_dt_box) > 0:
-            new_dt_boxes.extend(temp_dt_box)
-    return new_dt_boxes
-
-
-def merge_spans_to_line(spans):
     """
-    Merge given spans into lines. Spans are considered based on their position in the document.
-    If spans overlap sufficiently on the Y-axis, they are merged into the same line; otherwise, a new line is started.
+    Remove the formulas from the text boxes.
+
+    A formula overlapping a text box on more than 80% of the smaller of their heights removes its x range from the
+    box, which is split into the pieces between the formulas. All the boxes are split against all the formulas at
+    once, see `subtract_x_intervals`.
 
     Parameters:
-    spans (list): A list of spans, where each span is a dictionary containing at least the key 'bbox',
-                  which itself is a list of four integers representing the bounding box:
-                  [x0, y0, x1, y1], where (x0, y0) is the top-left corner and (x1, y1) is the bottom-right corner.
+    dt_boxes (list): Text boxes, each defined by four corner points.
+    mfd_res (list): {'bbox': [xmin, ymin, xmax, ymax]} of the formulas.
 
     Returns:
-    list: A list of lines, where each line is a list of spans.
-    """
-    # Return an empty list if the spans list is empty
-    if len(spans) == 0:
-        return []
-    else:
-        # Sort spans by the Y0 coordinate
-        spans.sort(key=lambda span: span['bbox'][1])
-
-        lines = []
-        current_line = [spans[0]]
-        for span in spans[1:]:
-            # If the current span overlaps with the last span in the current line on the Y-axis, add it to the current line
-            if __is_overlaps_y_exceeds_threshold(span['bbox'], current_line[-1]['bbox']):
-                current_line.append(span)
-            else:
-                # Otherwise, start a new line
-                lines.append(current_line)
-                current_line = [span]
-
-        # Add the last line if it exists
-        if current_line:
-            lines.append(current_line)
-
-        return lines
-
-
-def merge_overlapping_spans(spans):
-    """
-    Merges overlapping spans on the same line.
-
-    :param spans: A list of span coordinates [(x1, y1, x2, y2), ...]
-    :return: A list of merged spans
+    list: The pieces of the text boxes, box by box from left to right, each represented by four corner points.
     """
-    # Return an empty list if the input spans list is empty
-    if not spans:
+    if len(dt_boxes) == 0:
         return []
-
-    # Sort spans by their starting x-coordinate
-    spans.sort(key=lambda x: x[0])
-
-    # Initialize the list of merged spans
-    merged = []
-    for span in spans:
-        # Unpack span coordinates
-        x1, y1, x2, y2 = span
-        # If the merged list is empty or there's no horizontal overlap, add the span directly
-        if not merged or merged[-1][2] < x1:
-            merged.append(span)
-        else:
-            # If there is horizontal overlap, merge the current span with the previous one
-            last_span = merged.pop()
-            # Update the merged span's top-left corner to the smaller (x1, y1) and bottom-right to the larger (x2, y2)
-            x1 = min(last_span[0], x1)
-            y1 = min(last_span[1], y1)
-            x2 = max(last_span[2], x2)
-            y2 = max(last_span[3], y2)
-            # Add the merged span back to the list
-            merged.append((x1, y1, x2, y2))
-
-    # Return the list of merged spans
-    return merged
+    points = np.asarray(dt_boxes)
+    text_bboxes = np.stack([points[:, 0, 0], points[:, 0, 1], points[:, 1, 0], points[:, 2, 1]], axis=1)
+    # computed in the dtype of the text boxes (float32), as the python numbers of the formula bboxes were
+    mf_bboxes = np.asarray([mf_box['bbox'] for mf_box in mfd_res], dtype=text_bboxes.dtype).reshape(-1, 4)
+    masked = pairwise_y_overlap_ratio(text_bboxes, mf_bboxes) > 0.8
+    pieces, _ = subtract_x_intervals(text_bboxes, mf_bboxes, masked)
+    x0, y0, x1, y1 = pieces.T
+    return list(np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1), np.stack([x1, y1], 1), np.stack([x0, y1], 1)], 1).astype('float32'))
 
 
 def merge_det_boxes(dt_boxes):
@@ -252,7 +121,8 @@ def merge_det_boxes(dt_boxes):
     Merge detection boxes.
 
     This function takes a list of detected bounding boxes, each represented by four corner points.
-    The goal is to merge these bounding boxes into larger text regions.
+    The goal is to merge these bounding boxes into larger text regions: boxes overlapping enough on the Y-axis
+    are grouped into lines, and the boxes of a line overlapping on the X-axis are merged.
 
     Parameters:
     dt_boxes (list): A list containing multiple text detection boxes, where each box is defined by four corner points.
@@ -260,39 +130,34 @@ def merge_det_boxes(dt_boxes):
     Returns:
     list: A list containing the merged text regions, where each region is represented by four corner points.
     """
-    # Convert the detection boxes into a dictionary format with bounding boxes and type
-    dt_boxes_dict_list = []
-    for text_box in dt_boxes:
-        text_bbox = points_to_bbox(text_box)
-        text_box_dict = {
-            'bbox': text_bbox,
-        }
-        dt_boxes_dict_list.append(text_box_dict)
-
-    # Merge adjacent text regions into lines
-    lines = merge_spans_to_line(dt_boxes_dict_list)
-
-    # Initialize a new list for storing the merged text regions
-    new_dt_boxes = []
-    for line in lines:
-        line_bbox_list = []
-        for span in line:
-            line_bbox_list.append(span['bbox'])
-
-        # Merge overlapping text regions within the same line
-        merged_spans = merge_overlapping_spans(line_bbox_list)
-
-        # Convert the merged text regions back to point format and add them to the new detection box list
-        for span in merged_spans:
-            new_dt_boxes.append(bbox_to_points(span))
-
-    return new_dt_boxes
+    if len(dt_boxes) == 0:
+        return []
+    # Convert the detection boxes into bounding boxes, see points_to_bbox
+    points = np.asarray(dt_boxes)
+    text_bboxes = np.stack([points[:, 0, 0], points[:, 0, 1], points[:, 1, 0], points[:, 2, 1]], axis=1)
+
+    # Merge adjacent text regions into lines, then the overlapping text regions within the same line
+    lines = group_lines(text_bboxes)
+    merged_spans = merge_line_x_overlaps(text_bboxes, lines)
+
+    # Convert the merged text regions back to point format
+    return [bbox_to_points(span) for span in merged_spans]
 
 @MODEL_REGISTRY.register('ocr_ppocr')
 class ModifiedPaddleOCR(PaddleOCR):
     def __init__(self, config):
+        config = dict(config)
+        cache_config = {key: config.pop(key) for key in ('cache_path', 'cache_max_size') if key in config}
         super().__init__(**config)
-        
+        # Optional on-disk cache of the ocr results, enabled by `cache_path`, the model directories
+        # and the remaining options identify the models.
+        self.cache = build_result_cache(cache_config, 'ocr_ppocr', **config)
+        # throughput of the text recognition, see `rec_stats`
+        self.rec_lock = threading.Lock()
+        self.rec_lines = 0
+        self.rec_batches = 0
+        self.rec_time = 0.0
+
     def predict(self, img, **kwargs):
         ppocr_res = self.ocr(img, **kwargs)[0]
         ocr_res = []
@@ -306,12 +171,185 @@ class ModifiedPaddleOCR(PaddleOCR):
                 'text': text,
             })
         return ocr_res
-        
+
+    def ocr_batch(self, imgs, cls=True, mfd_res=None, **kwargs):
+        """
+        Detection and recognition of a batch of images, e.g. the crops of the text blocks of a page
+        args：
+            imgs: list of BGR ndarray (see `pdf_extract_kit.utils.crop.CropPool`), used as is, or any input of `ocr`
+            mfd_res: list, formula boxes of each image, in its coordinates
+            kwargs: other options of `ocr`
+        return：
+            list, the ocr result of each image (`ocr(img)[0]`), None for an image without text
+        """
+        if mfd_res is None:
+            mfd_res = [None] * len(imgs)
+        return [self.ocr(img, cls=cls, mfd_res=img_mfd_res, **kwargs)[0] for img, img_mfd_res in zip(imgs, mfd_res)]
+
+    def ocr_page(self, img, blocks, cls=True, mfd_res=None, alpha_color=(255, 255, 255)):
+        """
+        OCR of the text blocks of a page, with a single text detection on the whole page
+        args：
+            img: the page, ndarray (BGR), PIL.Image.Image or PageImage
+            blocks: list of [xmin, ymin, xmax, ymax], the text blocks, see `detect_page_lines`
+            cls: use angle classifier or not, see `ocr`
+            mfd_res: list of {'bbox': [xmin, ymin, xmax, ymax]}, formulas of the page, removed from the lines
+        return：
+            list, the ocr result of each block in page coordinates, same format as `ocr(img)[0]`, None for a block without text
+        """
+        if cls == True and self.use_angle_cls == False:
+            logger.warning(
+                'Since the angle classifier is not initialized, it will not be used during the forward process'
+            )
+        cache_key = None
+        if self.cache is not None:
+            img_hash = hash_image(img)
+            if img_hash is not None:
+                cache_key = hashlib.blake2b(repr(('page', img_hash, blocks, cls, mfd_res, alpha_color)).encode(),
+                                            digest_size=20).hexdigest()
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+        line_boxes, line_blocks, img_crop_list = self.detect_page_lines(img, blocks, mfd_res=mfd_res, alpha_color=alpha_color)
+        # the lines of all the blocks are recognized together
+        rec_res = self.recognize_lines(img_crop_list, cls=cls)
+        ocr_res = [[] for _ in blocks]
+        for box, block_idx, rec_result in zip(line_boxes, line_blocks, rec_res):
+            text, score = rec_result
+            if score >= self.drop_score:
+                ocr_res[block_idx].append([box.tolist(), rec_result])
+        ocr_res = [block_res or None for block_res in ocr_res]
+        if cache_key is not None:
+            self.cache.put(cache_key, ocr_res)
+        return ocr_res
+
+    def detect_page_lines(self, img, blocks, mfd_res=None, alpha_color=(255, 255, 255)):
+        """
+        Text detection on a whole page, the lines are assigned to the text blocks of the page
+        args：
+            img: the page, ndarray (BGR), PIL.Image.Image or PageImage
+            blocks: list of [xmin, ymin, xmax, ymax], the text blocks; a detected line belongs to the block holding
+                most of its area, the lines outside of the blocks are dropped
+            mfd_res: list of {'bbox': [xmin, ymin, xmax, ymax]}, formulas of the page, removed from the lines
+        return：
+            (line boxes (4 points, page coordinates), index of the block of each line, crops of the lines for `recognize_lines`)
+        """
+        img = alpha_to_color(check_img(img), alpha_color)
+        ori_im = img.copy()
+        dt_boxes, elapse = self.text_detector(img)
+        logger.debug("page dt_boxes num : {}, elapsed : {}".format(0 if dt_boxes is None else len(dt_boxes), elapse))
+
+        # assign the detected lines to the blocks
+        block_boxes = [[] for _ in blocks]
+        if dt_boxes is not None and len(dt_boxes) > 0 and len(blocks) > 0:
+            dt_boxes = sorted_boxes(dt_boxes)
+            points = np.asarray(dt_boxes)
+            line_bboxes = np.concatenate([points.min(axis=1), points.max(axis=1)], axis=1)
+            overlap_ratios = pairwise_overlap_ratio(line_bboxes, np.asarray(blocks, dtype=np.float64))
+            owners = overlap_ratios.argmax(axis=1)
+            for idx in np.flatnonzero(overlap_ratios[np.arange(len(owners)), owners] > 0.5):
+                block_boxes[owners[idx]].append(dt_boxes[idx])
+
+        # merge the lines of each block and remove the formulas from them, in page coordinates
+        mf_bboxes = np.asarray([mf_res['bbox'] for mf_res in mfd_res or []], dtype=np.float64).reshape(-1, 4)
+        line_boxes, line_blocks = [], []
+        for block_idx, boxes in enumerate(block_boxes):
+            if not boxes:
+                continue
+            boxes = merge_det_boxes(boxes)
+            if len(mf_bboxes):
+                # only the formulas touching the lines can split them
+                lines_bbox = np.concatenate([np.min(boxes, axis=(0, 1)), np.max(boxes, axis=(0, 1))])
+                touching = (mf_bboxes[:, 0] <= lines_bbox[2]) & (mf_bboxes[:, 2] >= lines_bbox[0]) & \
+                           (mf_bboxes[:, 1] <= lines_bbox[3]) & (mf_bboxes[:, 3] >= lines_bbox[1])
+                if touching.any():
+                    boxes = update_det_boxes(boxes, [mfd_res[idx] for idx in np.flatnonzero(touching)])
+            line_boxes.extend(boxes)
+            line_blocks.extend([block_idx] * len(boxes))
+        return line_boxes, line_blocks, self.crop_lines(ori_im, line_boxes)
+
+    def detect_lines(self, img, mfd_res=None, alpha_color=(255, 255, 255)):
+        """
+        Text detection of an image, e.g. the crop of a text block, the lines are recognized later by `recognize_lines`
+        args：
+            img: img for OCR, see `ocr`
+            mfd_res: list of {'bbox': [xmin, ymin, xmax, ymax]}, formulas in the image coordinates, removed from the lines
+        return：
+            (line boxes (4 points), crops of the lines)
+        """
+        img = alpha_to_color(check_img(img), alpha_color)
+        ori_im = img.copy()
+        dt_boxes, elapse = self.text_detector(img)
+        if dt_boxes is None:
+            return [], []
+        dt_boxes = merge_det_boxes(sorted_boxes(dt_boxes))
+        if mfd_res:
+            dt_boxes = update_det_boxes(dt_boxes, mfd_res)
+        return dt_boxes, self.crop_lines(ori_im, dt_boxes)
+
+    def crop_lines(self, ori_im, dt_boxes):
+        img_crop_list = []
+        for box in dt_boxes:
+            tmp_box = copy.deepcopy(box)
+            if self.args.det_box_type == "quad":
+                img_crop_list.append(get_rotate_crop_image(ori_im, tmp_box))
+            else:
+                img_crop_list.append(get_minarea_rect_crop(ori_im, tmp_box))
+        return img_crop_list
+
+    def recognize_lines(self, img_crop_list, cls=True):
+        """
+        Recognition of text line crops, from any number of blocks and pages
+        The crops are sorted by aspect ratio, so that the lines of a batch are padded to similar widths, and
+        recognized in batches of rec_batch_num lines.
+        args：
+            img_crop_list: list of line crops, see `detect_lines` and `detect_page_lines`
+            cls: use angle classifier or not, see `ocr`
+        return：
+            list, (text, score) of each crop, in input order
+        """
+        if not img_crop_list:
+            return []
+        start = time.time()
+        order = np.argsort([crop.shape[1] / max(crop.shape[0], 1) for crop in img_crop_list], kind='stable')
+        batch_size = max(self.args.rec_batch_num, 1)
+        rec_res = [None] * len(img_crop_list)
+        for batch_start in range(0, len(order), batch_size):
+            batch_idx = order[batch_start:batch_start + batch_size]
+            batch = [img_crop_list[idx] for idx in batch_idx]
+            if self.use_angle_cls and cls:
+                batch, angle_list, elapse = self.text_classifier(batch)
+            batch_res, elapse = self.text_recognizer(batch)
+            for idx, res in zip(batch_idx, batch_res):
+                rec_res[idx] = res
+        self.add_rec_stats(len(img_crop_list), (len(img_crop_list) + batch_size - 1) // batch_size, time.time() - start)
+        return rec_res
+
+    def add_rec_stats(self, num_lines, num_batches, elapse):
+        with self.rec_lock:
+            self.rec_lines += num_lines
+            self.rec_batches += num_batches
+            self.rec_time += elapse
+
+    def rec_stats(self):
+        """
+        return：
+            dict, number of lines and batches recognized, time spent in recognition (seconds) and lines per second
+        """
+        with self.rec_lock:
+            return {
+                'lines': self.rec_lines,
+                'batches': self.rec_batches,
+                'seconds': self.rec_time,
+                'lines_per_sec': self.rec_lines / self.rec_time if self.rec_time > 0 else 0.0,
+            }
+
     def ocr(self, img, det=True, rec=True, cls=True, bin=False, inv=False, mfd_res=None, alpha_color=(255, 255, 255)):
         """
         OCR with PaddleOCR
         args：
-            img: img for OCR, support ndarray, img_path and list or ndarray
+            img: img for OCR, support ndarray, img_path, PIL.Image.Image, PageImage and list or ndarray
             det: use text detection or not. If False, only rec will be exec. Default is True
             rec: use text recognition or not. If False, only det will be exec. Default is True
             cls: use angle classifier or not. Default is True. If True, the text with rotation of 180 degrees can be recognized. If no text is rotated by 180 degrees, use cls=False to get better performance. Text with rotation of 90 or 270 degrees can be recognized even if cls=False.
@@ -319,7 +357,7 @@ class ModifiedPaddleOCR(PaddleOCR):
             inv: invert image colors. Default is False.
             alpha_color: set RGB color Tuple for transparent parts replacement. Default is pure white.
         """
-        assert isinstance(img, (np.ndarray, list, str, bytes, Image.Image))
+        assert isinstance(img, (np.ndarray, list, str, bytes, Image.Image, PageImage))
         if isinstance(img, list) and det == True:
             logger.error('When input a list of images, det must be false')
             exit(0)
@@ -328,6 +366,17 @@ class ModifiedPaddleOCR(PaddleOCR):
                 'Since the angle classifier is not initialized, it will not be used during the forward process'
             )
 
+        # detection + recognition results of single images are cached, keyed by the image and the options
+        cache_key = None
+        if self.cache is not None and det and rec and not isinstance(img, list):
+            img_hash = hash_image(img)
+            if img_hash is not None:
+                cache_key = hashlib.blake2b(repr((img_hash, cls, bin, inv, mfd_res, alpha_color)).encode(),
+                                            digest_size=20).hexdigest()
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
         img = check_img(img)
         # for infer pdf file
         if isinstance(img, list):
@@ -356,6 +405,8 @@ class ModifiedPaddleOCR(PaddleOCR):
                 tmp_res = [[box.tolist(), res]
                            for box, res in zip(dt_boxes, rec_res)]
                 ocr_res.append(tmp_res)
+            if cache_key is not None:
+                self.cache.put(cache_key, ocr_res)
             return ocr_res
         elif det and not rec:
             ocr_res = []
@@ -434,6 +485,8 @@ class ModifiedPaddleOCR(PaddleOCR):
 
         rec_res, elapse = self.text_recognizer(img_crop_list)
         time_dict['rec'] = elapse
+        batch_size = max(self.args.rec_batch_num, 1)
+        self.add_rec_stats(len(img_crop_list), (len(img_crop_list) + batch_size - 1) // batch_size, elapse)
         logger.debug("rec_res num  : {}, elapsed : {}".format(
             len(rec_res), elapse))
         if self.args.save_crop_res:
@@ -1,21 +1,23 @@
 import os
-import json
 import random
 from PIL import Image, ImageDraw
 from pdf_extract_kit.registry.registry import TASK_REGISTRY
-from pdf_extract_kit.utils.data_preprocess import load_pdf
+from pdf_extract_kit.utils.data_preprocess import open_pdf
+from pdf_extract_kit.utils.manifest import atomic_write
+from pdf_extract_kit.utils.page_result import PageResult, LayoutDets, dumps_json
 from pdf_extract_kit.tasks.base_task import BaseTask
 
 
 @TASK_REGISTRY.register("ocr")
 class OCRTask(BaseTask):
-    def __init__(self, model):
+    def __init__(self, model, pdf_config=None):
         """init the task based on the given model.
         
         Args:
             model: task model, must contains predict function.
+            pdf_config: dict, options of the PDF page source (dpi, num_workers, prefetch), optional.
         """
-        super().__init__(model)
+        super().__init__(model, pdf_config)
 
     def predict_image(self, image):
         """predict on one image, reture text detection and recognition results.
@@ -61,16 +63,16 @@ class OCRTask(BaseTask):
         for fpath in file_list:
             basename = os.path.basename(fpath)[:-4]
             if fpath.endswith(".pdf") or fpath.endswith(".PDF"):
-                images = load_pdf(pdf_path)
                 pdf_res = []
-                for page, img in enumerate(images):
-                    page_res = self.predict_image(img)
-                    pdf_res.append(page_res)
-                    if save_dir:
-                        os.makedirs(os.path.join(save_dir, basename), exist_ok=True)
-                        self.save_json_result(page_res, os.path.join(save_dir, basename, f"page_{page+1}.json"))
-                        if visualize:
-                            self.visualize_image(img, page_res, os.path.join(save_dir, basename, f"page_{page+1}.jpg"))
+                with open_pdf(fpath, **self.pdf_config) as images:
+                    for page, img in enumerate(images):
+                        page_res = self.predict_image(img)
+                        pdf_res.append(page_res)
+                        if save_dir:
+                            os.makedirs(os.path.join(save_dir, basename), exist_ok=True)
+                            self.save_json_result(page_res, os.path.join(save_dir, basename, f"page_{page+1}.json"))
+                            if visualize:
+                                self.visualize_image(img, page_res, os.path.join(save_dir, basename, f"page_{page+1}.jpg"))
                         
                 res_list.append(pdf_res)
             else:
@@ -90,16 +92,21 @@ class OCRTask(BaseTask):
         
         Args:
             image: PIL.Image.Image
-            ocr_res: list of ocr det and rec, whose format following the results of self.predict_image function
+            ocr_res: list of ocr det and rec, whose format following the results of self.predict_image function,
+                or a PageResult (or its layout_dets), whose columns are read directly
             save_path: path to save visualized image
         """
         draw = ImageDraw.Draw(image)
-        for res in ocr_res:
-            box_color = cate2color.get(res['category_type'], (0, 255, 0))
-            x_min, y_min = int(res['poly'][0]), int(res['poly'][1])
-            x_max, y_max = int(res['poly'][4]), int(res['poly'][5])
+        if isinstance(ocr_res, LayoutDets):
+            ocr_res = ocr_res.page_result
+        if isinstance(ocr_res, PageResult):
+            boxes = zip(ocr_res.category_names().tolist(), ocr_res.bboxes().astype(int).tolist())
+        else:
+            boxes = ((res['category_type'], [int(res['poly'][idx]) for idx in (0, 1, 4, 5)]) for res in ocr_res)
+        for category_type, (x_min, y_min, x_max, y_max) in boxes:
+            box_color = cate2color.get(category_type, (0, 255, 0))
             draw.rectangle([x_min, y_min, x_max, y_max], fill=None, outline=box_color, width=1)
-            draw.text((x_min, y_min), res['category_type'], (255, 0, 0))
+            draw.text((x_min, y_min), category_type, (255, 0, 0))
         if save_path:
             image.save(save_path)
         
@@ -107,10 +114,10 @@ class OCRTask(BaseTask):
         """save results to a json file.
         
         Args:
-            ocr_res: list of ocr det and rec, whose format following the results of self.predict_image function
+            ocr_res: list of ocr det and rec, whose format following the results of self.predict_image function,
+                or list of page results (dict or PageResult)
             save_path: path to save visualized image
         """
-        with open(save_path, "w", encoding="utf-8") as f:
-            f.write(json.dumps(ocr_res, indent=2, ensure_ascii=False))
+        atomic_write(save_path, dumps_json(ocr_res, indent=2))
         
         
@@ -0,0 +1,213 @@
+import time
+import queue
+import threading
+import traceback
+from concurrent.futures import Future
+
+
+class BatchScheduler:
+    """
+    Dynamic batching of the calls to a model.
+
+    Callers (e.g. the pages of several documents processed concurrently) submit single inputs and get
+    a future. A scheduler thread groups the pending inputs into batches of up to `batch_size` inputs,
+    waiting at most `max_wait` seconds after the first input of a batch for the batch to fill, runs the
+    model once per batch and sets the result of each future.
+
+    Example:
+        >>> scheduler = BatchScheduler(lambda images: layout_model.predict(images, ""), batch_size=8)
+        >>> futures = [scheduler.submit(image) for image in images]
+        >>> results = [future.result() for future in futures]
+    """
+    _STOP = object()
+
+    def __init__(self, predict_fn, batch_size=8, max_wait=0.05, name="batch_scheduler"):
+        """
+        Args:
+            predict_fn (callable): Takes a list of inputs, returns the list of their results in the same order. The futures
+                of a batch get the exception of predict_fn, or a ValueError if it returns a different number of results.
+            batch_size (int): Maximum number of inputs per call of predict_fn.
+            max_wait (float): Maximum time in seconds a batch waits for more inputs before it runs.
+            name (str): Name of the scheduler thread.
+        """
+        self.predict_fn = predict_fn
+        self.batch_size = max(batch_size, 1)
+        self.max_wait = max_wait
+        self.name = name
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        # statistics are updated by the scheduler thread and read by any thread (self.lock is held by close while it joins the thread)
+        self.stats_lock = threading.Lock()
+        self.num_batches = 0
+        self.num_items = 0
+        self.busy_time = 0.0
+        self.max_batch_time = 0.0
+
+    def submit(self, item):
+        """
+        Queue one input.
+
+        Returns:
+            concurrent.futures.Future: Future of the result of the input.
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def predict(self, items):
+        """Submit the inputs and wait for their results, in input order."""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _next_batch(self):
+        item = self.queue.get()
+        if item is self._STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                # run what is pending, stop afterwards
+                self.queue.put(self._STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            items = [item for item, _ in batch]
+            start = time.perf_counter()
+            try:
+                results = list(self.predict_fn(items))
+                if len(results) != len(items):
+                    raise ValueError(f"{self.name}: predict_fn returned {len(results)} results for a batch of {len(items)} inputs")
+            except Exception as e:
+                for _, future in batch:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                continue
+            try:
+                self._on_batch(items, results, time.perf_counter() - start)
+            except Exception:
+                # the statistics of a batch must not stop the scheduler thread, the results are still set
+                traceback.print_exc()
+            for (_, future), result in zip(batch, results):
+                if not future.cancelled():
+                    future.set_result(result)
+
+    def _on_batch(self, items, results, seconds):
+        """called by the scheduler thread after each batch, with its run time in seconds."""
+        with self.stats_lock:
+            self.num_batches += 1
+            self.num_items += len(items)
+            self.busy_time += seconds
+            self.max_batch_time = max(self.max_batch_time, seconds)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of batches and inputs processed, the mean batch size, the time spent in predict_fn and the
+                mean and maximum latency of a batch in seconds.
+        """
+        with self.stats_lock:
+            num_batches, num_items, busy_time, max_batch_time = self.num_batches, self.num_items, self.busy_time, self.max_batch_time
+        return {
+            'batches': num_batches,
+            'items': num_items,
+            'mean_batch_size': num_items / num_batches if num_batches else 0.0,
+            'seconds': busy_time,
+            'mean_batch_latency': busy_time / num_batches if num_batches else 0.0,
+            'max_batch_latency': max_batch_time,
+        }
+
+    def close(self):
+        """Run the pending inputs and stop the scheduler thread."""
+        with self.lock:
+            if self.thread is not None:
+                self.queue.put(self._STOP)
+                self.thread.join()
+                self.thread = None
+
+
+class BucketBatchScheduler(BatchScheduler):
+    """
+    Dynamic batching of the calls to a model, each batch only holds inputs of the same bucket.
+
+    Inputs whose cost depends on their shape (e.g. the decoding length of a formula follows the width of its crop)
+    are grouped with inputs of the same `bucket_fn(input)` key, so that a batch is not held back by its longest input.
+    A bucket runs as soon as it holds `batch_size` inputs, or `max_wait` seconds after its first pending input.
+
+    Example:
+        >>> scheduler = BucketBatchScheduler(model.recognize, lambda image: image.size[0] // 256, batch_size=64)
+        >>> latex = scheduler.predict(formula_crops)
+    """
+    def __init__(self, predict_fn, bucket_fn, batch_size=8, max_wait=0.05, name="bucket_batch_scheduler"):
+        """
+        Args:
+            bucket_fn (callable): Takes an input, returns the hashable key of its bucket.
+            See `BatchScheduler` for the other arguments.
+        """
+        super().__init__(predict_fn, batch_size=batch_size, max_wait=max_wait, name=name)
+        self.bucket_fn = bucket_fn
+        self.pending = {}
+        self.deadlines = {}
+        self.stopping = False
+
+    def _add(self, item):
+        try:
+            key = self.bucket_fn(item[0])
+        except Exception as e:
+            item[1].set_exception(e)
+            return
+        if key not in self.pending:
+            self.pending[key] = []
+            self.deadlines[key] = time.monotonic() + self.max_wait
+        self.pending[key].append(item)
+
+    def _pop(self, key):
+        batch = self.pending[key][:self.batch_size]
+        del self.pending[key][:self.batch_size]
+        if self.pending[key]:
+            # the rest of a full bucket runs next
+            self.deadlines[key] = time.monotonic()
+        else:
+            del self.pending[key], self.deadlines[key]
+        return batch
+
+    def _next_batch(self):
+        while True:
+            for key, batch in self.pending.items():
+                if len(batch) >= self.batch_size:
+                    return self._pop(key)
+            if self.stopping:
+                # run what is pending, stop afterwards
+                if self.pending:
+                    return self._pop(next(iter(self.pending)))
+                self.stopping = False
+                return None
+            try:
+                if not self.pending:
+                    item = self.queue.get()
+                else:
+                    key = min(self.deadlines, key=self.deadlines.get)
+                    timeout = self.deadlines[key] - time.monotonic()
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                return self._pop(key)
+            if item is self._STOP:
+                self.stopping = True
+            else:
+                self._add(item)
@@ -0,0 +1,465 @@
+import os
+import time
+import atexit
+import pickle
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+from PIL import Image
+
+from pdf_extract_kit.utils.page_image import PageImage
+
+
+def hash_image(image):
+    """
+    Hash the content of an image.
+
+    Args:
+        image: Image path, PIL.Image.Image, PageImage or np.ndarray.
+
+    Returns:
+        str or None: Hex digest of the content, None for unsupported inputs.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    if isinstance(image, str):
+        with open(image, 'rb') as f:
+            hasher.update(f.read())
+        return hasher.hexdigest()
+    if isinstance(image, PageImage):
+        array = image.rgb
+    elif isinstance(image, Image.Image):
+        array = np.asarray(image.convert('RGB'))
+    elif isinstance(image, np.ndarray):
+        array = image
+    else:
+        return None
+    hasher.update(str(array.shape).encode())
+    hasher.update(np.ascontiguousarray(array).data)
+    return hasher.hexdigest()
+
+
+def model_signature(model_name, weights_path=None, **params):
+    """
+    Identify a model configuration: name, weights file (path, size and modification time) and parameters.
+
+    Returns:
+        str: Hex digest of the model configuration.
+    """
+    weights = None
+    if weights_path and os.path.exists(weights_path):
+        stat = os.stat(weights_path)
+        weights = (os.path.abspath(weights_path), stat.st_size, stat.st_mtime)
+    signature = repr((model_name, weights, sorted(params.items())))
+    return hashlib.blake2b(signature.encode(), digest_size=20).hexdigest()
+
+
+class _ResultDatabase:
+    """
+    SQLite database of the result caches of one path in this process.
+
+    The caches of the same path (e.g. one per model) share its connection and lock, the running total size of the
+    stored results (read once at open, updated on each insert and delete) and the pending updates of the last access
+    time of the hits, which are written in one transaction every `flush_every` hits, before an eviction and on close.
+    The results written by other processes are counted when the database is opened.
+    """
+    _databases = {}
+    _databases_lock = threading.Lock()
+
+    def __init__(self, path, flush_every=256):
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.num_caches = 0
+        self.pending_access = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_access REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)")
+        self.total_size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        atexit.register(self.flush_at_exit)
+
+    @classmethod
+    def open(cls, path):
+        with cls._databases_lock:
+            database = cls._databases.get(os.path.abspath(path))
+            if database is None:
+                database = cls._databases[os.path.abspath(path)] = cls(path)
+            database.num_caches += 1
+        return database
+
+    def release(self):
+        with self._databases_lock:
+            self.num_caches -= 1
+            if self.num_caches > 0:
+                return
+            del self._databases[os.path.abspath(self.path)]
+        with self.lock:
+            self.flush_access()
+            self.conn.close()
+
+    def flush_at_exit(self):
+        with self.lock:
+            self.flush_access()
+
+    def touch(self, key):
+        """Record a hit on key, the lock is held."""
+        self.pending_access[key] = time.time()
+        if len(self.pending_access) >= self.flush_every:
+            self.flush_access()
+
+    def flush_access(self):
+        """Write the pending last access times, the lock is held."""
+        if not self.pending_access:
+            return
+        with self.conn:
+            self.conn.executemany("UPDATE results SET last_access = ? WHERE key = ?",
+                                  [(last_access, key) for key, last_access in self.pending_access.items()])
+        self.pending_access = {}
+
+    def insert(self, key, data, max_size):
+        """Store data under key and evict the least recently used results beyond max_size, the lock is held."""
+        with self.conn:
+            row = self.conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time())
+            )
+            self.total_size += len(data) - (row[0] if row is not None else 0)
+            self.pending_access.pop(key, None)
+        if self.total_size > max_size:
+            self.evict(max_size)
+
+    def evict(self, max_size):
+        # the least recently used results are picked with the last access of the recent hits
+        self.flush_access()
+        with self.conn:
+            while self.total_size > max_size:
+                rows = self.conn.execute("SELECT key, size FROM results ORDER BY last_access LIMIT 64").fetchall()
+                if not rows:
+                    break
+                self.conn.executemany("DELETE FROM results WHERE key = ?", [(row[0],) for row in rows])
+                self.total_size -= sum(row[1] for row in rows)
+
+
+class ResultCache:
+    """
+    On-disk cache of model results, stored in SQLite.
+
+    Entries are keyed by the model signature (namespace) and a hash of the model input, the least
+    recently used entries are evicted when the total size of the stored results exceeds max_size.
+    Several caches (e.g. one per model) can share the same database file.
+
+    Example:
+        >>> cache = ResultCache("outputs/cache/results.db", namespace=model_signature("layout_detection_yolo", "model.pt"))
+        >>> result = cache.get(hash_image(image))
+        >>> if result is None:
+        ...     result = predict(image)
+        ...     cache.put(hash_image(image), result)
+    """
+    def __init__(self, path, max_size=1024**3, namespace=''):
+        """
+        Args:
+            path (str): Path to the SQLite database, created if needed.
+            max_size (int): Maximum total size of the stored results, in bytes.
+            namespace (str): Prefix of the keys, usually the model signature.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.database = _ResultDatabase.open(path)
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        """
+        Returns:
+            The cached result, or None on a miss.
+        """
+        if key is None:
+            return None
+        with self.database.lock:
+            row = self.database.conn.execute("SELECT value FROM results WHERE key = ?", (self._key(key),)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.database.touch(self._key(key))
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        if key is None:
+            return
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.database.lock:
+            self.database.insert(self._key(key), data, self.max_size)
+
+    def stats(self):
+        """
+        Returns:
+            dict: hits, misses and hit rate of this cache, number of entries and total size of the database.
+        """
+        with self.database.lock:
+            entries = self.database.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            size = self.database.total_size
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'size': size,
+        }
+
+    def close(self):
+        if self.database is not None:
+            self.database.release()
+            self.database = None
+
+
+def build_result_cache(config, model_name, weights_path=None, **params):
+    """
+    Create the result cache of a model from its model_config.
+
+    Args:
+        config (dict): Model configuration, the cache is enabled by `cache_path` and bounded by `cache_max_size` (in MB, default 1024).
+        model_name (str): Registered name of the model.
+        weights_path (str, optional): Path to the model weights.
+        **params: Parameters changing the model results, e.g. thresholds and input size.
+
+    Returns:
+        ResultCache or None: None if the cache is not enabled.
+    """
+    cache_path = config.get('cache_path', None)
+    if not cache_path:
+        return None
+    max_size = int(config.get('cache_max_size', 1024) * 1024 * 1024)
+    return ResultCache(cache_path, max_size=max_size, namespace=model_signature(model_name, weights_path, **params))
+
+
+def perceptual_hash(image, hash_size=16):
+    """
+    Perceptual hash of a formula crop: the grayscale crop is trimmed to its ink, the ink is shrunk to a hash_size x
+    hash_size thumbnail and thresholded at its mean. Crops of the same formula rendered at the same scale get the
+    same or close hashes, whatever their margins.
+
+    Args:
+        image: PIL.Image.Image or np.ndarray (RGB or grayscale) crop.
+        hash_size (int): Side of the thumbnail.
+
+    Returns:
+        tuple: ((height, width) of the ink, packed bits of the thumbnail as a uint8 array).
+    """
+    gray = np.asarray(image.convert('L') if isinstance(image, Image.Image) else image)
+    if gray.ndim == 3:
+        gray = np.asarray(Image.fromarray(gray).convert('L'))
+    low, high = (int(gray.min()), int(gray.max())) if gray.size else (0, 0)
+    if high - low < 32:
+        # blank crop
+        return (0, 0), np.zeros((hash_size * hash_size + 7) // 8, dtype=np.uint8)
+    ink = gray < (low + high) / 2
+    rows, cols = np.flatnonzero(ink.any(axis=1)), np.flatnonzero(ink.any(axis=0))
+    gray = gray[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    thumbnail = np.asarray(Image.fromarray(gray).resize((hash_size, hash_size), Image.BOX), dtype=np.float32)
+    return gray.shape, np.packbits(thumbnail < thumbnail.mean())
+
+
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.int32)
+
+
+class PerceptualHashCache:
+    """
+    In-memory cache of the latex of formula crops, keyed by their perceptual hash (see `perceptual_hash`).
+
+    A crop matches a cached crop when the height and width of their ink differ by at most size_tolerance pixels and
+    their hashes by at most tolerance bits, the closest match is used. By default only crops with the same ink size
+    and hash match, tolerances above 0 match approximately and can merge different formulas. Crops can be scoped (e.g. per document), a
+    crop only matches the crops of its scope. The least recently used entries are evicted above max_entries.
+
+    Example:
+        >>> cache = PerceptualHashCache(max_entries=4096, tolerance=2)
+        >>> latex = cache.recognize(formula_crops, mfr_model.recognize, scope=pdf_path)
+        >>> cache.stats()['hit_rate']
+    """
+    def __init__(self, max_entries=4096, tolerance=0, size_tolerance=0, hash_size=16):
+        """
+        Args:
+            max_entries (int): Maximum number of cached crops.
+            tolerance (int): Maximum number of different bits of the hashes of matching crops.
+            size_tolerance (int): Maximum difference in pixels of the ink height and width of matching crops.
+            hash_size (int): Side of the thumbnail of the hashes.
+        """
+        self.max_entries = max(max_entries, 1)
+        self.tolerance = tolerance
+        self.size_tolerance = size_tolerance
+        self.hash_size = hash_size
+        self.sizes = np.zeros((self.max_entries, 2), dtype=np.int64)
+        self.bits = np.zeros((self.max_entries, (hash_size * hash_size + 7) // 8), dtype=np.uint8)
+        self.scopes = np.zeros(self.max_entries, dtype=np.int64)
+        self.last_used = np.full(self.max_entries, -1, dtype=np.int64)
+        self.values = [None] * self.max_entries
+        self.exact = {}
+        self.scope_ids = {}
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, image):
+        return perceptual_hash(image, self.hash_size)
+
+    def _scope_id(self, scope):
+        return self.scope_ids.setdefault(scope, len(self.scope_ids))
+
+    def _find(self, key, scope_id):
+        size, bits = key
+        slot = self.exact.get((scope_id, size, bits.tobytes()))
+        if slot is None and (self.tolerance > 0 or self.size_tolerance > 0):
+            candidates = np.flatnonzero((self.last_used >= 0) & (self.scopes == scope_id) &
+                                        (np.abs(self.sizes - size) <= self.size_tolerance).all(axis=1))
+            if len(candidates):
+                distances = _POPCOUNT[np.bitwise_xor(self.bits[candidates], bits)].sum(axis=1)
+                best = distances.argmin()
+                if distances[best] <= self.tolerance:
+                    slot = candidates[best]
+        if slot is not None:
+            self.clock += 1
+            self.last_used[slot] = self.clock
+        return slot
+
+    def get(self, key, scope=None):
+        """
+        Returns:
+            The value of the closest matching crop of the scope, None on a miss.
+        """
+        with self.lock:
+            slot = self._find(key, self._scope_id(scope))
+            return self.values[slot] if slot is not None else None
+
+    def count_lookups(self, hits=0, misses=0):
+        """Count crops not recognized (hits) and recognized (misses) in `stats`."""
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def pending(self, max_entries):
+        """
+        Returns:
+            PerceptualHashCache: Empty cache with the same tolerances, to group the near identical crops waiting for
+                their recognition.
+        """
+        return PerceptualHashCache(max_entries=max_entries, tolerance=self.tolerance, size_tolerance=self.size_tolerance,
+                                   hash_size=self.hash_size)
+
+    def put(self, key, value, scope=None):
+        size, bits = key
+        with self.lock:
+            scope_id = self._scope_id(scope)
+            exact_key = (scope_id, size, bits.tobytes())
+            slot = self.exact.get(exact_key)
+            if slot is None:
+                # least recently used slot, free slots first
+                slot = int(self.last_used.argmin())
+                if self.last_used[slot] >= 0:
+                    del self.exact[(int(self.scopes[slot]), tuple(self.sizes[slot].tolist()), self.bits[slot].tobytes())]
+                self.exact[exact_key] = slot
+                self.sizes[slot], self.bits[slot], self.scopes[slot] = size, bits, scope_id
+            self.clock += 1
+            self.last_used[slot] = self.clock
+            self.values[slot] = value
+
+    def recognize(self, images, recognize_fn, scope=None, keys=None):
+        """
+        Recognize crops, each group of near identical crops missing from the cache is recognized once.
+
+        Args:
+            images (list): PIL.Image.Image crops, or any inputs of recognize_fn when their keys are given.
+            recognize_fn (callable): Takes a list of crops, returns their latex in the same order, None for a crop
+                which could not be recognized (it is not cached).
+            scope: Hashable scope of the crops, e.g. the document path, None for the crops shared across a run.
+            keys (list, optional): `key` of each crop, computed from the crops by default.
+
+        Returns:
+            list: Latex of each crop, in input order.
+        """
+        keys = [self.key(image) for image in images] if keys is None else keys
+        results = [None] * len(images)
+        # near identical crops of the call which are not cached are grouped on their first crop
+        pending = self.pending(len(images))
+        todo, owners = [], []
+        for idx, key in enumerate(keys):
+            cached = self.get(key, scope)
+            if cached is not None:
+                results[idx] = cached
+                continue
+            owner = pending.get(key)
+            if owner is None:
+                owner = len(todo)
+                todo.append(idx)
+                pending.put(key, owner)
+            owners.append((idx, owner))
+        self.count_lookups(hits=len(images) - len(todo), misses=len(todo))
+        if not todo:
+            return results
+
+        preds = recognize_fn([images[idx] for idx in todo])
+        for idx, pred in zip(todo, preds):
+            if pred is not None:
+                self.put(keys[idx], pred, scope)
+        for idx, owner in owners:
+            results[idx] = preds[owner]
+        return results
+
+    def stats(self):
+        """
+        Returns:
+            dict: hits (crops not recognized), misses (crops recognized), hit rate and number of entries.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': int((self.last_used >= 0).sum()),
+            }
+
+
+def build_perceptual_cache(config):
+    """
+    Create a `PerceptualHashCache` from its configuration.
+
+    Args:
+        config (dict): `enable`, and the `max_entries`, `tolerance`, `size_tolerance` and `hash_size` of the cache,
+            other keys (e.g. the `scope` used by pdf2markdown) are ignored.
+
+    Returns:
+        PerceptualHashCache or None: None if the cache is not enabled.
+    """
+    if not config or not config.get('enable', True):
+        return None
+    return PerceptualHashCache(max_entries=config.get('max_entries', 4096), tolerance=config.get('tolerance', 0),
+                               size_tolerance=config.get('size_tolerance', 0), hash_size=config.get('hash_size', 16))
+
+
+def pack_yolo_result(result):
+    """Keep what is needed to rebuild a YOLO result: its class, boxes, class names and path."""
+    return type(result), result.boxes.data.cpu().numpy(), result.names, result.path
+
+
+def unpack_yolo_result(packed, orig_img):
+    """Rebuild the YOLO result of `pack_yolo_result` on the image it was predicted on (BGR array)."""
+    import torch
+    result_cls, boxes, names, path = packed
+    return result_cls(orig_img, path=path, names=names, boxes=torch.from_numpy(boxes))
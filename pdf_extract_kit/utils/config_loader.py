@@ -35,12 +35,13 @@ def initialize_tasks_and_models(config):
 
         model_name = config['tasks'][task_name]['model']
         model_config = config['tasks'][task_name]['model_config']
+        pdf_config = config['tasks'][task_name].get('pdf_config', None)
 
         TaskClass = TASK_REGISTRY.get(task_name)
         ModelClass = MODEL_REGISTRY.get(model_name)
 
         model_instance = ModelClass(model_config)
-        task_instance = TaskClass(model_instance)
+        task_instance = TaskClass(model_instance, pdf_config)
 
         task_instances[task_name] = task_instance
 
@@ -0,0 +1,89 @@
+import threading
+
+import numpy as np
+from PIL import Image
+
+from pdf_extract_kit.utils.page_image import PageImage
+
+
+def to_rgb_array(image):
+    """RGB uint8 array of a PageImage (its buffer, without copy), PIL.Image.Image or RGB np.ndarray."""
+    if isinstance(image, PageImage):
+        return image.rgb
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB"))
+    return image
+
+
+class CropPool:
+    """
+    Padded crops of the regions of page images, sliced from the page buffers into reusable preallocated arrays.
+
+    Each crop is the region (xmin, ymin, xmax, ymax) on a white canvas with padding_x and padding_y pixels on
+    each side, the parts of the region outside the page are black. This is the same image as cropping the PIL
+    page and pasting the crop on a new white image, in BGR order (the input of the OpenCV based models) by default.
+
+    The crops of a call are views into one buffer of the calling thread, which is reused (and only grown) by
+    the next calls: they are valid until the next call from the same thread.
+
+    Example:
+        >>> pool = CropPool()
+        >>> crops = pool.crop_page(page.array(), [[10, 20, 300, 60], [10, 80, 300, 120]], padding_x=25, padding_y=25)
+    """
+    def __init__(self, bgr=True):
+        """
+        Args:
+            bgr (bool): Crops in BGR order, RGB otherwise.
+        """
+        self.bgr = bgr
+        self._local = threading.local()
+
+    def _buffer(self, size):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.size < size:
+            # grown geometrically so that the buffer settles after a few pages
+            buffer = np.empty(max(size, 2 * buffer.size if buffer is not None else 0), dtype=np.uint8)
+            self._local.buffer = buffer
+        return buffer
+
+    def crop(self, pages, padding_x=0, padding_y=0):
+        """
+        Crop the regions of a batch of pages in one call.
+
+        Args:
+            pages (list): (image, boxes) of each page, image is a PageImage, PIL.Image.Image or RGB np.ndarray and
+                boxes are the int (xmin, ymin, xmax, ymax) of its regions, float coordinates are truncated.
+            padding_x (int): White padding on the left and the right of each crop.
+            padding_y (int): White padding on the top and the bottom of each crop.
+
+        Returns:
+            list: For each page, the list of the crops of its regions, uint8 arrays of shape
+                (ymax - ymin + 2 * padding_y, xmax - xmin + 2 * padding_x, 3).
+        """
+        pages = [(to_rgb_array(image), np.asarray(boxes).reshape(-1, 4).astype(np.int64)) for image, boxes in pages]
+        sizes = [(boxes[:, 3] - boxes[:, 1] + 2 * padding_y) * (boxes[:, 2] - boxes[:, 0] + 2 * padding_x) * 3 for _, boxes in pages]
+        buffer = self._buffer(int(sum(page_sizes.sum() for page_sizes in sizes)))
+        channels = slice(None, None, -1) if self.bgr else slice(None)
+
+        crops, offset = [], 0
+        for (rgb, boxes), page_sizes in zip(pages, sizes):
+            img_h, img_w = rgb.shape[:2]
+            page_crops = []
+            for (xmin, ymin, xmax, ymax), size in zip(boxes.tolist(), page_sizes.tolist()):
+                width, height = xmax - xmin, ymax - ymin
+                crop = buffer[offset:offset + size].reshape(height + 2 * padding_y, width + 2 * padding_x, 3)
+                offset += size
+                crop.fill(255)
+                region = crop[padding_y:padding_y + height, padding_x:padding_x + width]
+                x0, y0, x1, y1 = max(xmin, 0), max(ymin, 0), min(xmax, img_w), min(ymax, img_h)
+                if x0 != xmin or y0 != ymin or x1 != xmax or y1 != ymax:
+                    region.fill(0)
+                if x1 > x0 and y1 > y0:
+                    region[y0 - ymin:y1 - ymin, x0 - xmin:x1 - xmin] = rgb[y0:y1, x0:x1, channels]
+                page_crops.append(crop)
+            crops.append(page_crops)
+        return crops
+
+    def crop_page(self, image, boxes, padding_x=0, padding_y=0):
+        """Crop the regions of one page, see `crop`."""
+        return self.crop([(image, boxes)], padding_x=padding_x, padding_y=padding_y)[0]
@@ -1,20 +1,304 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import fitz
 from PIL import Image
 
+from pdf_extract_kit.utils.rasterizer import load_rasterizer, compute_render_dpi
+from pdf_extract_kit.utils.page_image import PageImage
+
 
-def load_pdf_page(page, dpi):
-    pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
+def load_pdf_page(page, dpi, target_size=None):
+    # the scale is computed from the page size, so the page is rendered only once
+    scale = compute_render_dpi(page.rect.width, page.rect.height, dpi=dpi, target_size=target_size) / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
     image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-    if pix.width > 3000 or pix.height > 3000:
-        pix = page.get_pixmap(matrix=fitz.Matrix(1, 1), alpha=False)
-        image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
     return image
 
-def load_pdf(pdf_path, dpi=144):
-    images = []
-    doc = fitz.open(pdf_path)
-    for i in range(len(doc)):
-        page = doc[i]
-        image = load_pdf_page(page, dpi)
-        images.append(image)
-    return images
\ No newline at end of file
+def open_pdf(pdf_path, dpi=144, backend='pymupdf', num_workers=0, prefetch=8):
+    """
+    Open a lazy page source of a PDF file.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        dpi (int): Resolution used to rasterize the pages.
+        backend (str): Rasterizer backend, one of `list_rasterizers()`.
+        num_workers (int): Number of rasterization processes, 0 renders pages in the current process.
+        prefetch (int): Maximum number of page ranges rendered ahead of the consumer, only used when num_workers > 0.
+
+    Returns:
+        PDFPageSource: The page source, close it (or use it as a context manager) when done.
+    """
+    if num_workers > 0:
+        return ParallelPDFPageSource(pdf_path, dpi=dpi, backend=backend, num_workers=num_workers, prefetch=prefetch)
+    return PDFPageSource(pdf_path, dpi=dpi, backend=backend)
+
+def load_pdf(pdf_path, dpi=144, backend='pymupdf'):
+    with PDFPageSource(pdf_path, dpi=dpi, backend=backend) as pages:
+        images = list(pages)
+    return images
+
+
+class PDFPageSource:
+    """
+    Lazy page source of a PDF file.
+
+    Pages are rasterized only when they are accessed, so iterating over a document
+    keeps only the pages in use alive instead of the whole document.
+
+    Example:
+        >>> with PDFPageSource("paper.pdf") as pages:
+        ...     print(len(pages))
+        ...     first_page = pages[0]
+        ...     for image in pages:
+        ...         pass
+        ...     # page handles render each page once per requested size
+        ...     for page in pages.iter_pages():
+        ...         layout_image = page.image(1024)
+        ...         full_image = page.image()
+    """
+    def __init__(self, pdf_path, dpi=144, backend='pymupdf'):
+        """
+        Open the PDF file, no page is rendered yet.
+
+        Args:
+            pdf_path (str): Path to the PDF file.
+            dpi (int): Resolution used to rasterize the pages.
+            backend (str): Rasterizer backend, one of `list_rasterizers()`.
+        """
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.backend = backend
+        self.rasterizer = load_rasterizer(pdf_path, backend)
+
+    def _check_open(self):
+        if self.rasterizer is None:
+            raise ValueError("PDF document is closed: {}".format(self.pdf_path))
+
+    def __len__(self):
+        self._check_open()
+        return len(self.rasterizer)
+
+    def __getitem__(self, idx):
+        """
+        Render the page at index idx (negative indexes are supported).
+
+        Returns:
+            PIL.Image.Image: The rasterized page.
+        """
+        return self.page(idx).image()
+
+    def __iter__(self):
+        for page in self.iter_pages():
+            yield page.image()
+
+    def page(self, idx):
+        """
+        Get the handle of the page at index idx (negative indexes are supported), nothing is rendered yet.
+
+        Returns:
+            PDFPage: The page handle.
+        """
+        num_pages = len(self)
+        if idx < 0:
+            idx += num_pages
+        if not 0 <= idx < num_pages:
+            raise IndexError("Page index out of range: {}".format(idx))
+        return PDFPage(self, idx)
+
+    def iter_pages(self, target_sizes=(None,), start=0):
+        """
+        Iterate over the page handles in order.
+
+        Args:
+            target_sizes (tuple): Sizes the consumer will request from each page, see `PDFPage.image`.
+                Sources rendering ahead of the consumer render these sizes in advance, other sources ignore it.
+            start (int): Index of the first page, e.g. to resume an interrupted run.
+
+        Yields:
+            PDFPage: The page handles.
+        """
+        for idx in range(start, len(self)):
+            yield self.page(idx)
+
+    def get_words(self, idx, target_size=None):
+        """
+        Read the words of the page text layer, in the coordinates of the page rendered with `render_page`.
+
+        Returns:
+            list or None: (x0, y0, x1, y1, text, block_no, line_no, word_no) tuples, None if the backend can not read the text layer.
+        """
+        self._check_open()
+        words = self.rasterizer.get_words(idx)
+        if words is None:
+            return None
+        page_width, page_height = self.rasterizer.page_size(idx)
+        scale = compute_render_dpi(page_width, page_height, dpi=self.dpi, target_size=target_size) / 72
+        return [(x0 * scale, y0 * scale, x1 * scale, y1 * scale, *word_info) for x0, y0, x1, y1, *word_info in words]
+
+    def render_page(self, idx, target_size=None):
+        """
+        Returns:
+            PageImage: The page rendered at the source dpi, or with its longest side equal to target_size.
+        """
+        self._check_open()
+        return self.rasterizer.load_page(idx, self.dpi, target_size)
+
+    def close(self):
+        """Close the underlying document, the source can not be used afterwards."""
+        if self.rasterizer is not None:
+            self.rasterizer.close()
+            self.rasterizer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PDFPage:
+    """
+    Handle of one page of a PDFPageSource.
+
+    The page is rendered once per distinct requested size, so consumers needing different
+    resolutions (e.g. layout detection at 1024, formula detection at 1280 and OCR crops at
+    full resolution) share one handle without rendering a large bitmap and resizing it.
+    `array` gives the numpy backed PageImage, `image` its PIL view.
+    """
+    def __init__(self, source, idx, images=None):
+        """
+        Args:
+            source (PDFPageSource): The source the page belongs to.
+            idx (int): Index of the page.
+            images (dict, optional): Already rendered PageImage keyed by target size.
+        """
+        self.source = source
+        self.idx = idx
+        self.images = dict(images or {})
+
+    def array(self, target_size=None):
+        """
+        Render the page, or return the image rendered by a previous call with the same size.
+
+        Args:
+            target_size (int, optional): Longest side of the image in pixels. None renders the page at the source dpi.
+
+        Returns:
+            PageImage: The rasterized page.
+        """
+        if target_size not in self.images:
+            self.images[target_size] = self.source.render_page(self.idx, target_size)
+        return self.images[target_size]
+
+    def image(self, target_size=None):
+        """
+        Returns:
+            PIL.Image.Image: The rasterized page, see `array`.
+        """
+        return self.array(target_size).pil
+
+    def words(self, target_size=None):
+        """
+        Returns:
+            list or None: Words of the page text layer in the coordinates of `image(target_size)`, see `PDFPageSource.get_words`.
+        """
+        return self.source.get_words(self.idx, target_size)
+
+
+class ImagePage:
+    """Page handle of an image input, every requested size returns the image itself."""
+    def __init__(self, image, idx=0):
+        self.idx = idx
+        self._image = image
+        self._array = None
+
+    def array(self, target_size=None):
+        if self._array is None:
+            self._array = PageImage.from_pil(self._image)
+        return self._array
+
+    def image(self, target_size=None):
+        return self._image
+
+    def words(self, target_size=None):
+        # images have no text layer
+        return None
+
+
+# Document opened by a rasterization worker process, reused across page ranges of the same file.
+_worker_rasterizer = None
+_worker_rasterizer_key = None
+
+def _render_page_range(pdf_path, backend, start, end, dpi, target_sizes):
+    global _worker_rasterizer, _worker_rasterizer_key
+    if _worker_rasterizer_key != (pdf_path, backend):
+        if _worker_rasterizer is not None:
+            _worker_rasterizer.close()
+        _worker_rasterizer = load_rasterizer(pdf_path, backend)
+        _worker_rasterizer_key = (pdf_path, backend)
+    return [
+        {size: _worker_rasterizer.load_page(idx, dpi, size) for size in target_sizes}
+        for idx in range(start, end)
+    ]
+
+
+class ParallelPDFPageSource(PDFPageSource):
+    """
+    Page source rasterizing pages in a pool of worker processes.
+
+    Each worker opens its own copy of the document and renders ranges of `chunk_size` pages. Iteration yields
+    the pages in order, with at most `prefetch` page ranges rendered or in flight ahead of the consumer,
+    so memory stays bounded for long documents. Random access, and sizes not requested through
+    `iter_pages`, are rendered in the current process.
+    """
+    def __init__(self, pdf_path, dpi=144, backend='pymupdf', num_workers=4, prefetch=8, chunk_size=4):
+        """
+        Args:
+            pdf_path (str): Path to the PDF file.
+            dpi (int): Resolution used to rasterize the pages.
+            backend (str): Rasterizer backend, one of `list_rasterizers()`.
+            num_workers (int): Number of rasterization processes.
+            prefetch (int): Maximum number of page ranges rendered ahead of the consumer.
+            chunk_size (int): Number of consecutive pages rendered by a worker per task.
+        """
+        super().__init__(pdf_path, dpi=dpi, backend=backend)
+        self.num_workers = num_workers
+        self.prefetch = max(prefetch, 1)
+        self.chunk_size = max(chunk_size, 1)
+        self.pool = None
+
+    def iter_pages(self, target_sizes=(None,), start=0):
+        num_pages = len(self)
+        target_sizes = tuple(dict.fromkeys(target_sizes))
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.num_workers)
+        page_ranges = iter([(first, min(first + self.chunk_size, num_pages)) for first in range(start, num_pages, self.chunk_size)])
+
+        # (first page index, future) of the page ranges in flight
+        pending = deque()
+        def submit_next():
+            page_range = next(page_ranges, None)
+            if page_range is not None:
+                future = self.pool.submit(_render_page_range, self.pdf_path, self.backend, *page_range, self.dpi, target_sizes)
+                pending.append((page_range[0], future))
+
+        for _ in range(self.prefetch):
+            submit_next()
+        try:
+            while pending:
+                first, future = pending.popleft()
+                page_images = future.result()
+                submit_next()
+                for offset, images in enumerate(page_images):
+                    yield PDFPage(self, first + offset, images)
+        finally:
+            # the consumer stopped early, drop the pages which are not rendered yet
+            for _, future in pending:
+                future.cancel()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        super().close()
@@ -0,0 +1,306 @@
+"""
+Vectorized geometry kernels on bboxes given as (N, 4) arrays of [x0, y0, x1, y1].
+
+The kernels compute with the dtype of the inputs (float64 for python numbers), so they give the same
+results as the scalar code they replace, pair by pair.
+"""
+from bisect import bisect_right, insort
+
+import numpy as np
+
+
+def as_bboxes(bboxes):
+    """
+    Args:
+        bboxes: (N, 4) array-like of [x0, y0, x1, y1].
+
+    Returns:
+        np.ndarray: (N, 4) floating point array, float32 and float64 inputs keep their dtype.
+    """
+    bboxes = np.asarray(bboxes)
+    if not np.issubdtype(bboxes.dtype, np.floating):
+        bboxes = bboxes.astype(np.float64)
+    return bboxes.reshape(-1, 4)
+
+
+def bbox_areas(bboxes):
+    bboxes = as_bboxes(bboxes)
+    return (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+
+
+def pairwise_intersection(bboxes1, bboxes2):
+    """
+    Returns:
+        np.ndarray: (N, M) intersection areas of the bboxes, 0 for the pairs which do not intersect.
+    """
+    bboxes1, bboxes2 = as_bboxes(bboxes1), as_bboxes(bboxes2)
+    width = np.minimum(bboxes1[:, None, 2], bboxes2[None, :, 2]) - np.maximum(bboxes1[:, None, 0], bboxes2[None, :, 0])
+    height = np.minimum(bboxes1[:, None, 3], bboxes2[None, :, 3]) - np.maximum(bboxes1[:, None, 1], bboxes2[None, :, 1])
+    return np.where((width < 0) | (height < 0), 0, width * height)
+
+
+def pairwise_overlap_ratio(bboxes1, bboxes2):
+    """
+    Returns:
+        np.ndarray: (N, M) ratio of the intersection area to the area of bboxes1[i], 0 for empty bboxes1[i].
+    """
+    intersection = pairwise_intersection(bboxes1, bboxes2)
+    areas = np.broadcast_to(bbox_areas(bboxes1)[:, None], intersection.shape)
+    ratio = np.zeros_like(intersection)
+    np.divide(intersection, areas, out=ratio, where=areas != 0)
+    return ratio
+
+
+def pairwise_iou(bboxes1, bboxes2):
+    """
+    Returns:
+        np.ndarray: (N, M) intersection over union of the bboxes, 0 when the union is empty.
+    """
+    intersection = pairwise_intersection(bboxes1, bboxes2)
+    union = bbox_areas(bboxes1)[:, None] + bbox_areas(bboxes2)[None, :] - intersection
+    iou = np.zeros_like(intersection)
+    np.divide(intersection, union, out=iou, where=union > 0)
+    return iou
+
+
+def y_overlap_ratio(bboxes1, bboxes2):
+    """
+    Returns:
+        np.ndarray: Height of the y overlap of bboxes1[i] and bboxes2[i] over the smaller of their heights,
+            bboxes1 and bboxes2 are broadcast against each other.
+    """
+    bboxes1, bboxes2 = as_bboxes(bboxes1), as_bboxes(bboxes2)
+    overlap = np.maximum(0, np.minimum(bboxes1[:, 3], bboxes2[:, 3]) - np.maximum(bboxes1[:, 1], bboxes2[:, 1]))
+    min_height = np.minimum(bboxes1[:, 3] - bboxes1[:, 1], bboxes2[:, 3] - bboxes2[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return overlap / min_height
+
+
+def group_lines(bboxes, overlap_ratio_threshold=0.8, isolated=None):
+    """
+    Cluster bboxes into lines: the bboxes are sorted by y0 (stable), and a bbox joins the line of the previous
+    one when their y overlap exceeds overlap_ratio_threshold of the smaller height, else it starts a new line.
+
+    Args:
+        bboxes: (N, 4) array-like.
+        isolated: optional (N,) bool array-like, bboxes alone on their line (e.g. isolated formulas).
+
+    Returns:
+        List[np.ndarray]: Indexes of the bboxes of each line, from top to bottom, in y0 order.
+    """
+    bboxes = as_bboxes(bboxes)
+    if len(bboxes) == 0:
+        return []
+    order = np.argsort(bboxes[:, 1], kind='stable')
+    sorted_bboxes = bboxes[order]
+    new_line = ~(y_overlap_ratio(sorted_bboxes[1:], sorted_bboxes[:-1]) > overlap_ratio_threshold)
+    if isolated is not None:
+        sorted_isolated = np.asarray(isolated, dtype=bool)[order]
+        new_line |= sorted_isolated[1:] | sorted_isolated[:-1]
+    return np.split(order, np.flatnonzero(new_line) + 1)
+
+
+def _concat_lines(lines):
+    indexes = np.concatenate(lines) if lines else np.zeros(0, dtype=np.int64)
+    lengths = np.array([len(line) for line in lines], dtype=np.int64)
+    return indexes.astype(np.int64), np.repeat(np.arange(len(lines)), lengths), lengths
+
+
+def sort_lines_left_to_right(bboxes, lines):
+    """
+    Returns:
+        List[np.ndarray]: Indexes of the bboxes of each line sorted by x0 (stable).
+    """
+    bboxes = as_bboxes(bboxes)
+    indexes, labels, lengths = _concat_lines(lines)
+    indexes = indexes[np.lexsort((bboxes[indexes, 0], labels))]
+    return np.split(indexes, np.cumsum(lengths)[:-1])
+
+
+def line_bboxes(bboxes, lines):
+    """
+    Returns:
+        np.ndarray: (L, 4) bbox enclosing the bboxes of each (non empty) line.
+    """
+    bboxes = as_bboxes(bboxes)
+    indexes, _, lengths = _concat_lines(lines)
+    if len(indexes) == 0:
+        return np.zeros((0, 4), dtype=bboxes.dtype)
+    return _reduce_groups(bboxes[indexes], np.concatenate([[0], np.cumsum(lengths)[:-1]]))
+
+
+def _reduce_groups(bboxes, starts):
+    return np.stack([
+        np.minimum.reduceat(bboxes[:, 0], starts),
+        np.minimum.reduceat(bboxes[:, 1], starts),
+        np.maximum.reduceat(bboxes[:, 2], starts),
+        np.maximum.reduceat(bboxes[:, 3], starts),
+    ], axis=1)
+
+
+def merge_line_x_overlaps(bboxes, lines):
+    """
+    Merge the bboxes of each line which overlap along x: the bboxes of a line are sorted by x0 (stable), a bbox
+    is merged into the previous group when it starts before the right end of the group.
+
+    Returns:
+        np.ndarray: (K, 4) merged bboxes, line by line, from left to right.
+    """
+    bboxes = as_bboxes(bboxes)
+    lines = [line for line in lines if len(line)]
+    if not lines:
+        return np.zeros((0, 4), dtype=bboxes.dtype)
+    lines = sort_lines_left_to_right(bboxes, lines)
+    indexes, labels, _ = _concat_lines(lines)
+    sorted_bboxes = bboxes[indexes]
+    # running maximum of x1 within each line: the x coordinates are replaced by their rank, each line is shifted
+    # above the previous ones, then a single cumulative maximum does not cross lines
+    ranks = np.unique(np.concatenate([sorted_bboxes[:, 0], sorted_bboxes[:, 2]]), return_inverse=True)[1].reshape(2, -1)
+    offsets = labels * (ranks.max() + 1)
+    right = np.maximum.accumulate(ranks[1] + offsets)
+    new_group = np.ones(len(indexes), dtype=bool)
+    new_group[1:] = right[:-1] < ranks[0][1:] + offsets[1:]
+    return _reduce_groups(sorted_bboxes, np.flatnonzero(new_group))
+
+
+def pairwise_y_overlap_ratio(bboxes1, bboxes2):
+    """
+    Returns:
+        np.ndarray: (N, M) height of the y overlap of bboxes1[i] and bboxes2[j] over the smaller of their heights.
+    """
+    bboxes1, bboxes2 = as_bboxes(bboxes1), as_bboxes(bboxes2)
+    overlap = np.maximum(0, np.minimum(bboxes1[:, None, 3], bboxes2[None, :, 3]) - np.maximum(bboxes1[:, None, 1], bboxes2[None, :, 1]))
+    min_height = np.minimum((bboxes1[:, 3] - bboxes1[:, 1])[:, None], (bboxes2[:, 3] - bboxes2[:, 1])[None, :])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return overlap / min_height
+
+
+def subtract_x_intervals(bboxes, masks, applies):
+    """
+    Remove the x ranges of masks from bboxes, all pairs in one sweep over the masks sorted by x0.
+
+    The masks applying to a bbox are merged when they overlap or touch, the ranges are integer pixels: the
+    piece left of a mask [x0, x1] ends at x0 - 1 and the piece right of it starts at x1 + 1. The masks are
+    expected to be well formed (x0 <= x1) on integer coordinates, e.g. formula detections.
+
+    Args:
+        bboxes: (N, 4) array-like.
+        masks: (M, 4) array-like.
+        applies: (N, M) bool array-like, masks removed from each bbox.
+
+    Returns:
+        (np.ndarray, np.ndarray): (K, 4) pieces of the bboxes, bbox by bbox from left to right, with the y range of
+            their bbox, and (K,) index of the bbox of each piece.
+    """
+    bboxes, masks = as_bboxes(bboxes), as_bboxes(masks)
+    if len(masks) == 0:
+        return bboxes.copy(), np.arange(len(bboxes))
+    order = np.argsort(masks[:, 0], kind='stable')
+    starts, ends = masks[order, 0], masks[order, 2]
+    applies = np.asarray(applies, dtype=bool).reshape(len(bboxes), len(masks))[:, order]
+    x0, x1 = bboxes[:, 0:1], bboxes[:, 2:3]
+
+    # running maximum of the ends of the masks applying to each bbox, before each mask and up to the last one
+    max_ends = np.maximum.accumulate(np.where(applies, ends, -np.inf), axis=1)
+    prev_ends = np.concatenate([np.full((len(bboxes), 1), -np.inf, dtype=max_ends.dtype), max_ends], axis=1)
+    # a mask starting after the end of the previous ones starts a merged interval, which ends before the next one
+    group_start = applies & (prev_ends[:, :-1] < starts)
+    next_start = np.where(group_start, np.arange(len(masks)), len(masks))
+    next_start = np.minimum.accumulate(np.concatenate([next_start[:, 1:], np.full((len(bboxes), 1), len(masks))], axis=1)[:, ::-1], axis=1)[:, ::-1]
+    group_ends = np.take_along_axis(prev_ends, next_start, axis=1)
+    prev_ends = prev_ends[:, :-1]
+
+    # the merged intervals starting after the bbox or ending before it are ignored, the others cut a piece left of
+    # them, from the end of the previous one
+    kept = group_start & (starts <= x1)
+    left = np.where(prev_ends >= x0, prev_ends + 1, x0)
+    cuts = kept & (group_ends >= x0) & (left < starts)
+    last_end = np.where(kept, group_ends, -np.inf).max(axis=1, keepdims=True)
+    last_left = np.where(last_end >= x0, last_end + 1, x0)
+
+    pieces_x0 = np.concatenate([left, last_left], axis=1)
+    pieces_x1 = np.concatenate([np.broadcast_to(starts - 1, left.shape), x1], axis=1)
+    rows, cols = np.nonzero(np.concatenate([cuts, last_left <= x1], axis=1))
+    pieces = np.stack([pieces_x0[rows, cols], bboxes[rows, 1], pieces_x1[rows, cols], bboxes[rows, 3]], axis=1)
+    return pieces.astype(bboxes.dtype, copy=False), rows
+
+
+def reading_order(xs, ys, y_tolerance=10):
+    """
+    Order boxes from top to bottom and left to right by their top left corners, as the insertion sort of the
+    PaddleOCR sorted_boxes: the boxes are sorted by (y, x), then each box moves left past the previous boxes
+    closer than y_tolerance in y with a larger x.
+
+    The boxes between two consecutive y at least y_tolerance apart never move across them: in a line less than
+    y_tolerance high, the boxes are sorted by x. The boxes of the higher lines (chains of close boxes) are
+    inserted with a bisection, see `_chained_line_order`.
+
+    Args:
+        xs: (N,) x of the top left corners.
+        ys: (N,) y of the top left corners, the distances in y are computed in their dtype.
+
+    Returns:
+        np.ndarray: (N,) indexes of the boxes in reading order.
+    """
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    num_boxes = len(ys)
+    if num_boxes == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((xs, ys))
+    sorted_ys = ys[order]
+    line_starts = np.flatnonzero(np.abs(np.diff(sorted_ys)) >= y_tolerance) + 1
+    line_ids = np.zeros(num_boxes, dtype=np.int64)
+    line_ids[line_starts] = 1
+    result = order[np.lexsort((xs[order], np.cumsum(line_ids)))]
+
+    line_starts = np.concatenate([[0], line_starts]).astype(np.int64)
+    line_ends = np.concatenate([line_starts[1:], [num_boxes]]).astype(np.int64)
+    for start, end in zip(line_starts, line_ends):
+        if sorted_ys[end - 1] - sorted_ys[start] >= y_tolerance:
+            line = order[start:end]
+            result[start:end] = line[_chained_line_order(xs[line], ys[line], y_tolerance)]
+    return result
+
+
+def _chained_line_order(xs, ys, y_tolerance):
+    """
+    Order of the boxes of a line sorted by (y, x) and at least y_tolerance high, with O(n log n) comparisons.
+
+    Each box of the insertion sort stops behind the last box which is y_tolerance or more above it, or has a
+    smaller or equal x. The boxes y_tolerance or more above a box stop all the next boxes too, so the order up
+    to the last of them is final. The boxes after it are sorted by x (ties in insertion order): each box is
+    inserted among them with a bisection on its rank in x.
+    """
+    num_boxes = len(ys)
+    # number of boxes y_tolerance or more above each box, a prefix of the boxes, found by bisection
+    low, high = np.zeros(num_boxes, dtype=np.int64), np.arange(num_boxes)
+    while (low < high).any():
+        searching = low < high
+        middle = (low + high) // 2
+        above = ys - ys[middle] >= y_tolerance
+        low = np.where(searching & above, middle + 1, low)
+        high = np.where(searching & ~above, middle, high)
+    by_rank = np.argsort(xs, kind='stable')
+    ranks = np.empty(num_boxes, dtype=np.int64)
+    ranks[by_rank] = np.arange(num_boxes)
+    ranks, num_above, box_of_rank = ranks.tolist(), low.tolist(), by_rank.tolist()
+
+    result, pending, done = [], [], [False] * num_boxes
+    num_done_above = 0
+    for idx in range(num_boxes):
+        if num_above[idx] > num_done_above:
+            # the pending boxes up to the last one now y_tolerance above the box are final
+            last_rank = -1
+            for above_idx in range(num_done_above, num_above[idx]):
+                if not done[above_idx] and ranks[above_idx] > last_rank:
+                    last_rank = ranks[above_idx]
+            num_done_above = num_above[idx]
+            if last_rank >= 0:
+                cut = bisect_right(pending, last_rank)
+                for rank in pending[:cut]:
+                    done[box_of_rank[rank]] = True
+                result.extend(pending[:cut])
+                del pending[:cut]
+        insort(pending, ranks[idx])
+    result.extend(pending)
+    return by_rank[np.array(result, dtype=np.int64)]
@@ -0,0 +1,79 @@
+import re
+
+
+_TEXT_REG = re.compile(r'(\\(operatorname|mathrm|text|mathbf)\s?\*? {.*?})')
+_LETTER = '[a-zA-Z]'
+_NOLETTER = r'[\W_^\d]'
+_NOLETTER_NOLETTER = re.compile(r'(?!\\ )(%s)\s+?(%s)' % (_NOLETTER, _NOLETTER))
+_NOLETTER_LETTER = re.compile(r'(?!\\ )(%s)\s+?(%s)' % (_NOLETTER, _LETTER))
+_LETTER_NOLETTER = re.compile(r'(%s)\s+?(%s)' % (_LETTER, _NOLETTER))
+# a single space removed by the substitutions: after a no-letter (not a backslash) before a letter or no-letter,
+# or after a letter before a no-letter, see `_kept_spaces`
+_REMOVED_SPACE = re.compile(r'(?<=[^\w \\]|[_\d]) (?=[^\w ]|[_\da-zA-Z])|(?<=[a-zA-Z]) (?=[^\w ]|[_\d])')
+_SPACES = re.compile(r'  +')
+_OTHER_WHITESPACE = re.compile(r'[^\S ]')
+
+# classes of the characters around a run of spaces
+_OTHER, _LETTER_CLASS, _NOLETTER_CLASS = 0, 1, 2
+_IS_LETTER = re.compile(_LETTER).fullmatch
+_IS_NOLETTER = re.compile(_NOLETTER).fullmatch
+_char_classes = {}
+
+
+def _char_class(ch):
+    char_class = _char_classes.get(ch)
+    if char_class is None:
+        char_class = _LETTER_CLASS if _IS_LETTER(ch) else _NOLETTER_CLASS if _IS_NOLETTER(ch) else _OTHER
+        if len(_char_classes) < 65536:
+            _char_classes[ch] = char_class
+    return char_class
+
+
+def _kept_spaces(match):
+    """
+    Spaces left of a run of spaces by the fixed point of the three substitutions of `_remove_whitespace_fixed_point`.
+
+    A run only depends on the characters around it: the character before it (x) starts the substitutions
+    unless it is a backslash (`\\ ` is kept) or neither a letter nor a no-letter, the spaces of the run start
+    the no-letter substitutions. The run is reduced until none applies:
+        x no-letter: removed before a letter or no-letter, one space left otherwise.
+        x letter: removed before a no-letter, one space left otherwise.
+        otherwise: one space left before a letter or no-letter, two otherwise.
+    The start and the end of the string count as neither a letter nor a no-letter.
+    """
+    s, start, end = match.string, match.start(), match.end()
+    x = _char_class(s[start - 1]) if start > 0 and s[start - 1] != '\\' else _OTHER
+    y = _char_class(s[end]) if end < len(s) else _OTHER
+    if x == _NOLETTER_CLASS:
+        kept = 0 if y != _OTHER else 1
+    elif x == _LETTER_CLASS:
+        kept = 0 if y == _NOLETTER_CLASS else 1
+    else:
+        kept = 1 if y != _OTHER else 2
+    return ' ' * min(end - start, kept)
+
+
+def _remove_whitespace_fixed_point(s):
+    news = s
+    while True:
+        s = news
+        news = _NOLETTER_NOLETTER.sub(r'\1\2', s)
+        news = _NOLETTER_LETTER.sub(r'\1\2', news)
+        news = _LETTER_NOLETTER.sub(r'\1\2', news)
+        if news == s:
+            break
+    return s
+
+
+def latex_rm_whitespace(s: str):
+    """Remove unnecessary whitespace from LaTeX code.
+
+    The spaces of \\operatorname, \\mathrm, \\text and \\mathbf groups are removed, then the whitespace between two
+    no-letters, or a letter and a no-letter. Runs of spaces are reduced in a single pass (single spaces, then the
+    longer runs, see `_kept_spaces`), strings with other whitespace (tabs, new lines) by repeating the substitutions
+    until a fixed point.
+    """
+    s = _TEXT_REG.sub(lambda match: match.group(0).replace(' ', ''), s)
+    if _OTHER_WHITESPACE.search(s):
+        return _remove_whitespace_fixed_point(s)
+    return _SPACES.sub(_kept_spaces, _REMOVED_SPACE.sub('', s))
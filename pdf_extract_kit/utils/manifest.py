@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from pdf_extract_kit.utils.page_result import dumps_json
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """
+    Hash the content of a file.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def atomic_write(path, data):
+    """
+    Write a file atomically: the data is written to a temporary file which then replaces path,
+    so a crash never leaves a truncated file behind.
+
+    Args:
+        path (str): Path of the file.
+        data (str or bytes): Content of the file, str is encoded in utf-8.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class PageCheckpoint:
+    """
+    Results of the pages of one document processed so far, appended as JSON lines.
+
+    Each line is flushed to disk once written, a line truncated by a crash is ignored on load.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """
+        Returns:
+            List[dict]: Page results saved so far, in page order.
+        """
+        pages = []
+        if not os.path.exists(self.path):
+            return pages
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    pages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # last line of an interrupted write
+                    break
+        return pages
+
+    def append(self, pages):
+        """Save the results of the next pages."""
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for page in pages:
+                f.write(dumps_json(page, indent=None) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def reset(self, pages=()):
+        """Replace the saved results by pages."""
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write(self.path, ''.join(dumps_json(page, indent=None) + '\n' for page in pages))
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RunManifest:
+    """
+    Manifest of a batch run, saved as JSON next to the outputs.
+
+    For each input file it records the status (running, done or failed), the hash of the input, the
+    output paths with the hashes of their content, and the number of pages. The manifest is rewritten
+    atomically on each change, so a restarted run can tell the files which are done from the ones to
+    (re)process, and resume a partially processed PDF from its page checkpoint.
+
+    Example:
+        >>> manifest = RunManifest("outputs/pdf2markdown/manifest.json")
+        >>> if not manifest.is_done("paper.pdf"):
+        ...     manifest.start("paper.pdf")
+        ...     ...
+        ...     manifest.finish("paper.pdf", {"json": "outputs/pdf2markdown/paper.json"}, num_pages=10)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        # the manifest can be updated from several threads, e.g. the stages of a pipeline
+        self.lock = threading.RLock()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.files = json.load(f).get('files', {})
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock:
+            atomic_write(self.path, json.dumps({'files': self.files}, indent=2, ensure_ascii=False))
+
+    def entry(self, fpath):
+        """
+        Returns:
+            dict or None: Manifest entry of the input file.
+        """
+        return self.files.get(os.path.abspath(fpath))
+
+    def is_done(self, fpath, input_hash=None):
+        """
+        Check if an input file was fully processed: its entry is done, the input did not change and the
+        outputs are still the ones written by the run.
+        """
+        entry = self.entry(fpath)
+        if entry is None or entry['status'] != 'done':
+            return False
+        if entry['input_hash'] != (input_hash or file_hash(fpath)):
+            return False
+        for name, output_path in entry['outputs'].items():
+            if not os.path.exists(output_path) or file_hash(output_path) != entry['output_hashes'][name]:
+                return False
+        return True
+
+    def start(self, fpath, input_hash=None):
+        with self.lock:
+            self.files[os.path.abspath(fpath)] = {
+                'status': 'running',
+                'input_hash': input_hash or file_hash(fpath),
+                'outputs': {},
+                'output_hashes': {},
+                'num_pages': None,
+                'updated': time.time(),
+            }
+            self.save()
+
+    def finish(self, fpath, outputs, num_pages=None):
+        """
+        Args:
+            outputs (dict): Output paths keyed by output type (json, markdown, ...), hashed now.
+            num_pages (int, optional): Number of processed pages.
+        """
+        output_hashes = {name: file_hash(path) for name, path in outputs.items()}
+        with self.lock:
+            entry = self.files[os.path.abspath(fpath)]
+            entry.update(
+                status='done',
+                outputs=dict(outputs),
+                output_hashes=output_hashes,
+                num_pages=num_pages,
+                updated=time.time(),
+            )
+            entry.pop('error', None)
+            self.save()
+
+    def is_failed(self, fpath, input_hash=None):
+        """
+        Check if an input file failed in a previous run and did not change since.
+        """
+        entry = self.entry(fpath)
+        if entry is None or entry['status'] != 'failed':
+            return False
+        return entry['input_hash'] == (input_hash or file_hash(fpath))
+
+    def fail(self, fpath, error):
+        with self.lock:
+            # the file can fail before it is started, e.g. when it can not be read
+            entry = self.files.setdefault(os.path.abspath(fpath), {
+                'input_hash': None,
+                'outputs': {},
+                'output_hashes': {},
+                'num_pages': None,
+            })
+            entry.update(status='failed', error=str(error), updated=time.time())
+            self.save()
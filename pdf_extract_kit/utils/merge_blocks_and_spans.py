@@ -2,66 +2,41 @@
 # from fast_langdetect import detect_language
 # import unicodedata
 import re
+import math
 
+import numpy as np
 
-def __is_overlaps_y_exceeds_threshold(bbox1, bbox2, overlap_ratio_threshold=0.8):
-    """检查两个bbox在y轴上是否有重叠，并且该重叠区域的高度占两个bbox高度更低的那个超过80%"""
-    _, y0_1, _, y1_1 = bbox1
-    _, y0_2, _, y1_2 = bbox2
+from pdf_extract_kit.utils.geometry import (
+    as_bboxes,
+    group_lines,
+    line_bboxes,
+    pairwise_overlap_ratio,
+    sort_lines_left_to_right
+)
 
-    overlap = max(0, min(y1_1, y1_2) - max(y0_1, y0_2))
-    height1, height2 = y1_1 - y0_1, y1_2 - y0_2
-    max_height = max(height1, height2)
-    min_height = min(height1, height2)
-
-    return (overlap / min_height) > overlap_ratio_threshold
 
 def merge_spans_to_line(spans):
     if len(spans) == 0:
         return []
     else:
-        # 按照y0坐标排序
-        spans.sort(key=lambda span: span['bbox'][1])
-
-        lines = []
-        current_line = [spans[0]]
-        for span in spans[1:]:
-            # 如果当前的span类型为"isolated" 或者 当前行中已经有"isolated"
-            # image和table类型，同上
-            if span['type'] in ['isolated'] or any(
-                    s['type'] in ['isolated'] for s in
-                    current_line):
-                # 则开始新行
-                lines.append(current_line)
-                current_line = [span]
-                continue
-
-            # 如果当前的span与当前行的最后一个span在y轴上重叠，则添加到当前行
-            if __is_overlaps_y_exceeds_threshold(span['bbox'], current_line[-1]['bbox']):
-                current_line.append(span)
-            else:
-                # 否则，开始新行
-                lines.append(current_line)
-                current_line = [span]
-
-        # 添加最后一行
-        if current_line:
-            lines.append(current_line)
-
+        # 按照y0坐标排序, y轴重叠的相邻span合并成行, "isolated"公式单独成行
+        lines = group_lines([span['bbox'] for span in spans],
+                            isolated=[span['type'] in ['isolated'] for span in spans])
+        lines = [[spans[idx] for idx in line] for line in lines]
+        spans[:] = [span for line in lines for span in line]
         return lines
 
 # 将每一个line中的span从左到右排序
 def line_sort_spans_by_left_to_right(lines):
+    if len(lines) == 0:
+        return []
+    line_spans = [span for line in lines for span in line]
+    bboxes = [span['bbox'] for span in line_spans]
+    # 按照x0坐标排序
+    line_indexes = sort_lines_left_to_right(bboxes, np.split(np.arange(len(line_spans)), np.cumsum([len(line) for line in lines])[:-1]))
     line_objects = []
-    for line in lines:
-        # 按照x0坐标排序
-        line.sort(key=lambda span: span['bbox'][0])
-        line_bbox = [
-            min(span['bbox'][0] for span in line),  # x0
-            min(span['bbox'][1] for span in line),  # y0
-            max(span['bbox'][2] for span in line),  # x1
-            max(span['bbox'][3] for span in line),  # y1
-        ]
+    for line, indexes, line_bbox in zip(lines, line_indexes, line_bboxes(bboxes, line_indexes).tolist()):
+        line[:] = [line_spans[idx] for idx in indexes]
         line_objects.append({
             "bbox": line_bbox,
             "spans": line,
@@ -87,26 +62,78 @@ def fix_interline_block(block):
     del block['spans']
     return block
 
-def calculate_overlap_area_in_bbox1_area_ratio(bbox1, bbox2):
+class SpanGrid:
     """
-    计算box1和box2的重叠面积占bbox1的比例
+    Uniform grid index over span bboxes.
+
+    The cells are as large as the median span, each span is registered in the cells its bbox covers,
+    so a block only tests the spans of the cells it covers instead of all the spans of the page.
+    The (cell, span) pairs are kept sorted by cell id, the cells of a column of the grid are contiguous.
     """
-    # Determine the coordinates of the intersection rectangle
-    x_left = max(bbox1[0], bbox2[0])
-    y_top = max(bbox1[1], bbox2[1])
-    x_right = min(bbox1[2], bbox2[2])
-    y_bottom = min(bbox1[3], bbox2[3])
-
-    if x_right < x_left or y_bottom < y_top:
-        return 0.0
-
-    # The area of overlap area
-    intersection_area = (x_right - x_left) * (y_bottom - y_top)
-    bbox1_area = (bbox1[2]-bbox1[0])*(bbox1[3]-bbox1[1])
-    if bbox1_area == 0:
-        return 0
-    else:
-        return intersection_area / bbox1_area
+    # spans covering more cells than this (or with non finite coordinates) are tested against every block
+    MAX_CELLS_PER_SPAN = 1024
+    # as are spans farther than this number of cells from the origin, so that cell ids fit in int64
+    MAX_CELL_COORD = 1 << 24
+
+    def __init__(self, bboxes):
+        bboxes = np.sort(np.asarray(bboxes, dtype=np.float64).reshape(-1, 2, 2), axis=1).reshape(-1, 4)
+        self.num_spans = len(bboxes)
+        self.large = np.arange(self.num_spans)
+        self.cell_ids = np.zeros(0, dtype=np.int64)
+        if not self.num_spans:
+            return
+        sizes = np.sort(bboxes[:, 2:] - bboxes[:, :2], axis=0)[self.num_spans // 2]
+        self.cell_w, self.cell_h = (max(float(size), 1) if math.isfinite(size) else 1 for size in sizes)
+        with np.errstate(invalid='ignore', over='ignore'):
+            cell_ranges = np.floor(bboxes / [self.cell_w, self.cell_h, self.cell_w, self.cell_h])
+            small = (np.abs(cell_ranges) <= self.MAX_CELL_COORD).all(axis=1)
+        cell_ranges = cell_ranges[small].astype(np.int64)
+        num_rows = cell_ranges[:, 3] - cell_ranges[:, 1] + 1
+        num_cells = (cell_ranges[:, 2] - cell_ranges[:, 0] + 1) * num_rows
+        small[small] = num_cells <= self.MAX_CELLS_PER_SPAN
+        self.large = np.flatnonzero(~small)
+        cell_ranges, num_rows, num_cells = (array[num_cells <= self.MAX_CELLS_PER_SPAN] for array in (cell_ranges, num_rows, num_cells))
+        if not len(cell_ranges):
+            return
+        self.origin = cell_ranges[:, :2].min(axis=0)
+        self.shape = cell_ranges[:, 2:].max(axis=0) - self.origin + 1
+        cell_ranges -= np.tile(self.origin, 2)
+        # 枚举每个span覆盖的cell
+        owners = np.repeat(np.arange(len(cell_ranges)), num_cells)
+        offsets = np.arange(len(owners)) - np.repeat(np.cumsum(num_cells) - num_cells, num_cells)
+        cx = cell_ranges[owners, 0] + offsets // num_rows[owners]
+        cy = cell_ranges[owners, 1] + offsets % num_rows[owners]
+        cell_ids = cx * self.shape[1] + cy
+        order = np.argsort(cell_ids, kind='stable')
+        self.cell_ids = cell_ids[order]
+        self.cell_spans = np.flatnonzero(small)[owners[order]]
+
+    def query(self, bbox):
+        """
+        Returns:
+            np.ndarray: Sorted indexes of the spans which may overlap bbox, a superset of the overlapping spans.
+        """
+        x0, x1 = min(bbox[0], bbox[2]), max(bbox[0], bbox[2])
+        y0, y1 = min(bbox[1], bbox[3]), max(bbox[1], bbox[3])
+        if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+            return np.arange(self.num_spans)
+        if not len(self.cell_ids):
+            return self.large
+        # cells outside of the grid are empty
+        cx0 = max(math.floor(x0 / self.cell_w) - self.origin[0], 0)
+        cy0 = max(math.floor(y0 / self.cell_h) - self.origin[1], 0)
+        cx1 = min(math.floor(x1 / self.cell_w) - self.origin[0], self.shape[0] - 1)
+        cy1 = min(math.floor(y1 / self.cell_h) - self.origin[1], self.shape[1] - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return self.large
+        columns = np.arange(cx0, cx1 + 1) * self.shape[1]
+        starts = np.searchsorted(self.cell_ids, columns + cy0)
+        ends = np.searchsorted(self.cell_ids, columns + cy1, side='right')
+        return np.unique(np.concatenate([self.large] + [self.cell_spans[start:end] for start, end in zip(starts.tolist(), ends.tolist())]))
+
+
+# span x block对数超过此值时使用网格索引, 否则一次计算全部重叠比例
+MAX_DENSE_PAIRS = 1 << 18
 
 def fill_spans_in_blocks(blocks, spans, radio):
     '''
@@ -127,11 +154,6 @@ def fill_spans_in_blocks(blocks, spans, radio):
             'bbox': block_bbox,
             'saved_info': block
         }
-        block_spans = []
-        for span in spans:
-            span_bbox = span["bbox"]
-            if calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > radio:
-                block_spans.append(span)
 
         '''行内公式调整, 高度调整至与同行文字高度一致(优先左侧, 其次右侧)'''
         # displayed_list = []
@@ -144,13 +166,38 @@ def fill_spans_in_blocks(blocks, spans, radio):
         '''bbox去除粘连'''  # 去粘连会影响span的bbox，导致后续fill的时候出错
         # block_spans = remove_overlap_between_bbox_for_span(block_spans)
 
-        block_dict['spans'] = block_spans
+        block_dict['spans'] = []
         block_with_spans.append(block_dict)
 
-        # 从spans删除已经放入block_spans中的span
-        if len(block_spans) > 0:
-            for span in block_spans:
-                spans.remove(span)
+    if not block_with_spans or not spans:
+        return block_with_spans, spans
+
+    # 每个span放入第一个重叠比例 > radio 的block(与按block顺序逐一比较、删除的结果相同)
+    span_bboxes = [span["bbox"] for span in spans]
+    if radio >= 0 and len(spans) * len(block_with_spans) > MAX_DENSE_PAIRS:
+        # 大页面: 重叠比例 > radio >= 0 需要span与block相交, 每个block只计算网格中附近未分配span的重叠比例
+        span_bboxes = as_bboxes(span_bboxes)
+        grid = SpanGrid(span_bboxes)
+        assigned = np.zeros(len(spans), dtype=bool)
+        for block_dict in block_with_spans:
+            candidates = grid.query(block_dict['bbox'])
+            candidates = candidates[~assigned[candidates]]
+            if not len(candidates):
+                continue
+            candidates = candidates[pairwise_overlap_ratio(span_bboxes[candidates], [block_dict['bbox']])[:, 0] > radio]
+            assigned[candidates] = True
+            block_dict['spans'].extend(spans[idx] for idx in candidates.tolist())
+    else:
+        # 一次计算所有span与block的重叠比例
+        overlaps = pairwise_overlap_ratio(span_bboxes, [block['bbox'] for block in block_with_spans]) > radio
+        assigned = overlaps.any(axis=1)
+        owners = overlaps.argmax(axis=1)
+        for idx in np.flatnonzero(assigned):
+            block_with_spans[owners[idx]]['spans'].append(spans[idx])
+
+    # 从spans删除已经放入block_spans中的span
+    if assigned.any():
+        spans[:] = [span for span, span_assigned in zip(spans, assigned) if not span_assigned]
 
     return block_with_spans, spans
 
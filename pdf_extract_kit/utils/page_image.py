@@ -0,0 +1,84 @@
+import numpy as np
+from PIL import Image
+
+
+class PageImage:
+    """
+    RGB page image backed by a single numpy buffer.
+
+    The buffer can be the samples of a fitz.Pixmap, shared without copy. The BGR array (the input
+    format of the OpenCV based models) and the PIL image are only built when a consumer asks for them,
+    and are built once.
+    """
+    def __init__(self, rgb, owner=None, pil=None):
+        """
+        Args:
+            rgb (np.ndarray): uint8 array of shape (height, width, 3).
+            owner (optional): Object owning the memory of rgb, kept alive as long as the page image.
+            pil (PIL.Image.Image, optional): PIL image with the same content, if already available.
+        """
+        self.rgb = rgb
+        self._owner = owner
+        self._bgr = None
+        self._pil = pil
+
+    @classmethod
+    def from_pixmap(cls, pix):
+        """Wrap the samples of an RGB fitz.Pixmap without copying them."""
+        rgb = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        return cls(rgb, owner=pix)
+
+    @classmethod
+    def from_pil(cls, image):
+        image = image.convert("RGB")
+        return cls(np.asarray(image), pil=image)
+
+    @property
+    def width(self):
+        return self.rgb.shape[1]
+
+    @property
+    def height(self):
+        return self.rgb.shape[0]
+
+    @property
+    def size(self):
+        """(width, height), same as PIL.Image.Image.size."""
+        return self.width, self.height
+
+    @property
+    def bgr(self):
+        """Contiguous BGR array, computed on first access."""
+        if self._bgr is None:
+            self._bgr = np.ascontiguousarray(self.rgb[:, :, ::-1])
+        return self._bgr
+
+    @property
+    def pil(self):
+        """PIL image of the page, computed on first access."""
+        if self._pil is None:
+            self._pil = Image.fromarray(self.rgb)
+        return self._pil
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is not None and dtype != self.rgb.dtype:
+            return self.rgb.astype(dtype)
+        return self.rgb.copy() if copy else self.rgb
+
+    def __getstate__(self):
+        # the owner (e.g. a fitz.Pixmap) can not be pickled, send the samples themselves
+        return {'rgb': np.ascontiguousarray(self.rgb), '_owner': None, '_bgr': None, '_pil': None}
+
+
+def to_bgr(image):
+    """
+    Convert an image path, PIL.Image.Image, PageImage or (already BGR) np.ndarray to a BGR array.
+    """
+    if isinstance(image, PageImage):
+        return image.bgr
+    if isinstance(image, Image.Image):
+        return np.ascontiguousarray(np.asarray(image.convert("RGB"))[:, :, ::-1])
+    if isinstance(image, str):
+        import cv2
+        return cv2.imread(image)
+    return image
@@ -0,0 +1,409 @@
+import json
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+try:
+    from json.encoder import c_encode_basestring as _encode_str
+except ImportError:
+    from json.encoder import py_encode_basestring as _encode_str
+if _encode_str is None:
+    from json.encoder import py_encode_basestring as _encode_str
+
+
+# keys of a detection stored in columns, the other keys are kept as they are
+_CATEGORY, _POLY, _SCORE, _TEXT, _EXTRA = range(5)
+_TEXT_KEYS = ('text', 'latex')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _indent_json(text, prefix):
+    return text.replace('\n', '\n' + prefix)
+
+
+class LayoutDets(Sequence):
+    """
+    Read only list view of the detections of a PageResult, each item is a new dict in the usual format:
+    {'category_type', 'poly', 'score'} and 'text' or 'latex'. Changing an item does not change the result.
+    """
+    def __init__(self, page_result):
+        self.page_result = page_result
+
+    def __len__(self):
+        return self.page_result.num_dets
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self.page_result.det(i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("detection index out of range")
+        return self.page_result.det(idx)
+
+    def __iter__(self):
+        return self.page_result.iter_dets()
+
+    def __eq__(self, other):
+        return isinstance(other, (list, LayoutDets)) and list(self) == list(other)
+
+    def __repr__(self):
+        return f"LayoutDets({len(self)} detections)"
+
+
+class PageResult(Mapping):
+    """
+    Columnar result of one page.
+
+    The detections are stored in NumPy columns instead of one dict per detection: polys (N, 8) float64 (and which
+    coordinates are ints), scores (N,) float64, category codes (N,) into `categories`, and the texts (ocr text or
+    formula latex) concatenated in one buffer indexed by `text_offsets`. Keys of a detection which do not fit the
+    columns are kept as they are, and the key order of each detection is kept, so `to_dict` gives back the
+    dict it was built from.
+
+    A PageResult is a read only mapping like the dict result of a page: `page['layout_dets']` is a list view
+    building the detection dicts on access, `page['page_info']` the page info. `to_json` serializes it like
+    `json.dumps(page.to_dict(), ensure_ascii=False, indent=indent)`, without building the dicts.
+
+    Example:
+        >>> page = PageResult.from_dict({'layout_dets': [...], 'page_info': {...}})
+        >>> page.bboxes()  # (N, 4) [xmin, ymin, xmax, ymax]
+        >>> for det in page['layout_dets']:
+        ...     print(det['category_type'], det['poly'])
+    """
+    def __init__(self, polys, poly_int, scores, category_codes, categories, text_buffer, text_offsets,
+                 schema_codes, schemas, extras=None, fields=None):
+        """
+        Args:
+            polys (np.ndarray): (N, 8) float64 polygons.
+            poly_int (np.ndarray): (N, 8) bool, coordinates which are ints.
+            scores (np.ndarray): (N,) float64 scores.
+            category_codes (np.ndarray): (N,) int16 indexes into categories.
+            categories (list): Category names.
+            text_buffer (str): Texts of the detections, concatenated.
+            text_offsets (np.ndarray): (N + 1,) int64, text of detection i is text_buffer[text_offsets[i]:text_offsets[i + 1]].
+            schema_codes (np.ndarray): (N,) int16 indexes into schemas.
+            schemas (list): Key order of the detections, tuples of (key, column).
+            extras (dict): Keys which are not in a column, keyed by detection index.
+            fields (dict): Page keys other than layout_dets (page_info, ...), layout_dets keeps its position with a None value.
+        """
+        self.polys = polys
+        self.poly_int = poly_int
+        self.scores = scores
+        self.category_codes = category_codes
+        self.categories = list(categories)
+        self.text_buffer = text_buffer
+        self.text_offsets = text_offsets
+        self.schema_codes = schema_codes
+        self.schemas = list(schemas)
+        self.extras = extras or {}
+        self.fields = fields if fields is not None else {'layout_dets': None}
+
+    @classmethod
+    def from_dict(cls, page_res):
+        """
+        Args:
+            page_res (dict): Result of one page: {'layout_dets': [...], 'page_info': {...}}.
+
+        Returns:
+            PageResult: Columnar copy of the result, page_res is returned as is if it is already a PageResult.
+        """
+        if isinstance(page_res, PageResult):
+            return page_res
+        dets = page_res.get('layout_dets', [])
+        num_dets = len(dets)
+        polys = np.zeros((num_dets, 8), dtype=np.float64)
+        poly_int = np.zeros((num_dets, 8), dtype=bool)
+        scores = np.zeros(num_dets, dtype=np.float64)
+        category_codes = np.full(num_dets, -1, dtype=np.int16)
+        schema_codes = np.zeros(num_dets, dtype=np.int16)
+        text_offsets = np.zeros(num_dets + 1, dtype=np.int64)
+        categories, category_index = [], {}
+        schemas, schema_index = [], {}
+        texts, extras = [], {}
+        offset = 0
+        for idx, det in enumerate(dets):
+            schema = []
+            has_text = False
+            for key, value in det.items():
+                if key == 'category_type' and isinstance(value, str):
+                    if value not in category_index:
+                        category_index[value] = len(categories)
+                        categories.append(value)
+                    category_codes[idx] = category_index[value]
+                    schema.append((key, _CATEGORY))
+                elif key == 'poly' and isinstance(value, list) and len(value) == 8 and all(_is_number(v) for v in value):
+                    polys[idx] = value
+                    poly_int[idx] = [isinstance(v, int) for v in value]
+                    schema.append((key, _POLY))
+                elif key == 'score' and isinstance(value, float):
+                    scores[idx] = value
+                    schema.append((key, _SCORE))
+                elif key in _TEXT_KEYS and isinstance(value, str) and not has_text:
+                    texts.append(value)
+                    offset += len(value)
+                    has_text = True
+                    schema.append((key, _TEXT))
+                else:
+                    extras.setdefault(idx, {})[key] = value
+                    schema.append((key, _EXTRA))
+            text_offsets[idx + 1] = offset
+            schema = tuple(schema)
+            if schema not in schema_index:
+                schema_index[schema] = len(schemas)
+                schemas.append(schema)
+            schema_codes[idx] = schema_index[schema]
+        fields = {key: (None if key == 'layout_dets' else value) for key, value in page_res.items()}
+        return cls(polys, poly_int, scores, category_codes, categories, ''.join(texts), text_offsets,
+                   schema_codes, schemas, extras=extras, fields=fields)
+
+    @property
+    def num_dets(self):
+        return len(self.polys)
+
+    @property
+    def nbytes(self):
+        """Approximate memory of the result in bytes: columns and text buffer, the extras are not counted."""
+        columns = [self.polys, self.poly_int, self.scores, self.category_codes, self.text_offsets, self.schema_codes]
+        return sum(column.nbytes for column in columns) + len(self.text_buffer.encode('utf-8'))
+
+    def category_names(self):
+        """
+        Returns:
+            np.ndarray: (N,) category name of each detection.
+        """
+        return np.asarray(self.categories + [''], dtype=object)[self.category_codes]
+
+    def bboxes(self):
+        """
+        Returns:
+            np.ndarray: (N, 4) [xmin, ymin, xmax, ymax] of the detections (poly points 0 and 2).
+        """
+        return self.polys[:, [0, 1, 4, 5]]
+
+    def text(self, idx):
+        return self.text_buffer[self.text_offsets[idx]:self.text_offsets[idx + 1]]
+
+    def fill_texts(self, indexes, texts):
+        """
+        Replace the texts of detections, e.g. the latex of formulas recognized after the page result was built.
+
+        Args:
+            indexes (list): Indexes of detections with a text ('text' or 'latex').
+            texts (list): New text of each of these detections.
+        """
+        has_text = np.array([any(column == _TEXT for _, column in schema) for schema in self.schemas] + [False])
+        assert has_text[self.schema_codes[indexes]].all(), "detections without text can not be filled"
+        text_offsets = self.text_offsets.tolist()
+        buffer = self.text_buffer
+        page_texts = [buffer[start:end] for start, end in zip(text_offsets[:-1], text_offsets[1:])]
+        for idx, text in zip(indexes, texts):
+            page_texts[idx] = text
+        self.text_buffer = ''.join(page_texts)
+        self.text_offsets = np.zeros(self.num_dets + 1, dtype=np.int64)
+        self.text_offsets[1:] = np.cumsum([len(text) for text in page_texts], dtype=np.int64)
+
+    def text_keys(self):
+        """
+        Returns:
+            list: Key of the text of each detection ('text' or 'latex'), None for the detections without text.
+        """
+        schema_keys = [dict((column, key) for key, column in schema).get(_TEXT) for schema in self.schemas]
+        return [schema_keys[code] for code in self.schema_codes.tolist()]
+
+    def has_score(self):
+        """
+        Returns:
+            np.ndarray: (N,) bool, detections with a score.
+        """
+        schema_has_score = np.array([any(column == _SCORE for _, column in schema) for schema in self.schemas] + [False])
+        return schema_has_score[self.schema_codes]
+
+    def _poly_list(self, poly, poly_int):
+        return [int(v) if is_int else v for v, is_int in zip(poly, poly_int)]
+
+    def det(self, idx):
+        """
+        Returns:
+            dict: Detection idx in the usual dict format.
+        """
+        return self._det(idx, self.polys[idx].tolist(), self.poly_int[idx].tolist())
+
+    def _det(self, idx, poly, poly_int):
+        det = {}
+        for key, column in self.schemas[self.schema_codes[idx]]:
+            if column == _CATEGORY:
+                det[key] = self.categories[self.category_codes[idx]]
+            elif column == _POLY:
+                det[key] = self._poly_list(poly, poly_int)
+            elif column == _SCORE:
+                det[key] = float(self.scores[idx])
+            elif column == _TEXT:
+                det[key] = self.text(idx)
+            else:
+                det[key] = self.extras[idx][key]
+        return det
+
+    def iter_dets(self):
+        polys, poly_int = self.polys.tolist(), self.poly_int.tolist()
+        for idx in range(self.num_dets):
+            yield self._det(idx, polys[idx], poly_int[idx])
+
+    def __getitem__(self, key):
+        if key == 'layout_dets' and key in self.fields:
+            return LayoutDets(self)
+        return self.fields[key]
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return f"PageResult({self.num_dets} detections, {dict((k, v) for k, v in self.fields.items() if k != 'layout_dets')})"
+
+    def to_dict(self):
+        return {key: (list(self.iter_dets()) if key == 'layout_dets' else value) for key, value in self.fields.items()}
+
+    def to_json(self, indent=None, level=0):
+        """
+        Serialize the page like `json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)`.
+
+        Args:
+            indent (int, optional): Indentation of the JSON, None for a single line.
+            level (int): Indentation level of the page, when it is an item of a JSON list.
+
+        Returns:
+            str: JSON of the page.
+        """
+        if indent is None:
+            sep, open_pad, close_pad = ', ', '', ''
+        else:
+            open_pad = '\n' + ' ' * (indent * (level + 1))
+            close_pad = '\n' + ' ' * (indent * level)
+            sep = ',' + open_pad
+        parts = []
+        for key, value in self.fields.items():
+            if key == 'layout_dets':
+                value_json = self._dets_json(indent, level + 1)
+            else:
+                value_json = json.dumps(value, ensure_ascii=False, indent=indent)
+                if indent is not None:
+                    value_json = _indent_json(value_json, ' ' * (indent * (level + 1)))
+            parts.append(f"{_encode_str(key)}: {value_json}")
+        if not parts:
+            return '{}'
+        return '{' + open_pad + sep.join(parts) + close_pad + '}'
+
+    def _dets_json(self, indent, level):
+        if self.num_dets == 0:
+            return '[]'
+        if indent is None:
+            det_open = det_close = key_open = poly_open = poly_close = ''
+            det_sep = key_sep = poly_sep = ', '
+            extra_pad = None
+        else:
+            det_open = '\n' + ' ' * (indent * (level + 1))
+            det_close = '\n' + ' ' * (indent * level)
+            det_sep = ',' + det_open
+            key_open = '\n' + ' ' * (indent * (level + 2))
+            key_sep = ',' + key_open
+            poly_open = '\n' + ' ' * (indent * (level + 3))
+            poly_close = key_open
+            poly_sep = ',' + poly_open
+            extra_pad = ' ' * (indent * (level + 2))
+
+        # one %-template per key order, filled with the JSON of the values of each detection
+        templates = []
+        for schema in self.schemas:
+            if schema:
+                poly_value = '[' + poly_open + '%s' + poly_close + ']'
+                parts = [_encode_str(key).replace('%', '%%') + ': ' + (poly_value if column == _POLY else '%s') for key, column in schema]
+                templates.append('{' + key_open + key_sep.join(parts) + (det_open if indent is not None else '') + '}')
+            else:
+                templates.append('{}')
+        categories = [_encode_str(name) for name in self.categories]
+        category_codes = self.category_codes.tolist()
+        text_offsets, text_buffer = self.text_offsets.tolist(), self.text_buffer
+        # the numbers of a column are formatted by one call of the json encoder, then split into one string per detection
+        # (numbers contain neither ',' nor brackets)
+        scores = json.dumps(self.scores.tolist())[1:-1].split(', ')
+        polys = [None] * self.num_dets
+        # most polys are rectangles [x0, y0, x1, y0, x1, y1, x0, y1] of float coordinates, only 4 of them are formatted
+        bits = np.ascontiguousarray(self.polys, dtype=np.float64).view(np.int64)
+        is_rect = ~self.poly_int.any(axis=1) & (bits[:, 0] == bits[:, 6]) & (bits[:, 1] == bits[:, 3]) & \
+            (bits[:, 2] == bits[:, 4]) & (bits[:, 5] == bits[:, 7])
+        rect_rows = np.flatnonzero(is_rect).tolist()
+        if rect_rows:
+            values = json.dumps(self.polys[is_rect][:, [0, 1, 2, 5]].ravel().tolist())[1:-1].split(', ')
+            template = poly_sep.join(['%s'] * 8)
+            for idx, x0, y0, x1, y1 in zip(rect_rows, values[0::4], values[1::4], values[2::4], values[3::4]):
+                polys[idx] = template % (x0, y0, x1, y0, x1, y1, x0, y1)
+        other_rows = np.flatnonzero(~is_rect).tolist()
+        if other_rows:
+            others = self.polys[~is_rect].tolist()
+            poly_int = self.poly_int[~is_rect]
+            all_int = poly_int.all(axis=1)
+            for idx in np.flatnonzero(all_int).tolist():
+                others[idx] = list(map(int, others[idx]))
+            for idx in np.flatnonzero(poly_int.any(axis=1) & ~all_int).tolist():
+                others[idx] = [int(v) if is_int else v for v, is_int in zip(others[idx], poly_int[idx].tolist())]
+            for idx, poly in zip(other_rows, json.dumps(others, separators=(poly_sep, ': '))[2:-2].split(']' + poly_sep + '[')):
+                polys[idx] = poly
+
+        # the detections are formatted column by column, for the detections of each key order
+        dets_json = [None] * self.num_dets
+        for schema_code, schema in enumerate(self.schemas):
+            rows = np.flatnonzero(self.schema_codes == schema_code).tolist()
+            if not schema:
+                for idx in rows:
+                    dets_json[idx] = '{}'
+                continue
+            columns = []
+            for key, column in schema:
+                if column == _CATEGORY:
+                    columns.append([categories[category_codes[idx]] for idx in rows])
+                elif column == _POLY:
+                    columns.append([polys[idx] for idx in rows])
+                elif column == _SCORE:
+                    columns.append([scores[idx] for idx in rows])
+                elif column == _TEXT:
+                    columns.append([_encode_str(text_buffer[text_offsets[idx]:text_offsets[idx + 1]]) for idx in rows])
+                else:
+                    values = [json.dumps(self.extras[idx][key], ensure_ascii=False, indent=indent) for idx in rows]
+                    columns.append([_indent_json(value, extra_pad) for value in values] if extra_pad is not None else values)
+            template = templates[schema_code]
+            for idx, values in zip(rows, zip(*columns)):
+                dets_json[idx] = template % values
+        return '[' + det_open + det_sep.join(dets_json) + det_close + ']'
+
+def dumps_json(results, indent=2):
+    """
+    Serialize results like `json.dumps(results, ensure_ascii=False, indent=indent)`, PageResult included.
+
+    Args:
+        results: PageResult, list of the page results of a document (dicts or PageResult), or any JSON value.
+
+    Returns:
+        str: JSON of the results.
+    """
+    if isinstance(results, PageResult):
+        return results.to_json(indent=indent)
+    if not isinstance(results, list) or not any(isinstance(page, PageResult) for page in results):
+        return json.dumps(results, ensure_ascii=False, indent=indent)
+    if not results:
+        return '[]'
+    if indent is None:
+        return '[' + ', '.join(dumps_json(page, indent=None) for page in results) + ']'
+    pad = ' ' * indent
+    pages_json = []
+    for page in results:
+        if isinstance(page, PageResult):
+            pages_json.append(page.to_json(indent=indent, level=1))
+        else:
+            pages_json.append(_indent_json(json.dumps(page, ensure_ascii=False, indent=indent), pad))
+    return '[\n' + pad + (',\n' + pad).join(pages_json) + '\n]'
@@ -1,5 +1,6 @@
-from pdf2image import convert_from_path
+from pdf_extract_kit.utils.data_preprocess import load_pdf as load_pdf_pages
 
-def load_pdf(pdf_path):
-    images = convert_from_path(pdf_path)
-    return images
+
+def load_pdf(pdf_path, dpi=144, backend='pdf2image'):
+    """Rasterize all pages with poppler, kept for compatibility, see `data_preprocess.open_pdf` for the lazy page source."""
+    return load_pdf_pages(pdf_path, dpi=dpi, backend=backend)
@@ -0,0 +1,212 @@
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+class Stage:
+    """
+    One stage of a Pipeline: a function applied to every item, by its own pool of workers.
+    """
+    def __init__(self, name, fn, num_workers=1, kind='thread'):
+        """
+        Args:
+            name (str): Name of the stage, used in the statistics.
+            fn (callable): Takes an item of the previous stage, returns the item of the next stage.
+            num_workers (int): Number of items processed concurrently.
+            kind (str): 'thread' runs fn in worker threads (I/O, post-processing, models releasing the GIL),
+                'process' runs fn in a pool of num_workers processes (CPU-bound python code), fn and the items must be picklable.
+        """
+        assert kind in ('thread', 'process'), f"unknown stage kind: {kind}"
+        self.name = name
+        self.fn = fn
+        self.num_workers = max(num_workers, 1)
+        self.kind = kind
+
+
+class _StageStats:
+    def __init__(self):
+        self.processed = 0
+        self.busy_time = 0.0
+        self.max_queue_depth = 0
+
+
+class Pipeline:
+    """
+    Stage-graph executor: each stage runs on its own workers, stages are connected by bounded queues.
+
+    Items flow through the stages concurrently, e.g. the pages of the next document are rasterized while the
+    pages of the current one are detected and the ones of the previous document are recognized. Bounded queues
+    keep the number of items in flight (and their memory) bounded, a slow stage blocks the stages before it.
+    `stats` reports the queue depth and throughput of each stage, the bottleneck is the stage with full input
+    queue and busy workers.
+
+    Example:
+        >>> pipeline = Pipeline([Stage("render", render), Stage("detect", detect, num_workers=4)], queue_size=8)
+        >>> for result in pipeline.run(pages):
+        ...     save(result)
+        >>> print(pipeline.format_stats())
+    """
+    _STOP = object()
+
+    def __init__(self, stages, queue_size=8):
+        """
+        Args:
+            stages (list): Stages, in order.
+            queue_size (int): Maximum number of items waiting in front of each stage.
+        """
+        self.stages = stages
+        self.queue_size = max(queue_size, 1)
+        self.queues = []
+        self.stage_stats = {}
+        self.start_time = None
+        self.end_time = None
+
+    def _put(self, q, item):
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return self._STOP
+
+    def _feed(self, inputs):
+        try:
+            for seq, item in enumerate(inputs):
+                if not self._put(self.queues[0], (seq, item)):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        self._put(self.queues[0], self._STOP)
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._abort.set()
+
+    def _work(self, idx, pool):
+        stage = self.stages[idx]
+        stats = self.stage_stats[stage.name]
+        in_queue, out_queue = self.queues[idx], self.queues[idx + 1]
+        while True:
+            stats.max_queue_depth = max(stats.max_queue_depth, in_queue.qsize())
+            entry = self._get(in_queue)
+            if entry is self._STOP:
+                # let the other workers of the stage see the end too
+                self._put(in_queue, self._STOP)
+                break
+            seq, item = entry
+            start = time.time()
+            try:
+                if pool is not None:
+                    result = pool.submit(stage.fn, item).result()
+                else:
+                    result = stage.fn(item)
+            except BaseException as e:
+                self._fail(e)
+                break
+            with self._lock:
+                stats.processed += 1
+                stats.busy_time += time.time() - start
+            if not self._put(out_queue, (seq, result)):
+                break
+        with self._lock:
+            self._running[idx] -= 1
+            last_worker = self._running[idx] == 0
+        if last_worker:
+            self._put(out_queue, self._STOP)
+
+    def run(self, inputs):
+        """
+        Run the stages on the inputs.
+
+        Args:
+            inputs (iterable): Items of the first stage, consumed lazily in a feeder thread.
+
+        Yields:
+            The items returned by the last stage, in input order. An exception raised by a stage stops
+            the pipeline and is raised here.
+        """
+        self.queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        self.stage_stats = {stage.name: _StageStats() for stage in self.stages}
+        self._abort = threading.Event()
+        self._lock = threading.Lock()
+        self._error = None
+        self._running = [stage.num_workers for stage in self.stages]
+        self.start_time, self.end_time = time.time(), None
+
+        pools = [ProcessPoolExecutor(max_workers=stage.num_workers) if stage.kind == 'process' else None for stage in self.stages]
+        threads = [threading.Thread(target=self._feed, args=(inputs,), name="pipeline_feeder", daemon=True)]
+        for idx, stage in enumerate(self.stages):
+            for worker_idx in range(stage.num_workers):
+                threads.append(threading.Thread(target=self._work, args=(idx, pools[idx]),
+                                                name=f"pipeline_{stage.name}_{worker_idx}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        # results come out of order when a stage has several workers, they are yielded in input order
+        reorder_buffer = {}
+        next_seq = 0
+        try:
+            while True:
+                entry = self._get(self.queues[-1])
+                if entry is self._STOP:
+                    break
+                seq, result = entry
+                reorder_buffer[seq] = result
+                while next_seq in reorder_buffer:
+                    yield reorder_buffer.pop(next_seq)
+                    next_seq += 1
+            if self._error is not None:
+                raise self._error
+        finally:
+            self._abort.set()
+            for thread in threads:
+                thread.join()
+            for pool in pools:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+            self.end_time = time.time()
+
+    def stats(self):
+        """
+        Statistics of the stages, also available while the pipeline runs.
+
+        Returns:
+            List[dict]: For each stage: name, workers, current and maximum depth of its input queue, number of
+                processed items, throughput (items/s over the run) and utilization (busy time over workers * run time).
+        """
+        if self.start_time is None:
+            return []
+        elapsed = max((self.end_time or time.time()) - self.start_time, 1e-9)
+        stats = []
+        for idx, stage in enumerate(self.stages):
+            stage_stats = self.stage_stats[stage.name]
+            stats.append({
+                'name': stage.name,
+                'workers': stage.num_workers,
+                'queue_depth': self.queues[idx].qsize() if self.end_time is None else 0,
+                'max_queue_depth': stage_stats.max_queue_depth,
+                'processed': stage_stats.processed,
+                'throughput': stage_stats.processed / elapsed,
+                'utilization': stage_stats.busy_time / (stage.num_workers * elapsed),
+            })
+        return stats
+
+    def format_stats(self):
+        """Statistics of the stages as a table, see `stats`."""
+        lines = [f"{'stage':<12}{'workers':>8}{'queue':>7}{'max queue':>10}{'items':>8}{'items/s':>10}{'util':>7}"]
+        for stage in self.stats():
+            lines.append(f"{stage['name']:<12}{stage['workers']:>8}{stage['queue_depth']:>7}{stage['max_queue_depth']:>10}"
+                         f"{stage['processed']:>8}{stage['throughput']:>10.2f}{stage['utilization']:>7.0%}")
+        return "\n".join(lines)
@@ -0,0 +1,229 @@
+import threading
+
+import fitz
+
+from pdf_extract_kit.registry import RASTERIZER_REGISTRY
+from pdf_extract_kit.utils.page_image import PageImage
+
+
+# Pages larger than this on either side at the requested dpi are rendered at 72 dpi instead.
+MAX_RENDER_SIZE = 3000
+
+# PyMuPDF and pdfium are not thread-safe, their calls are serialized so that a document can be
+# opened, rendered and closed from different threads (e.g. the stages of a pipeline).
+_pymupdf_lock = threading.RLock()
+_pdfium_lock = threading.RLock()
+
+
+def compute_render_dpi(page_width, page_height, dpi=144, target_size=None):
+    """
+    Compute the resolution a page is rendered at, before rendering it.
+
+    Args:
+        page_width (float): Page width in points.
+        page_height (float): Page height in points.
+        dpi (int): Requested resolution, falls back to 72 if the page would exceed MAX_RENDER_SIZE.
+        target_size (int, optional): Longest side of the rendered image in pixels, overrides dpi.
+
+    Returns:
+        float: The resolution to render the page at.
+    """
+    longest_side = max(page_width, page_height)
+    if target_size is not None:
+        return target_size / longest_side * 72
+    if longest_side * dpi / 72 > MAX_RENDER_SIZE:
+        return 72
+    return dpi
+
+
+class BaseRasterizer:
+    """
+    Interface of the PDF rasterizer backends, an instance wraps one opened PDF file.
+
+    Backends implement `__len__`, `page_size`, `render` and `close`; `load_page` applies the
+    resolution rules shared by all backends, so every entry point gets the same page images.
+    """
+    def __init__(self, pdf_path):
+        self.pdf_path = pdf_path
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def page_size(self, idx):
+        """
+        Returns:
+            tuple: (width, height) of the page at index idx, in points.
+        """
+        raise NotImplementedError
+
+    def render(self, idx, dpi):
+        """
+        Render the page at index idx.
+
+        Returns:
+            PageImage: RGB image of the page.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def get_words(self, idx):
+        """
+        Read the words of the page text layer.
+
+        Returns:
+            list or None: (x0, y0, x1, y1, text, block_no, line_no, word_no) tuples in points, None if the backend can not read the text layer.
+        """
+        return None
+
+    def load_page(self, idx, dpi, target_size=None):
+        """
+        Render the page at index idx once, at dpi or with its longest side equal to target_size.
+
+        Returns:
+            PageImage: RGB image of the page.
+        """
+        return self.render(idx, compute_render_dpi(*self.page_size(idx), dpi=dpi, target_size=target_size))
+
+
+@RASTERIZER_REGISTRY.register('pymupdf')
+class PyMuPDFRasterizer(BaseRasterizer):
+    def __init__(self, pdf_path):
+        super().__init__(pdf_path)
+        with _pymupdf_lock:
+            self.doc = fitz.open(pdf_path)
+
+    def __len__(self):
+        with _pymupdf_lock:
+            return len(self.doc)
+
+    def page_size(self, idx):
+        with _pymupdf_lock:
+            rect = self.doc[idx].rect
+        return rect.width, rect.height
+
+    def render(self, idx, dpi):
+        with _pymupdf_lock:
+            pix = self.doc[idx].get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72), alpha=False)
+        return PageImage.from_pixmap(pix)
+
+    def get_words(self, idx):
+        with _pymupdf_lock:
+            page = self.doc[idx]
+            words = page.get_text("words")
+            rotation, rotation_matrix = page.rotation, page.rotation_matrix
+        if rotation:
+            # words are given in the unrotated page, the rendered images are rotated
+            rotated_words = []
+            for x0, y0, x1, y1, *word_info in words:
+                rect = fitz.Rect(x0, y0, x1, y1) * rotation_matrix
+                rotated_words.append((rect.x0, rect.y0, rect.x1, rect.y1, *word_info))
+            words = rotated_words
+        return words
+
+    def close(self):
+        with _pymupdf_lock:
+            self.doc.close()
+
+
+@RASTERIZER_REGISTRY.register('pdf2image')
+class PDF2ImageRasterizer(BaseRasterizer):
+    """
+    Rasterizer based on poppler, every render call runs pdftoppm on a single page.
+
+    pdfinfo does not report the size of every page, so the resolution rules are applied
+    after rendering and through pdftoppm's own scaling.
+    """
+    def __init__(self, pdf_path):
+        from pdf2image import pdfinfo_from_path
+        super().__init__(pdf_path)
+        self.num_pages = pdfinfo_from_path(pdf_path)["Pages"]
+
+    def __len__(self):
+        return self.num_pages
+
+    def render(self, idx, dpi):
+        from pdf2image import convert_from_path
+        return PageImage.from_pil(convert_from_path(self.pdf_path, dpi=dpi, first_page=idx+1, last_page=idx+1)[0])
+
+    def load_page(self, idx, dpi, target_size=None):
+        from pdf2image import convert_from_path
+        if target_size is not None:
+            # pdftoppm scales the longest side of the page to target_size
+            return PageImage.from_pil(convert_from_path(self.pdf_path, size=target_size, first_page=idx+1, last_page=idx+1)[0])
+        image = self.render(idx, dpi)
+        if image.width > MAX_RENDER_SIZE or image.height > MAX_RENDER_SIZE:
+            image = self.render(idx, 72)
+        return image
+
+
+@RASTERIZER_REGISTRY.register('pypdfium2')
+class PdfiumRasterizer(BaseRasterizer):
+    def __init__(self, pdf_path):
+        import pypdfium2
+        super().__init__(pdf_path)
+        with _pdfium_lock:
+            self.doc = pypdfium2.PdfDocument(pdf_path)
+
+    def __len__(self):
+        with _pdfium_lock:
+            return len(self.doc)
+
+    def page_size(self, idx):
+        with _pdfium_lock:
+            page = self.doc[idx]
+            size = page.get_size()
+            page.close()
+        return size
+
+    def render(self, idx, dpi):
+        with _pdfium_lock:
+            page = self.doc[idx]
+            image = PageImage.from_pil(page.render(scale=dpi/72).to_pil())
+            page.close()
+        return image
+
+    def close(self):
+        with _pdfium_lock:
+            self.doc.close()
+
+
+def load_rasterizer(pdf_path, backend='pymupdf'):
+    """
+    Open a PDF file with the given rasterizer backend.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        backend (str): Name of a registered backend, see `list_rasterizers`.
+
+    Returns:
+        BaseRasterizer: The opened rasterizer.
+    """
+    return RASTERIZER_REGISTRY.get(backend)(pdf_path)
+
+
+def list_rasterizers(available_only=True):
+    """
+    List the registered rasterizer backends.
+
+    Args:
+        available_only (bool): Only list the backends whose dependencies are installed.
+
+    Returns:
+        list: Names of the backends.
+    """
+    requirements = {
+        'pymupdf': 'fitz',
+        'pdf2image': 'pdf2image',
+        'pypdfium2': 'pypdfium2',
+    }
+    backends = []
+    for name in RASTERIZER_REGISTRY.list_items():
+        if available_only and name in requirements:
+            try:
+                __import__(requirements[name])
+            except ImportError:
+                continue
+        backends.append(name)
+    return backends
@@ -0,0 +1,313 @@
+import os
+import json
+
+import numpy as np
+
+from pdf_extract_kit.registry import RESULT_WRITER_REGISTRY
+from pdf_extract_kit.utils.page_result import PageResult, dumps_json
+
+
+class BaseResultWriter:
+    """
+    Streaming writer of the page results of one document.
+
+    Pages are written as they are done with `write_pages`, to a temporary file which replaces `path` on `close`,
+    so an interrupted run never leaves a truncated output behind. `abort` drops the temporary file.
+
+    Example:
+        >>> with open_result_writer("outputs/paper.parquet") as writer:
+        ...     for page_res in pages:
+        ...         writer.write_pages([page_res])
+    """
+    extension = None
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp{os.getpid()}"
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.num_pages = 0
+
+    def write_pages(self, pages):
+        """
+        Args:
+            pages (list): Results of the next pages, dicts or PageResult.
+        """
+        for page in pages:
+            self._write_page(PageResult.from_dict(page))
+            self.num_pages += 1
+        self._flush()
+
+    def _write_page(self, page):
+        raise NotImplementedError
+
+    def _flush(self):
+        pass
+
+    def _close_file(self):
+        raise NotImplementedError
+
+    def close(self):
+        """Finish the file and move it to path."""
+        self._close_file()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Drop the pages written so far."""
+        try:
+            self._close_file()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+@RESULT_WRITER_REGISTRY.register('jsonl')
+class JSONLResultWriter(BaseResultWriter):
+    """One compact JSON line per page, the same JSON as the page in the .json output."""
+    extension = 'jsonl'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+
+    def _write_page(self, page):
+        self.file.write(dumps_json(page, indent=None) + '\n')
+
+    def _flush(self):
+        self.file.flush()
+
+    def _close_file(self):
+        self.file.close()
+
+
+@RESULT_WRITER_REGISTRY.register('msgpack')
+class MsgpackResultWriter(BaseResultWriter):
+    """A stream of msgpack maps, one per page, in the format of the .json output."""
+    extension = 'msgpack'
+
+    def __init__(self, path):
+        import msgpack
+        super().__init__(path)
+        self.packer = msgpack.Packer(use_bin_type=True)
+        self.file = open(self.tmp_path, 'wb')
+
+    def _write_page(self, page):
+        self.file.write(self.packer.pack(page.to_dict()))
+
+    def _flush(self):
+        self.file.flush()
+
+    def _close_file(self):
+        self.file.close()
+
+
+class MarkdownWriter(BaseResultWriter):
+    """
+    Markdown of a document, the markdown of each page is appended as soon as it is written, separated by a blank line.
+
+    The file is the same as the markdown of all the pages joined at the end. Until `close` it is at `tmp_path`,
+    which can be followed to read the pages already done. Pages are written with `write_markdown`, the page
+    results are converted by the caller.
+    """
+    extension = 'md'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+
+    def write_markdown(self, md_texts):
+        """
+        Args:
+            md_texts (list): Markdown of the next pages.
+        """
+        for md_text in md_texts:
+            self.file.write(md_text if self.num_pages == 0 else "\n\n" + md_text)
+            self.num_pages += 1
+        self.file.flush()
+
+    def _close_file(self):
+        self.file.close()
+
+
+def arrow_schema():
+    """
+    Schema of the Arrow and Parquet outputs: one row per detection, and one row for a page without detection
+    (its det_idx and detection columns are null) so that every page of the document has rows.
+
+    Returns:
+        pyarrow.Schema: page_no, page_width, page_height, det_idx (index in layout_dets), category_type, poly (8 floats),
+            score, text (ocr text) and latex (formula), null when a detection does not have the key.
+    """
+    import pyarrow as pa
+    return pa.schema([
+        ('page_no', pa.int32()),
+        ('page_width', pa.int32()),
+        ('page_height', pa.int32()),
+        ('det_idx', pa.int32()),
+        ('category_type', pa.string()),
+        ('poly', pa.list_(pa.float64(), 8)),
+        ('score', pa.float64()),
+        ('text', pa.string()),
+        ('latex', pa.string()),
+    ])
+
+
+def page_record_batch(page, page_idx=0):
+    """
+    Convert the result of one page to the rows of the Arrow and Parquet outputs, see `arrow_schema`.
+
+    Args:
+        page (PageResult or dict): Result of the page.
+        page_idx (int): Page number used when page_info has no page_no.
+
+    Returns:
+        pyarrow.RecordBatch: One row per detection, or one row of nulls but the page columns if the page has no detection.
+    """
+    import pyarrow as pa
+    page = PageResult.from_dict(page)
+    num_dets = page.num_dets
+    page_info = page.get('page_info') or {}
+    if num_dets == 0:
+        return pa.RecordBatch.from_pylist([{'page_no': page_info.get('page_no', page_idx), 'page_width': page_info.get('width', 0),
+                                            'page_height': page_info.get('height', 0)}], schema=arrow_schema())
+    texts = {'text': [None] * num_dets, 'latex': [None] * num_dets}
+    for idx, text_key in enumerate(page.text_keys()):
+        if text_key is not None:
+            texts[text_key][idx] = page.text(idx)
+    categories = page.category_names().tolist()
+    return pa.RecordBatch.from_arrays([
+        pa.array(np.full(num_dets, page_info.get('page_no', page_idx), dtype=np.int32)),
+        pa.array(np.full(num_dets, page_info.get('width', 0), dtype=np.int32)),
+        pa.array(np.full(num_dets, page_info.get('height', 0), dtype=np.int32)),
+        pa.array(np.arange(num_dets, dtype=np.int32)),
+        pa.array([category if category else None for category in categories], type=pa.string()),
+        pa.FixedSizeListArray.from_arrays(pa.array(page.polys.ravel()), 8),
+        pa.array(page.scores, mask=~page.has_score()),
+        pa.array(texts['text'], type=pa.string()),
+        pa.array(texts['latex'], type=pa.string()),
+    ], schema=arrow_schema())
+
+
+@RESULT_WRITER_REGISTRY.register('arrow')
+class ArrowResultWriter(BaseResultWriter):
+    """Arrow IPC file, one record batch per page, memory-mappable with `read_result_table`."""
+    extension = 'arrow'
+
+    def __init__(self, path):
+        import pyarrow as pa
+        super().__init__(path)
+        self.sink = pa.OSFile(self.tmp_path, 'wb')
+        self.writer = pa.ipc.new_file(self.sink, arrow_schema())
+
+    def _write_page(self, page):
+        self.writer.write_batch(page_record_batch(page, self.num_pages))
+
+    def _flush(self):
+        self.sink.flush()
+
+    def _close_file(self):
+        if not self.sink.closed:
+            self.writer.close()
+            self.sink.close()
+
+
+@RESULT_WRITER_REGISTRY.register('parquet')
+class ParquetResultWriter(BaseResultWriter):
+    """Parquet file, one row group per page."""
+    extension = 'parquet'
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+        super().__init__(path)
+        self.writer = pq.ParquetWriter(self.tmp_path, arrow_schema())
+        self.closed = False
+
+    def _write_page(self, page):
+        self.writer.write_batch(page_record_batch(page, self.num_pages))
+
+    def _close_file(self):
+        if not self.closed:
+            self.writer.close()
+            self.closed = True
+
+
+def open_result_writer(path, result_format=None):
+    """
+    Args:
+        path (str): Output path.
+        result_format (str, optional): jsonl, msgpack, arrow or parquet, the extension of path by default.
+
+    Returns:
+        BaseResultWriter: The opened writer.
+    """
+    result_format = result_format or os.path.splitext(path)[1][1:]
+    return RESULT_WRITER_REGISTRY.get(result_format)(path)
+
+
+def read_result_table(path, columns=None):
+    """
+    Read an Arrow or Parquet output, memory-mapped: the columns are read from the page cache on access.
+
+    Args:
+        path (str): .arrow or .parquet file.
+        columns (list, optional): Columns to read, all by default.
+
+    Returns:
+        pyarrow.Table: One row per detection and per page without detection, see `arrow_schema`.
+    """
+    import pyarrow as pa
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns, memory_map=True)
+    # the buffers of the table keep the mapping open
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def iter_result_pages(path):
+    """
+    Read the page results of a document, in any of the output formats.
+
+    Pages of the JSON, JSONL and msgpack outputs are the saved dicts. Pages of the Arrow and Parquet outputs are
+    rebuilt from their rows: float polys, and the detection keys which are not null. A row with a null det_idx is
+    a page without detection.
+
+    Yields:
+        dict: Result of each page.
+    """
+    extension = os.path.splitext(path)[1][1:]
+    if extension == 'json':
+        with open(path, encoding='utf-8') as f:
+            yield from json.load(f)
+    elif extension == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+    elif extension == 'msgpack':
+        import msgpack
+        with open(path, 'rb') as f:
+            yield from msgpack.Unpacker(f, raw=False)
+    else:
+        table = read_result_table(path)
+        page = None
+        for row in table.to_pylist():
+            # the rows of a page start with its first detection, or are its only row
+            if page is None or not row['det_idx']:
+                if page is not None:
+                    yield page
+                page = {'layout_dets': [], 'page_info': dict(page_no=row['page_no'], height=row['page_height'], width=row['page_width'])}
+            if row['det_idx'] is None:
+                continue
+            det = {key: row[key] for key in ('category_type', 'poly', 'score', 'text', 'latex') if row[key] is not None}
+            page['layout_dets'].append(det)
+        if page is not None:
+            yield page
@@ -0,0 +1,89 @@
+import unicodedata
+
+
+def is_garbled_text(text, max_bad_ratio=0.1):
+    """
+    Check if the text extracted from a PDF text layer is unusable, e.g. fonts without unicode mapping.
+
+    Args:
+        text (str): Extracted text.
+        max_bad_ratio (float): Maximum ratio of replacement, private use and control characters.
+
+    Returns:
+        bool: True if the text should be recognized by OCR instead.
+    """
+    chars = [ch for ch in text if not ch.isspace()]
+    if not chars:
+        return True
+    num_bad = 0
+    for ch in chars:
+        if ch == '\ufffd' or unicodedata.category(ch) in ('Co', 'Cc', 'Cs', 'Cn'):
+            num_bad += 1
+    return num_bad / len(chars) > max_bad_ratio
+
+
+def _center_in_bbox(bbox, container):
+    cx, cy = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+    return container[0] <= cx <= container[2] and container[1] <= cy <= container[3]
+
+
+def _overlap_ratio(bbox, mask):
+    # overlap area of bbox and mask, as a ratio of the area of bbox
+    x0, y0 = max(bbox[0], mask[0]), max(bbox[1], mask[1])
+    x1, y1 = min(bbox[2], mask[2]), min(bbox[3], mask[3])
+    if x1 <= x0 or y1 <= y0:
+        return 0
+    area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+    return (x1 - x0) * (y1 - y0) / area if area > 0 else 0
+
+
+def text_layer_spans(words, block_bbox, mf_bboxes=(), overlap_threshold=0.5):
+    """
+    Build the text spans of a layout block from the words of the PDF text layer.
+
+    Words of the same text layer line are merged into one span, a line is split where a formula
+    masks some of its words, the same way OCR text boxes are split by `update_det_boxes`.
+
+    Args:
+        words (list): (x0, y0, x1, y1, text, block_no, line_no, word_no) tuples in page image coordinates.
+        block_bbox (list): [xmin, ymin, xmax, ymax] of the layout block.
+        mf_bboxes (list): [xmin, ymin, xmax, ymax] of the formulas of the page.
+        overlap_threshold (float): Words covered by a formula above this ratio are removed.
+
+    Returns:
+        List[dict]: spans in the OCR result format, empty if the block has no usable text layer (scanned or garbled).
+    """
+    lines = {}
+    for word in words:
+        if not _center_in_bbox(word[:4], block_bbox):
+            continue
+        lines.setdefault((word[5], word[6]), []).append(word)
+
+    spans = []
+    for line_words in lines.values():
+        line_words.sort(key=lambda word: word[7])
+        segments = [[]]
+        for word in line_words:
+            if any(_overlap_ratio(word[:4], mf_bbox) > overlap_threshold for mf_bbox in mf_bboxes):
+                # the word is part of a formula, the formula span replaces it
+                if segments[-1]:
+                    segments.append([])
+                continue
+            segments[-1].append(word)
+        for segment in segments:
+            if not segment:
+                continue
+            x0 = min(word[0] for word in segment)
+            y0 = min(word[1] for word in segment)
+            x1 = max(word[2] for word in segment)
+            y1 = max(word[3] for word in segment)
+            spans.append({
+                'category_type': 'text',
+                'poly': [x0, y0, x1, y0, x1, y1, x0, y1],
+                'score': 1.0,
+                'text': ' '.join(word[4] for word in segment),
+            })
+
+    if not spans or is_garbled_text(''.join(span['text'] for span in spans)):
+        return []
+    return spans
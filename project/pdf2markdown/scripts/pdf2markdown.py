@@ -1,18 +1,26 @@
 import os
-import re
 import gc
 import sys
 import time
 import torch
+import traceback
+import itertools
+from collections import deque
 from PIL import Image, ImageDraw
-from torchvision import transforms
-from torch.utils.data import DataLoader
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
-from pdf_extract_kit.utils.data_preprocess import load_pdf
+from pdf_extract_kit.utils.data_preprocess import open_pdf, ImagePage
 from pdf_extract_kit.tasks.ocr.task import OCRTask
-from pdf_extract_kit.dataset.dataset import MathDataset
 from pdf_extract_kit.registry.registry import TASK_REGISTRY
+from pdf_extract_kit.utils.text_layer import text_layer_spans
+from pdf_extract_kit.utils.manifest import RunManifest, PageCheckpoint, atomic_write, file_hash
+from pdf_extract_kit.utils.batching import BatchScheduler
+from pdf_extract_kit.tasks.formula_recognition.service import FormulaRecognitionService
+from pdf_extract_kit.utils.pipeline import Pipeline, Stage
+from pdf_extract_kit.utils.page_result import PageResult
+from pdf_extract_kit.utils.latex import latex_rm_whitespace
+from pdf_extract_kit.utils.crop import CropPool
+from pdf_extract_kit.utils.result_io import open_result_writer, iter_result_pages, MarkdownWriter
 from pdf_extract_kit.utils.merge_blocks_and_spans import (
     fill_spans_in_blocks,
     fix_block_spans,
@@ -20,49 +28,114 @@ from pdf_extract_kit.utils.merge_blocks_and_spans import (
 )
 
 
-def latex_rm_whitespace(s: str):
-    """Remove unnecessary whitespace from LaTeX code.
+class TextLineQueue:
+    """text lines detected on pages, waiting for their recognition.
+
+    The lines of all the pages added since the last `flush` are recognized together, so that the recognition
+    runs on large batches of lines of similar aspect ratio (see `ModifiedPaddleOCR.recognize_lines`).
     """
-    text_reg = r'(\\(operatorname|mathrm|text|mathbf)\s?\*? {.*?})'
-    letter = '[a-zA-Z]'
-    noletter = '[\W_^\d]'
-    names = [x[0].replace(' ', '') for x in re.findall(text_reg, s)]
-    s = re.sub(text_reg, lambda match: str(names.pop(0)), s)
-    news = s
-    while True:
-        s = news
-        news = re.sub(r'(?!\\ )(%s)\s+?(%s)' % (noletter, noletter), r'\1\2', s)
-        news = re.sub(r'(?!\\ )(%s)\s+?(%s)' % (noletter, letter), r'\1\2', news)
-        news = re.sub(r'(%s)\s+?(%s)' % (letter, noletter), r'\1\2', news)
-        if news == s:
-            break
-    return s
-
-def crop_img(input_res, input_pil_img, padding_x=0, padding_y=0):
-    crop_xmin, crop_ymin = int(input_res['poly'][0]), int(input_res['poly'][1])
-    crop_xmax, crop_ymax = int(input_res['poly'][4]), int(input_res['poly'][5])
-    # Create a white background with an additional width and height of 50
-    crop_new_width = crop_xmax - crop_xmin + padding_x * 2
-    crop_new_height = crop_ymax - crop_ymin + padding_y * 2
-    return_image = Image.new('RGB', (crop_new_width, crop_new_height), 'white')
-
-    # Crop image
-    crop_box = (crop_xmin, crop_ymin, crop_xmax, crop_ymax)
-    cropped_img = input_pil_img.crop(crop_box)
-    return_image.paste(cropped_img, (padding_x, padding_y))
-    return_list = [padding_x, padding_y, crop_xmin, crop_ymin, crop_xmax, crop_ymax, crop_new_width, crop_new_height]
-    return return_image, return_list
+    def __init__(self, drop_score=0.5):
+        self.drop_score = drop_score
+        self.crops = []
+        self.lines = []
+        self.pages = []
+
+    def add_line(self, dets, box, crop, offset=(0, 0)):
+        """queue a line: its result is appended to dets (the results of its block), moved by offset to page coordinates."""
+        self.crops.append(crop)
+        self.lines.append((dets, box, offset))
+
+    def add_page(self, layout_res, block_dets):
+        """the results of the blocks of a page are appended to layout_res, in block order, once the lines are recognized."""
+        self.pages.append((layout_res, block_dets))
+
+    def flush(self, recognize):
+        """recognize the queued lines with recognize (list of crops -> list of (text, score)) and complete their pages."""
+        rec_res = recognize(self.crops) if self.crops else []
+        for (dets, box, (offset_x, offset_y)), (text, score) in zip(self.lines, rec_res):
+            if score >= self.drop_score:
+                dets.append({
+                    'category_type': 'text',
+                    'poly': [coord for x, y in box.tolist() for coord in (x + offset_x, y + offset_y)],
+                    'score': round(score, 2),
+                    'text': text,
+                })
+        for layout_res, block_dets in self.pages:
+            for dets in block_dets:
+                layout_res.extend(dets)
+        self.crops, self.lines, self.pages = [], [], []
+
 
 @TASK_REGISTRY.register("pdf2markdown")
 class PDF2MARKDOWN(OCRTask):
-    def __init__(self, layout_model, mfd_model, mfr_model, ocr_model):
+    def __init__(self, layout_model, mfd_model, mfr_model, ocr_model, pdf_config=None, use_text_layer=False, max_batch_wait=0.05, pipeline_config=None,
+                 result_formats=None, stream_markdown=False, ocr_mode='block', cross_page_ocr=False, mfr_buckets=None):
+        """
+        Args:
+            pdf_config: dict, options of the PDF page source, see `open_pdf`.
+            use_text_layer: bool, take the text of born-digital blocks from the PDF text layer, only scanned or garbled blocks are recognized by OCR.
+            max_batch_wait: float, maximum time in seconds a batch of pages waits for more pages before layout or formula detection runs on it.
+            pipeline_config: dict, `enable` runs the stages of consecutive pages and documents concurrently (see `process_pipelined`),
+                with `workers` per stage and `queue_size` pages waiting in front of each stage.
+            result_formats: List[str], formats the results of each document are saved in: json (default), and jsonl, msgpack,
+                arrow or parquet, which are written page by page as they are done (see `pdf_extract_kit.utils.result_io`).
+            stream_markdown: bool, append the markdown of each page to the .md output as soon as the page is done,
+                instead of writing the whole document at the end (see `open_markdown_stream`).
+            ocr_mode: str, `block` runs text detection and recognition on the padded crop of each text block, `page` detects
+                the text lines once on the whole page, assigns them to the text blocks and recognizes all of them together
+                (see `ModifiedPaddleOCR.ocr_page`), the text detector then needs a det_limit_side_len fitting the page size.
+            cross_page_ocr: bool, queue the text lines detected on the pages and recognize them together across pages, sorted by
+                aspect ratio in batches of the rec_batch_num of the ocr model (see `TextLineQueue`): with the formulas every
+                checkpoint_every pages, or across the pages in the ocr stage in the pipelined processing. The ocr cache is not used.
+            mfr_buckets: dict, `aspect_ratio` and `area` boundaries of the buckets of formula crops, each bucket is recognized in
+                its own batches (see `FormulaRecognitionService`), across the pages and documents in flight in the pipelined processing.
+                The near identical formula crops of a document (or of the run) are recognized once with the `dedup` model config of
+                the formula recognition model (see `PerceptualHashCache`).
+        """
+        self.pdf_config = pdf_config or {}
+        self.pipeline_config = pipeline_config or {}
+        self.pipeline = None
+        self.result_formats = result_formats or ['json']
+        self.stream_markdown = stream_markdown
+        self.use_text_layer = use_text_layer
         self.layout_model = layout_model
         self.mfd_model = mfd_model
         self.mfr_model = mfr_model
         self.ocr_model = ocr_model
+        # padded crops of the text blocks, sliced from the page buffer
+        self.crop_pool = CropPool()
+        assert ocr_mode in ('block', 'page'), f"unknown ocr_mode {ocr_mode}"
+        self.ocr_mode = ocr_mode
+        self.cross_page_ocr = cross_page_ocr
         if self.mfr_model is not None:
             assert self.mfd_model is not None, "formula recognition based on formula detection, mfd_model can not be None."
-            self.mfr_transform = transforms.Compose([self.mfr_model.vis_processor, ])
+        # pages of all the documents are detected in batches of the batch_size of each model
+        self.layout_scheduler = self.mfd_scheduler = None
+        if self.layout_model is not None:
+            self.layout_scheduler = BatchScheduler(lambda images: self.layout_model.predict(images, ""),
+                                                   batch_size=getattr(self.layout_model, 'batch_size', 1),
+                                                   max_wait=max_batch_wait, name="layout_detection")
+        if self.mfd_model is not None:
+            self.mfd_scheduler = BatchScheduler(lambda images: self.mfd_model.predict(images, ""),
+                                                batch_size=getattr(self.mfd_model, 'batch_size', 1),
+                                                max_wait=max_batch_wait, name="formula_detection")
+        self.mfr_scheduler = None
+        if self.mfr_model is not None:
+            # formulas of concurrent pages are recognized together, in batches of crops of similar shape
+            mfr_buckets = mfr_buckets or {}
+            self.mfr_scheduler = FormulaRecognitionService(self.mfr_model, max_wait=max_batch_wait,
+                                                           aspect_ratio_bins=mfr_buckets.get('aspect_ratio', (2, 4, 8)),
+                                                           area_bins=mfr_buckets.get('area', (4096, 32768)))
+        # latex of the formula crops already recognized in the document (or the run), the dedup cache of the model
+        self.formula_cache = getattr(self.mfr_model, 'dedup', None)
+        self.formula_dedup_scope = getattr(self.mfr_model, 'dedup_scope', 'document')
+        self.formula_scopes = itertools.count()
+        self.ocr_rec_scheduler = None
+        if self.ocr_model is not None and self.cross_page_ocr:
+            # used by the pipelined processing, the lines of concurrent pages are recognized together,
+            # a window of several recognition batches is sorted by aspect ratio at once
+            self.ocr_rec_scheduler = BatchScheduler(self.ocr_model.recognize_lines, batch_size=4 * self.ocr_model.args.rec_batch_num,
+                                                    max_wait=max_batch_wait, name="text_recognition")
             
         self.color_palette  = {
             'title': (255, 64, 255),
@@ -80,13 +153,29 @@ class PDF2MARKDOWN(OCRTask):
             'text': (255, 0, 0)
         }
 
-    def convert_format(self, yolo_res, id_to_names, ):
+    def close(self):
+        """run the inputs still queued in the batch schedulers and stop their threads, they start again on the next submit."""
+        for scheduler in [self.layout_scheduler, self.mfd_scheduler, self.mfr_scheduler, self.ocr_rec_scheduler]:
+            if scheduler is not None:
+                scheduler.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def convert_format(self, yolo_res, id_to_names, scale=(1, 1)):
         """
         convert yolo format to pdf-extract format.
+        
+        Args:
+            scale: (x, y) factors mapping the coordinates of the predicted image to the full resolution page
         """
+        scale_x, scale_y = scale
         res_list = []
         for xyxy, conf, cla in zip(yolo_res.boxes.xyxy.cpu(), yolo_res.boxes.conf.cpu(), yolo_res.boxes.cls.cpu()):
-            xmin, ymin, xmax, ymax = [int(p.item()) for p in xyxy]
+            xmin, ymin, xmax, ymax = [int(p.item() * s) for p, s in zip(xyxy, (scale_x, scale_y, scale_x, scale_y))]
             new_item = {
                 'category_type': id_to_names[int(cla.item())],
                 'poly': [xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax],
@@ -96,14 +185,19 @@ class PDF2MARKDOWN(OCRTask):
         return res_list
     
     
-    def process_single_pdf(self, image_list):
+    def process_single_pdf(self, image_list, on_pages=None, checkpoint_every=None):
         """predict on one image, reture text detection and recognition results.
         
         Args:
-            image_list: List[PIL.Image.Image]
+            image_list: List[PIL.Image.Image] or iterable of page handles (PDFPageSource.iter_pages), pages are consumed one at a time.
+                Page handles render each page at the input size of the layout and formula detection models and at full resolution for the crops.
+            on_pages: callable, called with the results of the pages completed so far (formulas included) every
+                checkpoint_every pages and at the end, e.g. to checkpoint them.
+            checkpoint_every: int, number of pages between two calls of on_pages, formulas (and text lines with cross_page_ocr)
+                are recognized in batches over these pages. None recognizes the formulas of the whole file at once.
             
         Returns:
-            List[dict]: list of PDF extract results
+            List[PageResult]: list of PDF extract results, read only mappings in the format below (see `PageResult.to_dict`)
             
         Return example:
             [
@@ -138,127 +232,304 @@ class PDF2MARKDOWN(OCRTask):
         pdf_extract_res = []
         mf_image_list = []
         latex_filling_list = []
-        for idx, image in enumerate(image_list):
-            img_W, img_H = image.size
-            if self.layout_model is not None:
-                ori_layout_res = self.layout_model.predict([image], "")[0]
-                layout_res = self.convert_format(ori_layout_res, self.layout_model.id_to_names)
-            else:
-                layout_res = []
-            single_page_res = {'layout_dets': layout_res}
-            single_page_res['page_info'] = dict(
-                page_no = idx,
-                height = img_H,
-                width = img_W
-            )
+        line_queue = TextLineQueue(self.ocr_model.drop_score) if self.cross_page_ocr else None
+        formula_scope = next(self.formula_scopes)
+        # index in pdf_extract_res of the first page not passed to on_pages yet
+        num_flushed = 0
+        for page, ori_layout_res, mfd_res in self.detect_pages(image_list):
+            single_page_res, image, formula_items, formula_crops = self.page_result(page, ori_layout_res, mfd_res)
+            mf_image_list.extend(formula_crops)
             if self.mfd_model is not None:
-                mfd_res = self.mfd_model.predict([image], "")[0]
-                for xyxy, conf, cla in zip(mfd_res.boxes.xyxy.cpu(), mfd_res.boxes.conf.cpu(), mfd_res.boxes.cls.cpu()):
-                    xmin, ymin, xmax, ymax = [int(p.item()) for p in xyxy]
-                    new_item = {
-                        'category_type': self.mfd_model.id_to_names[int(cla.item())],
-                        'poly': [xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax],
-                        'score': round(float(conf.item()), 2),
-                        'latex': '',
-                    }
-                    single_page_res['layout_dets'].append(new_item)
-                    if self.mfr_model is not None:
-                        latex_filling_list.append(new_item)
-                        bbox_img = image.crop((xmin, ymin, xmax, ymax))
-                        mf_image_list.append(bbox_img)
-                    
-                pdf_extract_res.append(single_page_res)
-                
                 del mfd_res
                 torch.cuda.empty_cache()
                 gc.collect()
+            pdf_extract_res.append(single_page_res)
+
+            # ocr and table recognition, done while the page image is still alive so that
+            # only the pages of the detection window are held in memory.
+            words = page.words() if self.use_text_layer else None
+            self.ocr_single_page(page.array(), single_page_res['layout_dets'], words=words, line_queue=line_queue)
+            if line_queue is None:
+                # the page is final but for the latex of its formulas, it is kept in columnar form from now on
+                # and its formulas are filled in when they are recognized
+                det_indexes = {id(det): idx for idx, det in enumerate(single_page_res['layout_dets'])}
+                pdf_extract_res[-1] = PageResult.from_dict(single_page_res)
+                latex_filling_list.extend((pdf_extract_res[-1], det_indexes[id(item)]) for item in formula_items)
+            else:
+                latex_filling_list.extend(formula_items)
+
+            if checkpoint_every and len(pdf_extract_res) - num_flushed >= checkpoint_every:
+                self.recognize_formulas(mf_image_list, latex_filling_list, scope=formula_scope)
+                mf_image_list, latex_filling_list = [], []
+                if line_queue is not None:
+                    line_queue.flush(self.ocr_model.recognize_lines)
+                # the results of these pages are final, the pages waiting for the text lines of the queue are kept in columnar form
+                pdf_extract_res[num_flushed:] = [PageResult.from_dict(page_res) for page_res in pdf_extract_res[num_flushed:]]
+                if on_pages is not None:
+                    on_pages(pdf_extract_res[num_flushed:])
+                num_flushed = len(pdf_extract_res)
             
-        # Formula recognition, collect all formula images in whole pdf file, then batch infer them.
-        if self.mfr_model is not None:
-            a = time.time()
-            dataset = MathDataset(mf_image_list, transform=self.mfr_transform)
-            dataloader = DataLoader(dataset, batch_size=self.mfr_model.batch_size, num_workers=0)
-
-            mfr_res = []
-            for imgs in dataloader:
-                imgs = imgs.to(self.mfr_model.device)
-                output = self.mfr_model.model.generate({'image': imgs})
-                mfr_res.extend(output['pred_str'])
-            for res, latex in zip(latex_filling_list, mfr_res):
+        # Formula recognition, collect all formula images in whole pdf file (or since the last checkpoint), then batch infer them.
+        self.recognize_formulas(mf_image_list, latex_filling_list, scope=formula_scope)
+        if line_queue is not None:
+            line_queue.flush(self.ocr_model.recognize_lines)
+        pdf_extract_res[num_flushed:] = [PageResult.from_dict(page_res) for page_res in pdf_extract_res[num_flushed:]]
+        if on_pages is not None and len(pdf_extract_res) > num_flushed:
+            on_pages(pdf_extract_res[num_flushed:])
+        return pdf_extract_res
+
+    def page_result(self, page, ori_layout_res, mfd_res):
+        """build the result of one page from its layout and formula detection results.
+
+        Args:
+            page: page handle, see `PDFPage`.
+            ori_layout_res: layout detection result (YOLO format) of `page.array(layout_model.img_size)`, None if there is no layout model.
+            mfd_res: formula detection result (YOLO format) of `page.array(mfd_model.img_size)`, None if there is no formula detection model.
+
+        Returns:
+            tuple: (page result, full resolution PIL image, formula items waiting for their latex, crops of these formulas).
+        """
+        # full resolution page, formula and ocr crops are taken from it
+        image = page.image()
+        img_W, img_H = image.size
+        if self.layout_model is not None:
+            layout_image = page.array(getattr(self.layout_model, 'img_size', None))
+            layout_res = self.convert_format(ori_layout_res, self.layout_model.id_to_names,
+                                             scale=(img_W / layout_image.width, img_H / layout_image.height))
+        else:
+            layout_res = []
+        single_page_res = {'layout_dets': layout_res}
+        single_page_res['page_info'] = dict(
+            page_no = page.idx,
+            height = img_H,
+            width = img_W
+        )
+        formula_items, formula_crops = [], []
+        if self.mfd_model is not None:
+            mfd_image = page.array(self.mfd_model.img_size)
+            mfd_items = self.convert_format(mfd_res, self.mfd_model.id_to_names,
+                                            scale=(img_W / mfd_image.width, img_H / mfd_image.height))
+            for new_item in mfd_items:
+                new_item['latex'] = ''
+                single_page_res['layout_dets'].append(new_item)
+                if self.mfr_model is not None:
+                    formula_items.append(new_item)
+                    xmin, ymin, _, _, xmax, ymax, _, _ = new_item['poly']
+                    bbox_img = image.crop((xmin, ymin, xmax, ymax))
+                    formula_crops.append(bbox_img)
+        return single_page_res, image, formula_items, formula_crops
+
+    def detect_pages(self, image_list):
+        """run layout and formula detection on the pages, ahead of their consumer.
+
+        The pages of a window as large as the largest detection batch are submitted to the batch schedulers
+        before the first result is waited for, so that the models see full batches.
+
+        Args:
+            image_list: List[PIL.Image.Image] or iterable of page handles, see `process_single_pdf`.
+
+        Yields:
+            tuple: (page handle, layout detection result, formula detection result), in page order, a result is None if its model is not set.
+        """
+        batch_sizes = [scheduler.batch_size for scheduler in [self.layout_scheduler, self.mfd_scheduler] if scheduler is not None]
+        lookahead = max(batch_sizes, default=1)
+        pending = deque()
+        for idx, page in enumerate(image_list):
+            if isinstance(page, Image.Image):
+                page = ImagePage(page, idx)
+            layout_future = mfd_future = None
+            if self.layout_scheduler is not None:
+                layout_future = self.layout_scheduler.submit(page.array(getattr(self.layout_model, 'img_size', None)))
+            if self.mfd_scheduler is not None:
+                mfd_future = self.mfd_scheduler.submit(page.array(self.mfd_model.img_size))
+            pending.append((page, layout_future, mfd_future))
+            if len(pending) >= lookahead:
+                yield self._detection_results(*pending.popleft())
+        while pending:
+            yield self._detection_results(*pending.popleft())
+
+    def _detection_results(self, page, layout_future, mfd_future):
+        layout_res = layout_future.result() if layout_future is not None else None
+        mfd_res = mfd_future.result() if mfd_future is not None else None
+        return page, layout_res, mfd_res
+
+    def predict_formulas(self, crops, scope=None):
+        """latex of formula crops, the near identical crops of a document (scope) are recognized once with the dedup of the model."""
+        if self.formula_cache is None:
+            return self.mfr_scheduler.predict(crops)
+        return self.formula_cache.recognize(crops, self.mfr_scheduler.predict,
+                                            scope=scope if self.formula_dedup_scope == 'document' else None)
+
+    def recognize_formulas(self, mf_image_list, latex_filling_list, scope=None):
+        """fill the latex of the formula detection results with the formula recognition of their crops.
+
+        The formula detection results are dicts, or (PageResult, detection index) for the pages already in columnar form.
+        """
+        if self.mfr_model is None or not mf_image_list:
+            return
+        a = time.time()
+        mfr_res = self.predict_formulas(mf_image_list, scope=scope)
+        page_latex = {}
+        for res, latex in zip(latex_filling_list, mfr_res):
+            if isinstance(res, tuple):
+                page_res, idx = res
+                indexes, latex_list = page_latex.setdefault(id(page_res), (page_res, [], []))[1:]
+                indexes.append(idx)
+                latex_list.append(latex_rm_whitespace(latex))
+            else:
                 res['latex'] = latex_rm_whitespace(latex)
-            b = time.time()
-            print("formula nums:", len(mf_image_list), "mfr time:", round(b-a, 2))
+        for page_res, indexes, latex_list in page_latex.values():
+            page_res.fill_texts(indexes, latex_list)
+        b = time.time()
+        print("formula nums:", len(mf_image_list), "mfr time:", round(b-a, 2))
+
+    def ocr_single_page(self, image, layout_res, words=None, line_queue=None):
+        """run ocr on the text blocks of one page, the results are appended to layout_res.
         
-        # ocr_res = self.ocr_model.predict(image)
-            
-        # ocr and table recognition
-        for idx, image in enumerate(image_list):
-            layout_res = pdf_extract_res[idx]['layout_dets']
-            pil_img = image.copy()
-
-            ocr_res_list = []
-            table_res_list = []
-            single_page_mfdetrec_res = []
-
-            for res in layout_res:
-                if res['category_type'] in self.mfd_model.id_to_names.values():
-                    single_page_mfdetrec_res.append({
-                        "bbox": [int(res['poly'][0]), int(res['poly'][1]),
-                                 int(res['poly'][4]), int(res['poly'][5])],
+        Args:
+            image: PageImage (or PIL.Image.Image), the page image, the text blocks are cropped from its buffer
+            layout_res: List[dict], layout and formula detection results of the page
+            words: words of the page text layer in image coordinates (see `PDFPage.words`), blocks
+                covered by a usable text layer take their spans from it instead of running OCR.
+            line_queue: TextLineQueue, only detect the text lines and queue them, the results are appended to layout_res
+                when the queue is flushed.
+        """
+        ocr_res_list = []
+        table_res_list = []
+        single_page_mfdetrec_res = []
+
+        for res in layout_res:
+            if res['category_type'] in self.mfd_model.id_to_names.values():
+                single_page_mfdetrec_res.append({
+                    "bbox": [int(res['poly'][0]), int(res['poly'][1]),
+                             int(res['poly'][4]), int(res['poly'][5])],
+                })
+            elif res['category_type'] in [self.layout_model.id_to_names[cid] for cid in [0, 1, 2, 4, 6, 7]]:
+                ocr_res_list.append(res)
+            elif res['category_type'] in [self.layout_model.id_to_names[5]]:
+                table_res_list.append(res)
+
+        ocr_start = time.time()
+        num_text_layer_blocks = 0
+        mf_bboxes = [mf_res["bbox"] for mf_res in single_page_mfdetrec_res]
+        # results of each block, the text blocks without a usable text layer are recognized together below
+        block_dets = []
+        ocr_blocks = []
+        for res in ocr_res_list:
+            if words:
+                # born-digital block, the spans are read from the text layer
+                block_bbox = [res['poly'][0], res['poly'][1], res['poly'][4], res['poly'][5]]
+                text_spans = text_layer_spans(words, block_bbox, mf_bboxes)
+                if text_spans:
+                    block_dets.append(text_spans)
+                    num_text_layer_blocks += 1
+                    continue
+            block_dets.append([])
+            ocr_blocks.append((res, block_dets[-1]))
+
+        if line_queue is not None:
+            self.detect_text_lines(image, [res for res, _ in ocr_blocks], [dets for _, dets in ocr_blocks],
+                                   single_page_mfdetrec_res, line_queue)
+            line_queue.add_page(layout_res, block_dets)
+            ocr_results, offsets = [], []
+        elif self.ocr_mode == 'page':
+            # lines detected once on the whole page, in page coordinates
+            blocks = [[res['poly'][0], res['poly'][1], res['poly'][4], res['poly'][5]] for res, _ in ocr_blocks]
+            ocr_results = self.ocr_model.ocr_page(image, blocks, mfd_res=single_page_mfdetrec_res) if blocks else []
+            offsets = [(0, 0)] * len(ocr_blocks)
+        else:
+            ocr_results, offsets = self.ocr_block_crops(image, [res for res, _ in ocr_blocks], single_page_mfdetrec_res)
+
+        # Integration results
+        for (res, dets), ocr_res, (offset_x, offset_y) in zip(ocr_blocks, ocr_results, offsets):
+            if ocr_res:
+                for box_ocr_res in ocr_res:
+                    p1, p2, p3, p4 = box_ocr_res[0]
+                    text, score = box_ocr_res[1]
+
+                    # Convert the coordinates back to the original coordinate system
+                    p1 = [p1[0] + offset_x, p1[1] + offset_y]
+                    p2 = [p2[0] + offset_x, p2[1] + offset_y]
+                    p3 = [p3[0] + offset_x, p3[1] + offset_y]
+                    p4 = [p4[0] + offset_x, p4[1] + offset_y]
+
+                    dets.append({
+                        'category_type': 'text',
+                        'poly': p1 + p2 + p3 + p4,
+                        'score': round(score, 2),
+                        'text': text,
                     })
-                elif res['category_type'] in [self.layout_model.id_to_names[cid] for cid in [0, 1, 2, 4, 6, 7]]:
-                    ocr_res_list.append(res)
-                elif res['category_type'] in [self.layout_model.id_to_names[5]]:
-                    table_res_list.append(res)
-
-            ocr_start = time.time()
-            # Process each area that requires OCR processing
-            for res in ocr_res_list:
-                new_image, useful_list = crop_img(res, pil_img, padding_x=25, padding_y=25)
-                paste_x, paste_y, xmin, ymin, xmax, ymax, new_width, new_height = useful_list
-                # Adjust the coordinates of the formula area
-                adjusted_mfdetrec_res = []
-                for mf_res in single_page_mfdetrec_res:
-                    mf_xmin, mf_ymin, mf_xmax, mf_ymax = mf_res["bbox"]
-                    # Adjust the coordinates of the formula area to the coordinates relative to the cropping area
-                    x0 = mf_xmin - xmin + paste_x
-                    y0 = mf_ymin - ymin + paste_y
-                    x1 = mf_xmax - xmin + paste_x
-                    y1 = mf_ymax - ymin + paste_y
-                    # Filter formula blocks outside the graph
-                    if any([x1 < 0, y1 < 0]) or any([x0 > new_width, y0 > new_height]):
-                        continue
-                    else:
-                        adjusted_mfdetrec_res.append({
-                            "bbox": [x0, y0, x1, y1],
-                        })
-
-                # OCR recognition
-                ocr_res = self.ocr_model.ocr(new_image, mfd_res=adjusted_mfdetrec_res)[0]
-
-                # Integration results
-                if ocr_res:
-                    for box_ocr_res in ocr_res:
-                        p1, p2, p3, p4 = box_ocr_res[0]
-                        text, score = box_ocr_res[1]
-
-                        # Convert the coordinates back to the original coordinate system
-                        p1 = [p1[0] - paste_x + xmin, p1[1] - paste_y + ymin]
-                        p2 = [p2[0] - paste_x + xmin, p2[1] - paste_y + ymin]
-                        p3 = [p3[0] - paste_x + xmin, p3[1] - paste_y + ymin]
-                        p4 = [p4[0] - paste_x + xmin, p4[1] - paste_y + ymin]
-
-                        layout_res.append({
-                            'category_type': 'text',
-                            'poly': p1 + p2 + p3 + p4,
-                            'score': round(score, 2),
-                            'text': text,
-                        })
-
-            ocr_cost = round(time.time() - ocr_start, 2)
-            print(f"ocr cost: {ocr_cost}")
-        return pdf_extract_res
+        if line_queue is None:
+            for dets in block_dets:
+                layout_res.extend(dets)
+
+        ocr_cost = round(time.time() - ocr_start, 2)
+        if words:
+            print(f"text layer blocks: {num_text_layer_blocks}, ocr blocks: {len(ocr_res_list) - num_text_layer_blocks}")
+        print(f"ocr cost: {ocr_cost}")
     
+    def detect_text_lines(self, image, blocks, blocks_dets, mfdetrec_res, line_queue):
+        """detect the text lines of the text blocks of a page and queue them for their recognition, see `ocr_single_page`."""
+        if not blocks:
+            return
+        if self.ocr_mode == 'page':
+            bboxes = [[res['poly'][0], res['poly'][1], res['poly'][4], res['poly'][5]] for res in blocks]
+            line_boxes, line_blocks, line_crops = self.ocr_model.detect_page_lines(image, bboxes, mfd_res=mfdetrec_res)
+            for box, block_idx, crop in zip(line_boxes, line_blocks, line_crops):
+                line_queue.add_line(blocks_dets[block_idx], box, crop)
+            return
+        crops, crops_mfdetrec_res, offsets = self.crop_blocks(image, blocks, mfdetrec_res)
+        for crop, crop_mfdetrec_res, offset, dets in zip(crops, crops_mfdetrec_res, offsets, blocks_dets):
+            line_boxes, line_crops = self.ocr_model.detect_lines(crop, mfd_res=crop_mfdetrec_res)
+            for box, line_crop in zip(line_boxes, line_crops):
+                line_queue.add_line(dets, box, line_crop, offset)
+
+    def ocr_block_crops(self, image, blocks, mfdetrec_res):
+        """run ocr on the padded crop of each text block of a page.
+
+        Returns:
+            tuple: (ocr result of each block in crop coordinates, (x, y) offset of each crop in the page).
+        """
+        crops, crops_mfdetrec_res, offsets = self.crop_blocks(image, blocks, mfdetrec_res)
+        # OCR recognition
+        ocr_results = self.ocr_model.ocr_batch(crops, mfd_res=crops_mfdetrec_res) if crops else []
+        return ocr_results, offsets
+
+    def crop_blocks(self, image, blocks, mfdetrec_res):
+        """padded crops of the text blocks of a page, valid until the next call from the same thread (see `CropPool`).
+
+        Returns:
+            tuple: (crops, formulas of each crop in its coordinates, (x, y) offset of each crop in the page).
+        """
+        # Crop all the areas that require OCR processing at once, with a white padding of 25 pixels
+        paste_x, paste_y = 25, 25
+        crop_boxes = [[res['poly'][0], res['poly'][1], res['poly'][4], res['poly'][5]] for res in blocks]
+        crops = self.crop_pool.crop_page(image, crop_boxes, padding_x=paste_x, padding_y=paste_y)
+        crops_mfdetrec_res = []
+        for crop, res in zip(crops, blocks):
+            xmin, ymin = int(res['poly'][0]), int(res['poly'][1])
+            new_height, new_width = crop.shape[:2]
+            # Adjust the coordinates of the formula area
+            adjusted_mfdetrec_res = []
+            for mf_res in mfdetrec_res:
+                mf_xmin, mf_ymin, mf_xmax, mf_ymax = mf_res["bbox"]
+                # Adjust the coordinates of the formula area to the coordinates relative to the cropping area
+                x0 = mf_xmin - xmin + paste_x
+                y0 = mf_ymin - ymin + paste_y
+                x1 = mf_xmax - xmin + paste_x
+                y1 = mf_ymax - ymin + paste_y
+                # Filter formula blocks outside the graph
+                if any([x1 < 0, y1 < 0]) or any([x0 > new_width, y0 > new_height]):
+                    continue
+                else:
+                    adjusted_mfdetrec_res.append({
+                        "bbox": [x0, y0, x1, y1],
+                    })
+            crops_mfdetrec_res.append(adjusted_mfdetrec_res)
+
+        offsets = [(int(res['poly'][0]) - paste_x, int(res['poly'][1]) - paste_y) for res in blocks]
+        return crops, crops_mfdetrec_res, offsets
+
     def order_blocks(self, blocks):
         def calculate_oder(poly):
             xmin, ymin, _, _, xmax, ymax, _, _ = poly
@@ -266,6 +537,10 @@ class PDF2MARKDOWN(OCRTask):
         return sorted(blocks, key=lambda item: calculate_oder(item['poly']))
                  
     def convert2md(self, extract_res):
+        """convert the result of one page (dict or PageResult) to markdown.
+
+        The categories and texts of a dict result are changed, a PageResult is not changed.
+        """
         blocks = []
         spans = []
 
@@ -323,40 +598,416 @@ class PDF2MARKDOWN(OCRTask):
                 continue
         return md_text
         
-    def process(self, input_path, save_dir=None, visualize=False, merge2markdown=False):
+    def prepare_file(self, fpath, save_dir=None, manifest=None, retry_failed=False):
+        """check a file against the run manifest before processing it.
+
+        Returns:
+            dict: the document to process: fpath, basename, is_pdf, the pages done by a previous run (done_pages)
+                and their checkpoint, or the saved results (skipped_res) if the file is already done, or the error
+                of the previous run (previous_error) if the unchanged file failed and retry_failed is not set.
+        """
+        doc = dict(fpath=fpath, basename=os.path.basename(fpath)[:-4], is_pdf=fpath.endswith(".pdf") or fpath.endswith(".PDF"),
+                   checkpoint=None, done_pages=[], skipped_res=None, previous_error=None, error=None,
+                   md_content=[], md_writer=None, on_markdown=None, stream_md=False)
+        if manifest is None:
+            return doc
+        input_hash = file_hash(fpath)
+        if manifest.is_done(fpath, input_hash):
+            print(f"skip {fpath}, already done")
+            outputs = manifest.entry(fpath)['outputs']
+            result_format = next(name for name in ['json', 'jsonl', 'msgpack', 'parquet', 'arrow'] if name in outputs)
+            doc['skipped_res'] = list(iter_result_pages(outputs[result_format]))
+            return doc
+        entry = manifest.entry(fpath)
+        if not retry_failed and manifest.is_failed(fpath, input_hash):
+            print(f"skip {fpath}, failed in a previous run: {entry['error']}")
+            doc['previous_error'] = entry['error']
+            return doc
+        doc['checkpoint'] = PageCheckpoint(os.path.join(save_dir, ".checkpoints", f"{doc['basename']}.jsonl"))
+        if doc['is_pdf'] and entry is not None and entry['status'] != 'done' and entry['input_hash'] == input_hash:
+            doc['done_pages'] = [PageResult.from_dict(page_res) for page_res in doc['checkpoint'].load()]
+            if doc['done_pages']:
+                print(f"resume {fpath} from page {len(doc['done_pages'])}")
+        # drop the pages of another version of the file, or a line truncated by the interruption
+        doc['checkpoint'].reset(doc['done_pages'])
+        manifest.start(fpath, input_hash)
+        return doc
+
+    def fail_file(self, fpath, error, manifest=None, doc=None):
+        """log the failure of a file, abort its partial outputs and mark it failed in the run manifest, the run goes on
+        with the next file. The pages checkpointed so far are kept for a retry."""
+        print(f"failed {fpath}: {error!r}")
+        traceback.print_exception(type(error), error, error.__traceback__)
+        if doc is not None:
+            self.abort_result_writers(doc)
+        if manifest is not None:
+            manifest.fail(fpath, error)
+
+    def open_result_writers(self, doc, save_dir):
+        """open the writers of the streamed result formats of a document, the pages done by a previous run are written first."""
+        doc['writers'] = {}
+        try:
+            for result_format in self.result_formats:
+                if result_format != 'json':
+                    doc['writers'][result_format] = open_result_writer(os.path.join(save_dir, f"{doc['basename']}.{result_format}"), result_format)
+                    doc['writers'][result_format].write_pages(doc['done_pages'])
+        except Exception:
+            self.abort_result_writers(doc)
+            raise
+
+    def abort_result_writers(self, doc):
+        for writer in doc.get('writers', {}).values():
+            writer.abort()
+        doc['writers'] = {}
+        if doc['md_writer'] is not None:
+            doc['md_writer'].abort()
+            doc['md_writer'] = None
+
+    def open_markdown_stream(self, doc, save_dir=None, on_markdown=None):
+        """stream the markdown of a document: the markdown of each page is appended to the .md output (stream_markdown)
+        and passed to on_markdown as soon as the page is done, see `write_markdown`. The pages done by a previous run come first.
+
+        The time to the first page of markdown is the latency of a page in the pipelined processing, and of
+        checkpoint_every pages otherwise (the formulas of these pages are recognized together).
+        """
+        doc['stream_md'], doc['on_markdown'], doc['md_content'] = True, on_markdown, []
+        if save_dir and self.stream_markdown:
+            doc['md_writer'] = MarkdownWriter(os.path.join(save_dir, f"{doc['basename']}.md"))
+        self.write_markdown(doc, doc['done_pages'])
+
+    def write_markdown(self, doc, pages, md_texts=None):
+        """add the markdown of the next pages of a document (converted here if md_texts is None) to the markdown stream."""
+        if md_texts is None:
+            md_texts = [self.convert2md(page_res) for page_res in pages]
+        if doc['md_writer'] is not None:
+            doc['md_writer'].write_markdown(md_texts)
+        for md_text in md_texts:
+            doc['md_content'].append(md_text)
+            if doc['on_markdown'] is not None:
+                doc['on_markdown'](doc['fpath'], len(doc['md_content']) - 1, md_text)
+
+    def on_pages_callback(self, doc, markdown=False):
+        """callback of the completed pages of a document: checkpointed, written to the streamed result formats,
+        and converted to markdown with `write_markdown` if markdown is set."""
+        callbacks = [writer.write_pages for writer in doc.get('writers', {}).values()]
+        if doc['checkpoint'] is not None:
+            callbacks.insert(0, doc['checkpoint'].append)
+        if markdown:
+            callbacks.append(lambda pages: self.write_markdown(doc, pages))
+        if not callbacks:
+            return None
+
+        def on_pages(pages):
+            for callback in callbacks:
+                callback(pages)
+        return on_pages
+
+    def render_sizes(self):
+        """sizes each page is rendered at: the input size of each detection model, and full resolution."""
+        render_sizes = [None]
+        for model in [self.layout_model, self.mfd_model]:
+            if model is not None:
+                render_sizes.append(getattr(model, 'img_size', None))
+        return render_sizes
+
+    def save_outputs(self, doc, images, pdf_extract_res, save_dir, visualize=False, merge2markdown=False, md_content=None):
+        """save the json, markdown and visualization of a document.
+
+        Args:
+            doc: dict, the document, see `prepare_file`.
+            images: page source of the document (or list of the image), pages are rendered again for the visualization.
+            md_content: List[str], markdown of each page, computed here if None.
+
+        Returns:
+            dict: paths of the outputs keyed by output type.
+        """
+        basename, is_pdf = doc['basename'], doc['is_pdf']
+        os.makedirs(save_dir, exist_ok=True)
+        outputs = {}
+        if 'json' in self.result_formats:
+            outputs['json'] = os.path.join(save_dir, f"{basename}.json")
+            self.save_json_result(pdf_extract_res, outputs['json'])
+        # the pages are already written by the streamed writers
+        for result_format, writer in doc.get('writers', {}).items():
+            writer.close()
+            outputs[result_format] = writer.path
+        doc['writers'] = {}
+
+        if doc['md_writer'] is not None:
+            # the markdown is already written page by page
+            doc['md_writer'].close()
+            outputs['markdown'] = doc['md_writer'].path
+            doc['md_writer'] = None
+        elif merge2markdown:
+            if md_content is None:
+                md_content = []
+                for extract_res in pdf_extract_res:
+                    md_text = self.convert2md(extract_res)
+                    md_content.append(md_text)
+            outputs['markdown'] = os.path.join(save_dir, f"{basename}.md")
+            atomic_write(outputs['markdown'], "\n\n".join(md_content))
+
+        if visualize:
+            # pages are rendered again one by one and appended to the output file
+            outputs['visualization'] = os.path.join(save_dir, f'{basename}.pdf' if is_pdf else f"{basename}.png")
+            for page_idx, (image, page_res) in enumerate(zip(images, pdf_extract_res)):
+                self.visualize_image(image, page_res['layout_dets'], cate2color=self.color_palette)
+                if is_pdf:
+                    image.save(outputs['visualization'], 'PDF', resolution=100, append=page_idx > 0)
+                else:
+                    image.save(outputs['visualization'])
+        return outputs
+
+    def process(self, input_path, save_dir=None, visualize=False, merge2markdown=False, resume=False, checkpoint_every=16, on_markdown=None,
+                retry_failed=False):
+        """
+        A file which fails is logged and marked failed in the run manifest, the run goes on with the next file and
+        the results of the failed files are left out of the returned list.
+
+        Args:
+            resume: bool, keep a run manifest (save_dir/manifest.json) and page checkpoints, so that a restarted run
+                skips the files already done and resumes a partially processed PDF from its last checkpointed page.
+            retry_failed: bool, process again the files which failed in a previous run, they are skipped if unchanged otherwise.
+            checkpoint_every: int, number of pages between two checkpoints when resume is set, and between two writes of
+                the streamed result formats and markdown.
+            on_markdown: callable, called with the path of the file, the page index and the markdown of each page as soon as
+                the page is done, in order, when merge2markdown is set.
+        """
+        if self.pipeline_config.get('enable', False):
+            return self.process_pipelined(input_path, save_dir=save_dir, visualize=visualize, merge2markdown=merge2markdown, resume=resume,
+                                          on_markdown=on_markdown, retry_failed=retry_failed)
         file_list = self.prepare_input_files(input_path)
         res_list = []
+        manifest = RunManifest(os.path.join(save_dir, "manifest.json")) if save_dir and resume else None
         for fpath in file_list:
-            basename = os.path.basename(fpath)[:-4]
-            if fpath.endswith(".pdf") or fpath.endswith(".PDF"):
-                images = load_pdf(fpath)
-            else:
-                images = [Image.open(fpath)]
-            pdf_extract_res = self.process_single_pdf(images)
-            res_list.append(pdf_extract_res)
-            if save_dir:
-                os.makedirs(save_dir, exist_ok=True)
-                self.save_json_result(pdf_extract_res, os.path.join(save_dir, f"{basename}.json"))
-                
+            doc, images = None, None
+            try:
+                doc = self.prepare_file(fpath, save_dir, manifest, retry_failed=retry_failed)
+                if doc['skipped_res'] is not None:
+                    res_list.append(doc['skipped_res'])
+                    continue
+                if doc['previous_error'] is not None:
+                    continue
+                checkpoint, done_pages = doc['checkpoint'], doc['done_pages']
+                if doc['is_pdf']:
+                    images = open_pdf(fpath, **self.pdf_config)
+                else:
+                    images = [Image.open(fpath)]
+                if save_dir:
+                    self.open_result_writers(doc, save_dir)
+                if merge2markdown and (self.stream_markdown or on_markdown is not None):
+                    self.open_markdown_stream(doc, save_dir, on_markdown)
+                on_pages = self.on_pages_callback(doc, markdown=doc['stream_md'])
+                if doc['is_pdf']:
+                    # render each page once at the input size of each detection model, and at full resolution
+                    pages = images.iter_pages(target_sizes=self.render_sizes(), start=len(done_pages))
+                    pdf_extract_res = done_pages + self.process_single_pdf(pages, on_pages=on_pages, checkpoint_every=checkpoint_every if on_pages else None)
+                else:
+                    pdf_extract_res = self.process_single_pdf(images, on_pages=on_pages)
+                if save_dir:
+                    outputs = self.save_outputs(doc, images, pdf_extract_res, save_dir, visualize=visualize, merge2markdown=merge2markdown,
+                                                md_content=doc['md_content'] if doc['stream_md'] else None)
+                    if manifest is not None:
+                        manifest.finish(fpath, outputs, num_pages=len(pdf_extract_res))
+                        checkpoint.remove()
+                res_list.append(pdf_extract_res)
+            except Exception as e:
+                self.fail_file(fpath, e, manifest, doc)
+            finally:
+                if images is not None and doc['is_pdf']:
+                    images.close()
+
+        return res_list
+
+    def pipeline_inputs(self, file_list, save_dir=None, manifest=None, retry_failed=False):
+        """pages of all the files, in order, as the work items of the pipeline.
+
+        Each file is opened when the pipeline reaches it, the last item of a file has `last` set. A file without
+        page left to process (done, skipped, resumed after its last page, or which failed to open) gives a single
+        item without page, the error of a file which fails is kept in its `error`.
+        """
+        for fpath in file_list:
+            try:
+                doc = self.prepare_file(fpath, save_dir, manifest, retry_failed=retry_failed)
+            except Exception as e:
+                self.fail_file(fpath, e, manifest)
+                continue
+            doc['results'], doc['images'] = [], None
+            if doc['skipped_res'] is not None or doc['previous_error'] is not None:
+                yield dict(doc=doc, page=None, last=True)
+                continue
+            self.open_docs.append(doc)
+            num_pages, last_sent = 0, False
+            try:
+                if doc['is_pdf']:
+                    doc['images'] = open_pdf(fpath, **self.pdf_config)
+                    pages = doc['images'].iter_pages(target_sizes=self.render_sizes(), start=len(doc['done_pages']))
+                    num_pages = len(doc['images']) - len(doc['done_pages'])
+                else:
+                    doc['images'] = [Image.open(fpath)]
+                    pages = [ImagePage(doc['images'][0])]
+                    num_pages = 1
+                if save_dir:
+                    self.open_result_writers(doc, save_dir)
+                for idx, page in enumerate(pages):
+                    last_sent = idx == num_pages - 1
+                    yield dict(doc=doc, page=page, last=last_sent)
+            except Exception as e:
+                if last_sent:
+                    # the document is already handed over to the pipeline
+                    raise
+                doc['error'] = e
+            if not last_sent:
+                yield dict(doc=doc, page=None, last=True)
+
+    def skip_failed_docs(self, fn):
+        """stage function which records the error of a page on its document instead of stopping the pipeline,
+        the remaining pages of a failed document go through the stages without being processed."""
+        def run(task):
+            if task['doc']['error'] is None:
+                try:
+                    return fn(task)
+                except Exception as e:
+                    task['doc']['error'] = e
+            task['page'] = task['image'] = None
+            task['has_page'] = False
+            return task
+        return run
+
+    def build_pipeline(self, merge2markdown=False):
+        """stages of the pipelined processing, with the number of workers of `pipeline_config['workers']`.
+
+        Pages are rendered (rasterize), detected in batches across pages and documents (layout, mfd), their formulas
+        recognized in batches across pages (mfr), their text recognized (ocr, the lines of the pages in the stage are
+        recognized in batches together with cross_page_ocr) and converted to markdown (markdown).
+        All the stages are threads: the models stay in this process and release the GIL while they run, rendering
+        in processes is configured by `pdf_config['num_workers']`.
+        """
+        workers = self.pipeline_config.get('workers', {})
+        render_sizes = self.render_sizes()
+
+        def rasterize(task):
+            if task['page'] is not None:
+                for size in render_sizes:
+                    task['page'].array(size)
+                task['words'] = task['page'].words() if self.use_text_layer else None
+            return task
+
+        def layout(task):
+            if task['page'] is not None and self.layout_scheduler is not None:
+                layout_image = task['page'].array(getattr(self.layout_model, 'img_size', None))
+                task['layout_res'] = self.layout_scheduler.submit(layout_image).result()
+            return task
+
+        def mfd(task):
+            if task['page'] is not None and self.mfd_scheduler is not None:
+                task['mfd_res'] = self.mfd_scheduler.submit(task['page'].array(self.mfd_model.img_size)).result()
+            return task
+
+        def mfr(task):
+            if task['page'] is not None:
+                task['res'], task['image'], formula_items, formula_crops = self.page_result(
+                    task['page'], task.get('layout_res'), task.get('mfd_res'))
+                task['layout_res'] = task['mfd_res'] = None
+                if formula_crops:
+                    scope = task['doc'].setdefault('formula_scope', next(self.formula_scopes))
+                    for res, latex in zip(formula_items, self.predict_formulas(formula_crops, scope=scope)):
+                        res['latex'] = latex_rm_whitespace(latex)
+            return task
+
+        def ocr(task):
+            if task['page'] is not None:
+                if self.ocr_rec_scheduler is not None:
+                    # the lines of the page are recognized with the lines of the pages in the ocr stage concurrently
+                    line_queue = TextLineQueue(self.ocr_model.drop_score)
+                    self.ocr_single_page(task['page'].array(), task['res']['layout_dets'], words=task.get('words'), line_queue=line_queue)
+                    line_queue.flush(self.ocr_rec_scheduler.predict)
+                else:
+                    self.ocr_single_page(task['page'].array(), task['res']['layout_dets'], words=task.get('words'))
+                # the page images are not needed anymore
+                task['page'] = task['image'] = None
+                task['has_page'] = True
+            return task
+
+        def markdown(task):
+            if task.get('has_page'):
+                # the results of the page are final, they are kept in columnar form (convert2md does not change them)
+                task['res'] = PageResult.from_dict(task['res'])
                 if merge2markdown:
-                    md_content = []
-                    for extract_res in pdf_extract_res:
-                        md_text = self.convert2md(extract_res)
-                        md_content.append(md_text)
-                    with open(os.path.join(save_dir, f"{basename}.md"), "w") as f:
-                        f.write("\n\n".join(md_content))
-                        
-                if visualize:
-                    for image, page_res in zip(images, pdf_extract_res):
-                        self.visualize_image(image, page_res['layout_dets'], cate2color=self.color_palette)
-                    if fpath.endswith(".pdf") or fpath.endswith(".PDF"):
-                        first_page = images.pop(0)
-                        first_page.save(os.path.join(save_dir, f'{basename}.pdf'), 'PDF', resolution=100, save_all=True, append_images=images)
-                    else:
-                        images[0].save(os.path.join(save_dir, f"{basename}.png"))
+                    task['md'] = self.convert2md(task['res'])
+            return task
+
+        return Pipeline([
+            Stage("rasterize", self.skip_failed_docs(rasterize), workers.get('rasterize', 1)),
+            Stage("layout", self.skip_failed_docs(layout), workers.get('layout', getattr(self.layout_scheduler, 'batch_size', 1))),
+            Stage("mfd", self.skip_failed_docs(mfd), workers.get('mfd', getattr(self.mfd_scheduler, 'batch_size', 1))),
+            Stage("mfr", self.skip_failed_docs(mfr), workers.get('mfr', 4)),
+            Stage("ocr", self.skip_failed_docs(ocr), workers.get('ocr', 4 if self.ocr_rec_scheduler is not None else 1)),
+            Stage("markdown", self.skip_failed_docs(markdown), workers.get('markdown', 2)),
+        ], queue_size=self.pipeline_config.get('queue_size', 8))
 
+    def process_pipelined(self, input_path, save_dir=None, visualize=False, merge2markdown=False, resume=False, on_markdown=None,
+                          retry_failed=False):
+        """same as `process`, with the stages of consecutive pages and documents running concurrently, see `build_pipeline`.
+
+        Pages are checkpointed and written to the streamed result formats one by one. The statistics of the stages are given by `self.pipeline.stats()`.
+        """
+        file_list = self.prepare_input_files(input_path)
+        res_list = []
+        manifest = RunManifest(os.path.join(save_dir, "manifest.json")) if save_dir and resume else None
+        self.open_docs = []
+        self.pipeline = self.build_pipeline(merge2markdown=merge2markdown)
+        try:
+            for task in self.pipeline.run(self.pipeline_inputs(file_list, save_dir, manifest, retry_failed=retry_failed)):
+                doc = task['doc']
+                if doc['skipped_res'] is not None:
+                    res_list.append(doc['skipped_res'])
+                    continue
+                if doc['previous_error'] is not None:
+                    continue
+                if doc['error'] is None:
+                    try:
+                        self.collect_pipelined_page(doc, task, res_list, save_dir, manifest, visualize=visualize,
+                                                    merge2markdown=merge2markdown, on_markdown=on_markdown)
+                    except Exception as e:
+                        doc['error'] = e
+                if not task['last']:
+                    continue
+                if doc['error'] is not None:
+                    self.fail_file(doc['fpath'], doc['error'], manifest, doc)
+                if doc['is_pdf'] and doc['images'] is not None:
+                    doc['images'].close()
+                self.open_docs.remove(doc)
+        except Exception as e:
+            for doc in self.open_docs:
+                self.abort_result_writers(doc)
+                if manifest is not None:
+                    manifest.fail(doc['fpath'], e)
+                if doc['is_pdf'] and doc['images'] is not None:
+                    doc['images'].close()
+            self.open_docs = []
+            raise
         return res_list
-        
-        
-        
-        
\ No newline at end of file
+
+    def collect_pipelined_page(self, doc, task, res_list, save_dir, manifest, visualize=False, merge2markdown=False, on_markdown=None):
+        """write a page coming out of the pipeline to the outputs of its document, which are saved after its last page."""
+        if merge2markdown and not doc['stream_md']:
+            self.open_markdown_stream(doc, save_dir, on_markdown)
+        if task.get('has_page'):
+            doc['results'].append(task['res'])
+            if merge2markdown:
+                self.write_markdown(doc, [task['res']], [task['md']])
+            on_pages = self.on_pages_callback(doc)
+            if on_pages is not None:
+                on_pages([task['res']])
+        if not task['last']:
+            return
+
+        pdf_extract_res = doc['done_pages'] + doc['results']
+        if save_dir:
+            outputs = self.save_outputs(doc, doc['images'], pdf_extract_res, save_dir, visualize=visualize,
+                                        merge2markdown=merge2markdown, md_content=doc['md_content'] if merge2markdown else None)
+            if manifest is not None:
+                manifest.finish(doc['fpath'], outputs, num_pages=len(pdf_extract_res))
+                doc['checkpoint'].remove()
+        res_list.append(pdf_extract_res)
@@ -25,14 +25,61 @@ def main(config_path):
     result_path = config.get('outputs', 'outputs/pdf_extract')
     visualize = config.get('visualize', False)
     merge2markdown = config.get('merge2markdown', False)
+    stream_markdown = config.get('stream_markdown', False)
+    pdf_config = config.get('pdf_config', None)
+    use_text_layer = config.get('use_text_layer', False)
+    ocr_mode = config.get('ocr_mode', 'block')
+    cross_page_ocr = config.get('cross_page_ocr', False)
+    resume = config.get('resume', False)
+    retry_failed = config.get('retry_failed', False)
+    checkpoint_every = config.get('checkpoint_every', 16)
+    max_batch_wait = config.get('max_batch_wait', 0.05)
+    pipeline_config = config.get('pipeline', None)
+    result_formats = config.get('result_formats', None)
+    mfr_buckets = config.get('mfr_buckets', None)
 
     layout_model = task_instances['layout_detection'].model if 'layout_detection' in task_instances else None
     mfd_model = task_instances['formula_detection'].model if 'formula_detection' in task_instances else None
     mfr_model = task_instances['formula_recognition'].model if 'formula_recognition' in task_instances else None
     ocr_model = task_instances['ocr'].model if 'ocr' in task_instances else None
     
-    pdf_extract_task = TASK_REGISTRY.get(TASK_NAME)(layout_model, mfd_model, mfr_model, ocr_model)
-    extract_results = pdf_extract_task.process(input_data, save_dir=result_path, visualize=visualize, merge2markdown=merge2markdown)
+    pdf_extract_task = TASK_REGISTRY.get(TASK_NAME)(layout_model, mfd_model, mfr_model, ocr_model, pdf_config=pdf_config, use_text_layer=use_text_layer,
+                                                       max_batch_wait=max_batch_wait, pipeline_config=pipeline_config,
+                                                       result_formats=result_formats, stream_markdown=stream_markdown,
+                                                       ocr_mode=ocr_mode, cross_page_ocr=cross_page_ocr, mfr_buckets=mfr_buckets)
+    # the batch scheduler threads are stopped once the inputs are processed, or on an error
+    with pdf_extract_task:
+        extract_results = pdf_extract_task.process(input_data, save_dir=result_path, visualize=visualize, merge2markdown=merge2markdown,
+                                                   resume=resume, checkpoint_every=checkpoint_every, retry_failed=retry_failed)
+
+    if pdf_extract_task.pipeline is not None:
+        print(pdf_extract_task.pipeline.format_stats())
+    for scheduler in [pdf_extract_task.layout_scheduler, pdf_extract_task.mfd_scheduler, pdf_extract_task.mfr_scheduler,
+                      pdf_extract_task.ocr_rec_scheduler]:
+        if scheduler is not None:
+            stats = scheduler.stats()
+            print(f"{scheduler.name}: {stats['items']} items in {stats['batches']} batches, mean batch size {stats['mean_batch_size']:.1f}, "
+                  f"mean batch latency {stats['mean_batch_latency']:.3f}s")
+    if pdf_extract_task.mfr_scheduler is not None:
+        stats = pdf_extract_task.mfr_scheduler.stats()
+        print(f"formula recognition: {stats['tokens']} tokens in {stats['seconds']:.1f}s, {stats['tokens_per_sec']:.1f} tokens/s")
+        for (aspect_ratio_bucket, area_bucket), bucket_stats in stats['buckets'].items():
+            print(f"  aspect ratio bucket {aspect_ratio_bucket}, area bucket {area_bucket}: {bucket_stats['items']} formulas in "
+                  f"{bucket_stats['batches']} batches, mean batch latency {bucket_stats['mean_batch_latency']:.3f}s, "
+                  f"{bucket_stats['tokens_per_sec']:.1f} tokens/s")
+    if ocr_model is not None and hasattr(ocr_model, 'rec_stats'):
+        stats = ocr_model.rec_stats()
+        print(f"text recognition: {stats['lines']} lines in {stats['batches']} batches, {stats['seconds']:.1f}s, "
+              f"{stats['lines_per_sec']:.1f} lines/s")
+    if pdf_extract_task.formula_cache is not None:
+        stats = pdf_extract_task.formula_cache.stats()
+        print(f"formula dedup: {stats['hits']} hits, {stats['misses']} misses, hit rate {stats['hit_rate']:.2%}, {stats['entries']} entries")
+    for task_name, task in task_instances.items():
+        cache = getattr(task.model, 'cache', None)
+        if cache is not None:
+            stats = cache.stats()
+            print(f"{task_name} cache: {stats['hits']} hits, {stats['misses']} misses, hit rate {stats['hit_rate']:.2%}, "
+                  f"{stats['entries']} entries, {stats['size'] / 1024 / 1024:.1f} MB")
 
     print(f'Task done, results can be found at {result_path}')
 
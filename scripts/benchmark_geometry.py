@@ -0,0 +1,142 @@
+import os
+import sys
+import copy
+import time
+import random
+import os.path as osp
+import argparse
+
+import numpy as np
+
+sys.path.append(osp.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pdf_extract_kit.utils.geometry import group_lines, merge_line_x_overlaps
+from pdf_extract_kit.utils.merge_blocks_and_spans import fill_spans_in_blocks, fix_block_spans
+from tests.test_merge_blocks_and_spans import reference_fill_spans_in_blocks, random_page
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized geometry kernels against the scalar implementation.")
+    parser.add_argument('--num-spans', type=int, nargs='+', default=[5000],
+                        help='Number of spans per page, one run per value. Pages of more than MAX_DENSE_PAIRS span x block pairs (over 5k spans here) '
+                             'are filled in blocks with the grid index.')
+    parser.add_argument('--num-pages', type=int, default=3, help='Number of random pages.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs, the best one is reported.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    return parser.parse_args()
+
+
+# scalar reference implementation: the per pair python code the geometry kernels replace, with the reference
+# fill_spans_in_blocks of tests/test_merge_blocks_and_spans.py
+
+def is_overlaps_y_exceeds_threshold(bbox1, bbox2, overlap_ratio_threshold=0.8):
+    _, y0_1, _, y1_1 = bbox1
+    _, y0_2, _, y1_2 = bbox2
+    overlap = max(0, min(y1_1, y1_2) - max(y0_1, y0_2))
+    min_height = min(y1_1 - y0_1, y1_2 - y0_2)
+    return (overlap / min_height) > overlap_ratio_threshold
+
+def reference_merge_spans_to_line(spans, isolated_types=('isolated',)):
+    if len(spans) == 0:
+        return []
+    spans.sort(key=lambda span: span['bbox'][1])
+    lines = []
+    current_line = [spans[0]]
+    for span in spans[1:]:
+        if span.get('type') in isolated_types or any(s.get('type') in isolated_types for s in current_line):
+            lines.append(current_line)
+            current_line = [span]
+            continue
+        if is_overlaps_y_exceeds_threshold(span['bbox'], current_line[-1]['bbox']):
+            current_line.append(span)
+        else:
+            lines.append(current_line)
+            current_line = [span]
+    lines.append(current_line)
+    return lines
+
+def reference_sort_lines(lines):
+    line_objects = []
+    for line in lines:
+        line.sort(key=lambda span: span['bbox'][0])
+        line_bbox = [
+            min(span['bbox'][0] for span in line),
+            min(span['bbox'][1] for span in line),
+            max(span['bbox'][2] for span in line),
+            max(span['bbox'][3] for span in line),
+        ]
+        line_objects.append({"bbox": line_bbox, "spans": line})
+    return line_objects
+
+def reference_fix_block_spans(block_with_spans):
+    for block in block_with_spans:
+        if block['type'] != "isolate_formula":
+            for span in block['spans']:
+                if span['type'] == "isolated":
+                    span['type'] = "inline"
+        block['lines'] = reference_sort_lines(reference_merge_spans_to_line(block['spans']))
+        del block['spans']
+    return block_with_spans
+
+def reference_merge_det_boxes(bboxes):
+    lines = reference_merge_spans_to_line([{'bbox': bbox} for bbox in bboxes])
+    merged_boxes = []
+    for line in lines:
+        spans = sorted((span['bbox'] for span in line), key=lambda x: x[0])
+        merged = []
+        for span in spans:
+            x1, y1, x2, y2 = span
+            if not merged or merged[-1][2] < x1:
+                merged.append(span)
+            else:
+                last_span = merged.pop()
+                merged.append((min(last_span[0], x1), min(last_span[1], y1), max(last_span[2], x2), max(last_span[3], y2)))
+        merged_boxes.extend(merged)
+    return merged_boxes
+
+
+def markdown_lines(block_with_spans):
+    return [[(line['bbox'], [span['content'] for span in line['spans']]) for line in block['lines']] for block in block_with_spans]
+
+def best_time(fn, repeat):
+    cost = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        cost = min(cost, time.perf_counter() - start)
+    return cost
+
+def main(args):
+    rng = random.Random(args.seed)
+    print(f"{'kernel':<26}{'spans':>8}{'scalar(ms)':>12}{'numpy(ms)':>12}{'speedup':>10}")
+    for page_idx, num_spans in enumerate(num_spans for num_spans in args.num_spans for _ in range(args.num_pages)):
+        blocks, spans = random_page(num_spans, rng)
+
+        # markdown merge path: spans assigned to blocks, grouped into lines and sorted from left to right
+        def scalar_markdown():
+            blocks_copy, spans_copy = copy.deepcopy((blocks, spans))
+            return markdown_lines(reference_fix_block_spans(reference_fill_spans_in_blocks(blocks_copy, spans_copy, 0.6)[0]))
+
+        def numpy_markdown():
+            blocks_copy, spans_copy = copy.deepcopy((blocks, spans))
+            return markdown_lines(fix_block_spans(fill_spans_in_blocks(blocks_copy, spans_copy, 0.6)[0]))
+
+        assert scalar_markdown() == numpy_markdown(), f"markdown merge differs on page {page_idx}"
+        copy_cost = best_time(lambda: copy.deepcopy((blocks, spans)), args.repeat)
+        scalar_cost = best_time(scalar_markdown, args.repeat) - copy_cost
+        numpy_cost = best_time(numpy_markdown, args.repeat) - copy_cost
+        print(f"{'markdown merge':<26}{len(spans):>8}{scalar_cost * 1000:>12.1f}{numpy_cost * 1000:>12.1f}{scalar_cost / max(numpy_cost, 1e-9):>9.1f}x")
+
+        # ocr box merge path: detection boxes (float32 like the text detector output) merged into lines
+        det_bboxes = np.array([span['bbox'] for span in spans], dtype=np.float32)
+        scalar_boxes = lambda: reference_merge_det_boxes(list(det_bboxes))
+        numpy_boxes = lambda: merge_line_x_overlaps(det_bboxes, group_lines(det_bboxes))
+        assert np.array_equal(np.array(scalar_boxes(), dtype=np.float32), numpy_boxes()), f"ocr box merge differs on page {page_idx}"
+        scalar_cost = best_time(scalar_boxes, args.repeat)
+        numpy_cost = best_time(numpy_boxes, args.repeat)
+        print(f"{'ocr box merge':<26}{len(spans):>8}{scalar_cost * 1000:>12.1f}{numpy_cost * 1000:>12.1f}{scalar_cost / max(numpy_cost, 1e-9):>9.1f}x")
+    print("outputs of the scalar and numpy implementations are identical")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+import time
+import random
+import os.path as osp
+import argparse
+
+sys.path.append(osp.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pdf_extract_kit.utils.latex import latex_rm_whitespace
+from tests.test_latex import reference_latex_rm_whitespace, random_formula
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark latex_rm_whitespace against the previous implementation on a formula corpus "
+                                                 "(checked on random strings by tests/test_latex.py).")
+    parser.add_argument('--inputs', type=str, nargs='*', default=None,
+                        help='Formula corpus: text files with one formula per line, or JSON results (pdf2markdown outputs) whose latex is used. Random formulas if not set.')
+    parser.add_argument('--num-formulas', type=int, default=20000, help='Number of random formulas.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs, the best one is reported.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    return parser.parse_args()
+
+
+def load_formulas(paths):
+    formulas = []
+    for path in paths:
+        if path.endswith('.json'):
+            with open(path, encoding='utf-8') as f:
+                for page in json.load(f):
+                    formulas.extend(det['latex'] for det in page['layout_dets'] if 'latex' in det)
+        else:
+            with open(path, encoding='utf-8') as f:
+                formulas.extend(line.rstrip('\n') for line in f)
+    return formulas
+
+
+def best_time(fn, repeat):
+    cost = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        cost = min(cost, time.perf_counter() - start)
+    return cost
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    formulas = load_formulas(args.inputs) if args.inputs else [random_formula(rng) for _ in range(args.num_formulas)]
+    for formula in formulas:
+        assert latex_rm_whitespace(formula) == reference_latex_rm_whitespace(formula), f"output differs on {formula!r}"
+    reference_cost = best_time(lambda: [reference_latex_rm_whitespace(formula) for formula in formulas], args.repeat)
+    cost = best_time(lambda: [latex_rm_whitespace(formula) for formula in formulas], args.repeat)
+    print(f"{len(formulas)} formulas, outputs are identical")
+    print(f"previous: {reference_cost:.3f}s ({len(formulas) / reference_cost:.0f} formulas/s), "
+          f"new: {cost:.3f}s ({len(formulas) / cost:.0f} formulas/s), speedup {reference_cost / cost:.1f}x")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import os.path as osp
+import argparse
+
+import numpy as np
+
+sys.path.append(osp.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pdf_extract_kit.utils.geometry import reading_order
+from pdf_extract_kit.tasks.ocr.models.paddle_ocr import update_det_boxes, bbox_to_points, points_to_bbox
+from tests.test_geometry import (reference_sorted_boxes, reference_is_overlaps_y_exceeds_threshold, reference_remove_intervals,
+                                  random_text_boxes, random_formula_page)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized OCR box functions against the previous implementation "
+                                                 "(checked by tests/test_geometry.py).")
+    parser.add_argument('--num-boxes', type=int, default=10000, help='Number of text boxes of the benchmark.')
+    parser.add_argument('--num-formulas', type=int, default=500, help='Number of inline formulas of the update_det_boxes benchmark.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs, the best one is reported.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    return parser.parse_args()
+
+
+# previous implementation, with the reference functions of tests/test_geometry.py
+
+def reference_update_det_boxes(dt_boxes, mfd_res):
+    new_dt_boxes = []
+    for text_box in dt_boxes:
+        text_bbox = points_to_bbox(text_box)
+        masks_list = []
+        for mf_box in mfd_res:
+            mf_bbox = mf_box['bbox']
+            if reference_is_overlaps_y_exceeds_threshold(text_bbox, mf_bbox):
+                masks_list.append([mf_bbox[0], mf_bbox[2]])
+        text_x_range = [text_bbox[0], text_bbox[2]]
+        text_remove_mask_range = reference_remove_intervals(text_x_range, masks_list)
+        temp_dt_box = []
+        for text_remove_mask in text_remove_mask_range:
+            temp_dt_box.append(bbox_to_points([text_remove_mask[0], text_bbox[1], text_remove_mask[1], text_bbox[3]]))
+        if len(temp_dt_box) > 0:
+            new_dt_boxes.extend(temp_dt_box)
+    return new_dt_boxes
+
+
+def check_update_det_boxes(args, rng):
+    print(f"{'input':<34}{'boxes':>8}{'formulas':>10}{'previous(ms)':>14}{'numpy(ms)':>12}{'speedup':>10}")
+    for num_lines, num_formulas in [(60, 20), (60, args.num_formulas), (200, args.num_formulas)]:
+        line_bboxes, mfd_res = random_formula_page(num_lines, num_formulas, rng)
+        dt_boxes = [bbox_to_points(bbox) for bbox in line_bboxes]
+        assert np.array_equal(np.array(update_det_boxes(dt_boxes, mfd_res)), np.array(reference_update_det_boxes(dt_boxes, mfd_res)))
+        reference_cost = best_time(lambda: reference_update_det_boxes(dt_boxes, mfd_res), args.repeat)
+        cost = best_time(lambda: update_det_boxes(dt_boxes, mfd_res), args.repeat)
+        print(f"{'page':<34}{len(dt_boxes):>8}{len(mfd_res):>10}{reference_cost * 1000:>14.1f}{cost * 1000:>12.1f}{reference_cost / cost:>9.1f}x")
+
+
+def best_time(fn, repeat):
+    cost = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        cost = min(cost, time.perf_counter() - start)
+    return cost
+
+
+def sorted_boxes(dt_boxes):
+    return list(dt_boxes[reading_order(dt_boxes[:, 0, 0], dt_boxes[:, 0, 1])])
+
+
+def check_sorted_boxes(args, rng):
+    print(f"{'input':<34}{'boxes':>8}{'previous(ms)':>14}{'numpy(ms)':>12}{'speedup':>10}")
+    for name, line_pitch, jitter in [('text lines (20 px)', 20, 2), ('dense table rows (8 px)', 8, 1), ('chained rows (6 px, 4 px jitter)', 6, 4),
+                                     ('one chain (0.5 px)', 0.5, 0)]:
+        dt_boxes = random_text_boxes(args.num_boxes, rng, line_pitch=line_pitch, jitter=jitter)
+        assert np.array_equal(np.array(sorted_boxes(dt_boxes)), np.array(reference_sorted_boxes(dt_boxes))), f"sorted_boxes differs on {name}"
+        reference_cost = best_time(lambda: reference_sorted_boxes(dt_boxes), args.repeat)
+        cost = best_time(lambda: sorted_boxes(dt_boxes), args.repeat)
+        print(f"{name:<34}{len(dt_boxes):>8}{reference_cost * 1000:>14.1f}{cost * 1000:>12.1f}{reference_cost / cost:>9.1f}x")
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    check_sorted_boxes(args, rng)
+    check_update_det_boxes(args, rng)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
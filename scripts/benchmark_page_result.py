@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import time
+import random
+import os.path as osp
+import argparse
+import tracemalloc
+
+sys.path.append(osp.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pdf_extract_kit.utils.page_result import PageResult, dumps_json
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the memory and JSON serialization of columnar page results.")
+    parser.add_argument('--inputs', type=str, default=None, help='JSON result of a document (pdf2markdown output), random pages if not set.')
+    parser.add_argument('--num-pages', type=int, default=20, help='Number of random pages.')
+    parser.add_argument('--num-dets', type=int, default=2000, help='Number of detections per random page.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    return parser.parse_args()
+
+def random_page(page_no, num_dets, rng):
+    """layout and formula detections with int polys, ocr lines with float polys and text."""
+    layout_dets = []
+    for _ in range(num_dets):
+        x, y = rng.uniform(0, 1600), rng.uniform(0, 2300)
+        kind = rng.random()
+        if kind < 0.1:
+            xmin, ymin = int(x), int(y)
+            layout_dets.append({'category_type': rng.choice(['title', 'plain text', 'figure']),
+                                'poly': [xmin, ymin, xmin + 400, ymin, xmin + 400, ymin + 200, xmin, ymin + 200],
+                                'score': round(rng.random(), 2)})
+        elif kind < 0.25:
+            xmin, ymin = int(x), int(y)
+            layout_dets.append({'category_type': 'inline', 'poly': [xmin, ymin, xmin + 80, ymin, xmin + 80, ymin + 20, xmin, ymin + 20],
+                                'score': round(rng.random(), 2), 'latex': '\\frac{a_{i}}{b^{2}}'})
+        else:
+            width, height = rng.uniform(50, 700), rng.uniform(15, 30)
+            layout_dets.append({'category_type': 'text', 'poly': [x, y, x + width, y, x + width, y + height, x, y + height],
+                                'score': round(rng.random(), 2), 'text': 'lorem ipsum dolor sit amet ' * rng.randint(1, 3)})
+    return {'layout_dets': layout_dets, 'page_info': {'page_no': page_no, 'height': 2339, 'width': 1654}}
+
+def traced_memory(fn):
+    tracemalloc.start()
+    result = fn()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, memory
+
+def best_time(fn, repeat=3):
+    cost = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        cost = min(cost, time.perf_counter() - start)
+    return cost
+
+def main(args):
+    if args.inputs:
+        load = lambda: json.load(open(args.inputs, encoding='utf-8'))
+    else:
+        rng = random.Random(args.seed)
+        load = lambda: [random_page(idx, args.num_dets, rng) for idx in range(args.num_pages)]
+    pages, dict_memory = traced_memory(load)
+    page_results, columnar_memory = traced_memory(lambda: [PageResult.from_dict(page) for page in pages])
+    num_dets = sum(len(page['layout_dets']) for page in pages)
+
+    for indent in [2, None]:
+        assert dumps_json(page_results, indent=indent) == json.dumps(pages, ensure_ascii=False, indent=indent), "JSON differs"
+    print(f"{len(pages)} pages, {num_dets} detections, JSON of the dict and columnar results is identical")
+    print(f"{'':<24}{'dict':>12}{'columnar':>12}{'ratio':>8}")
+    print(f"{'memory (MB)':<24}{dict_memory / 2**20:>12.2f}{columnar_memory / 2**20:>12.2f}{dict_memory / columnar_memory:>7.1f}x")
+    for indent in [2, None]:
+        dict_cost = best_time(lambda: json.dumps(pages, ensure_ascii=False, indent=indent))
+        columnar_cost = best_time(lambda: dumps_json(page_results, indent=indent))
+        print(f"{f'json indent={indent} (s)':<24}{dict_cost:>12.3f}{columnar_cost:>12.3f}{dict_cost / columnar_cost:>7.1f}x")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import resource
+import os.path as osp
+import argparse
+import multiprocessing
+
+sys.path.append(osp.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pdf_extract_kit.utils.data_preprocess import PDFPageSource
+from pdf_extract_kit.utils.rasterizer import list_rasterizers
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the PDF rasterizer backends.")
+    parser.add_argument('--inputs', type=str, required=True, help='Path to a PDF file or a directory containing PDF files.')
+    parser.add_argument('--dpi', type=int, default=144, help='Rendering resolution.')
+    parser.add_argument('--backends', type=str, nargs='+', default=None, help='Backends to benchmark, default to all installed backends.')
+    parser.add_argument('--max-pages', type=int, default=None, help='Maximum number of pages rendered per PDF.')
+    return parser.parse_args()
+
+def run_backend(backend, pdf_paths, dpi, max_pages, queue):
+    """Render the pages in a fresh process, so the peak RSS only accounts for this backend."""
+    num_pages = 0
+    start = time.time()
+    for pdf_path in pdf_paths:
+        with PDFPageSource(pdf_path, dpi=dpi, backend=backend) as pages:
+            for idx, image in enumerate(pages):
+                if max_pages is not None and idx >= max_pages:
+                    break
+                image.load()
+                num_pages += 1
+    cost = time.time() - start
+    # ru_maxrss is in kilobytes on linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((num_pages, cost, peak_rss))
+
+def main(args):
+    if os.path.isdir(args.inputs):
+        pdf_paths = sorted(os.path.join(args.inputs, f) for f in os.listdir(args.inputs) if f.lower().endswith('.pdf'))
+    else:
+        pdf_paths = [args.inputs]
+    backends = args.backends or list_rasterizers()
+
+    ctx = multiprocessing.get_context('spawn')
+    print(f"{'backend':<12}{'pages':>8}{'time(s)':>10}{'pages/s':>10}{'peak RSS(MB)':>14}")
+    for backend in backends:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=run_backend, args=(backend, pdf_paths, args.dpi, args.max_pages, queue))
+        proc.start()
+        num_pages, cost, peak_rss = queue.get()
+        proc.join()
+        print(f"{backend:<12}{num_pages:>8}{cost:>10.2f}{num_pages / max(cost, 1e-9):>10.2f}{peak_rss:>14.1f}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,194 @@
+import numpy as np
+import pytest
+
+from pdf_extract_kit.utils.geometry import pairwise_y_overlap_ratio, reading_order, subtract_x_intervals
+
+
+# previous implementation of the PaddleOCR sorted_boxes, the reference of reading_order
+
+def reference_sorted_boxes(dt_boxes):
+    num_boxes = dt_boxes.shape[0]
+    sorted_boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
+    _boxes = list(sorted_boxes)
+
+    for i in range(num_boxes - 1):
+        for j in range(i, -1, -1):
+            if abs(_boxes[j + 1][0][1] - _boxes[j][0][1]) < 10 and \
+                    (_boxes[j + 1][0][0] < _boxes[j][0][0]):
+                tmp = _boxes[j]
+                _boxes[j] = _boxes[j + 1]
+                _boxes[j + 1] = tmp
+            else:
+                break
+    return _boxes
+
+
+def quads(bboxes):
+    x0, y0, x1, y1 = bboxes.T
+    return np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1), np.stack([x1, y1], 1), np.stack([x0, y1], 1)], 1).astype(np.float32)
+
+
+def random_text_boxes(num_boxes, rng, line_pitch=None, jitter=None, integer=False):
+    """boxes of text lines made of words, in random order: jittered y within a line, lines line_pitch px apart."""
+    line_pitch = rng.uniform(4, 30) if line_pitch is None else line_pitch
+    jitter = rng.uniform(0, 12) if jitter is None else jitter
+    words_per_line = int(rng.integers(1, 12))
+    line_idx = np.arange(num_boxes) // words_per_line
+    x0 = (np.arange(num_boxes) % words_per_line) * 60 + rng.uniform(-40, 40, num_boxes)
+    y0 = line_idx * line_pitch + rng.uniform(-jitter, jitter, num_boxes)
+    if integer:
+        # detector boxes are often on integer pixels, with ties in y and x
+        x0, y0 = np.round(x0), np.round(y0)
+    bboxes = np.stack([x0, y0, x0 + rng.uniform(10, 60, num_boxes), y0 + rng.uniform(8, 20, num_boxes)], 1)
+    return quads(bboxes[rng.permutation(num_boxes)])
+
+
+def sort_boxes(dt_boxes):
+    return dt_boxes[reading_order(dt_boxes[:, 0, 0], dt_boxes[:, 0, 1])]
+
+
+def assert_same_boxes(boxes, expected):
+    assert np.array_equal(np.asarray(boxes).reshape(-1, 4, 2), np.asarray(expected).reshape(-1, 4, 2))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_reading_order_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    for idx in range(250):
+        dt_boxes = random_text_boxes(int(rng.integers(0, 200)), rng, integer=idx % 2 == 0)
+        if idx % 3 == 0:
+            dt_boxes = dt_boxes.astype(np.float64)
+        assert_same_boxes(sort_boxes(dt_boxes), reference_sorted_boxes(dt_boxes))
+
+
+@pytest.mark.parametrize('line_pitch, jitter', [(20, 2), (8, 1), (6, 4), (0.5, 0)])
+def test_reading_order_chained_lines(line_pitch, jitter):
+    # rows closer than 10 px chain into lines higher than 10 px, the boxes then move across rows
+    rng = np.random.default_rng(0)
+    dt_boxes = random_text_boxes(2000, rng, line_pitch=line_pitch, jitter=jitter)
+    assert_same_boxes(sort_boxes(dt_boxes), reference_sorted_boxes(dt_boxes))
+
+
+def test_reading_order_ties():
+    bboxes = np.array([[5, 0, 9, 8], [0, 0, 4, 8], [5, 0, 9, 8], [0, 9, 4, 17], [0, 19, 4, 27], [3, 10, 7, 18]], dtype=np.float32)
+    dt_boxes = quads(bboxes)
+    assert_same_boxes(sort_boxes(dt_boxes), reference_sorted_boxes(dt_boxes))
+
+
+def test_reading_order_empty():
+    assert len(reading_order(np.zeros(0), np.zeros(0))) == 0
+
+
+# previous implementation of the split of the text boxes at the inline formulas (update_det_boxes), the reference
+# of pairwise_y_overlap_ratio and subtract_x_intervals
+
+def reference_is_overlaps_y_exceeds_threshold(bbox1, bbox2, overlap_ratio_threshold=0.8):
+    _, y0_1, _, y1_1 = bbox1
+    _, y0_2, _, y1_2 = bbox2
+
+    overlap = max(0, min(y1_1, y1_2) - max(y0_1, y0_2))
+    height1, height2 = y1_1 - y0_1, y1_2 - y0_2
+    min_height = min(height1, height2)
+
+    return (overlap / min_height) > overlap_ratio_threshold
+
+
+def reference_merge_intervals(intervals):
+    intervals.sort(key=lambda x: x[0])
+
+    merged = []
+    for interval in intervals:
+        if not merged or merged[-1][1] < interval[0]:
+            merged.append(interval)
+        else:
+            merged[-1][1] = max(merged[-1][1], interval[1])
+
+    return merged
+
+
+def reference_remove_intervals(original, masks):
+    merged_masks = reference_merge_intervals(masks)
+
+    result = []
+    original_start, original_end = original
+
+    for mask in merged_masks:
+        mask_start, mask_end = mask
+        if mask_start > original_end:
+            continue
+        if mask_end < original_start:
+            continue
+        if original_start < mask_start:
+            result.append([original_start, mask_start - 1])
+        original_start = max(mask_end + 1, original_start)
+
+    if original_start <= original_end:
+        result.append([original_start, original_end])
+
+    return result
+
+
+def reference_split_boxes(text_bboxes, mfd_res):
+    pieces = []
+    for text_bbox in text_bboxes:
+        masks_list = []
+        for mf_box in mfd_res:
+            mf_bbox = mf_box['bbox']
+            if reference_is_overlaps_y_exceeds_threshold(text_bbox, mf_bbox):
+                masks_list.append([mf_bbox[0], mf_bbox[2]])
+        text_x_range = [text_bbox[0], text_bbox[2]]
+        for start, end in reference_remove_intervals(text_x_range, masks_list):
+            pieces.append([start, text_bbox[1], end, text_bbox[3]])
+    return np.array(pieces, dtype=np.float32).reshape(-1, 4)
+
+
+def split_boxes(text_bboxes, mfd_res):
+    mf_bboxes = np.asarray([mf_box['bbox'] for mf_box in mfd_res], dtype=text_bboxes.dtype).reshape(-1, 4)
+    masked = pairwise_y_overlap_ratio(text_bboxes, mf_bboxes) > 0.8
+    return subtract_x_intervals(text_bboxes, mf_bboxes, masked)
+
+
+def random_formula_page(num_lines, num_formulas, rng):
+    """merged text lines (float32 detections) of a page and its inline formulas (int bboxes) in random order, some
+    overlapping or touching each other, crossing the ends of the lines, or on two lines (not masking either)."""
+    line_y0 = np.arange(num_lines) * 30 + rng.uniform(-2, 2, num_lines)
+    line_x0 = rng.uniform(0, 40, num_lines)
+    line_bboxes = np.stack([line_x0, line_y0, line_x0 + rng.uniform(100, 1200, num_lines), line_y0 + rng.uniform(16, 24, num_lines)], 1)
+    lines = rng.integers(0, num_lines, num_formulas)
+    x0 = np.round(rng.uniform(line_bboxes[lines, 0] - 60, line_bboxes[lines, 2] + 20))
+    y0 = np.round(line_bboxes[lines, 1] + rng.choice([-3, -1, 0, 2, 8, 15], num_formulas))
+    bboxes = np.stack([x0, y0, x0 + rng.choice([0, 1, 5, 20, 80, 300], num_formulas), y0 + rng.choice([4, 14, 20, 22, 30, 50], num_formulas)], 1)
+    mfd_res = [{'bbox': [int(v) for v in bbox]} for bbox in bboxes]
+    return line_bboxes.astype(np.float32), [mfd_res[idx] for idx in rng.permutation(num_formulas)]
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_split_boxes_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(250):
+        text_bboxes, mfd_res = random_formula_page(int(rng.integers(1, 40)), int(rng.integers(0, 60)), rng)
+        pieces, rows = split_boxes(text_bboxes, mfd_res)
+        assert np.array_equal(pieces, reference_split_boxes(text_bboxes, mfd_res))
+        assert np.array_equal(pieces[:, [1, 3]], text_bboxes[rows][:, [1, 3]])
+
+
+def test_split_boxes_large_page():
+    rng = np.random.default_rng(0)
+    text_bboxes, mfd_res = random_formula_page(200, 500, rng)
+    assert np.array_equal(split_boxes(text_bboxes, mfd_res)[0], reference_split_boxes(text_bboxes, mfd_res))
+
+
+def test_subtract_x_intervals_merges_touching_masks():
+    bboxes = np.array([[0, 0, 100, 10]], dtype=np.float64)
+    # [10, 20] and [21, 30] touch, [25, 40] overlaps them, [95, 120] crosses the end of the bbox
+    masks = np.array([[25, 0, 40, 10], [10, 0, 20, 10], [21, 0, 30, 10], [95, 0, 120, 10], [60, 0, 70, 10]], dtype=np.float64)
+    applies = np.array([[True, True, True, True, False]])
+    pieces, rows = subtract_x_intervals(bboxes, masks, applies)
+    assert pieces.tolist() == [[0, 0, 9, 10], [41, 0, 94, 10]]
+    assert rows.tolist() == [0, 0]
+
+
+def test_subtract_x_intervals_without_masks():
+    bboxes = np.array([[0, 0, 10, 10], [5, 20, 50, 30]], dtype=np.float32)
+    pieces, rows = subtract_x_intervals(bboxes, np.zeros((0, 4)), np.zeros((2, 0), dtype=bool))
+    assert np.array_equal(pieces, bboxes) and rows.tolist() == [0, 1]
@@ -0,0 +1,82 @@
+import re
+import random
+
+import pytest
+
+from pdf_extract_kit.utils.latex import latex_rm_whitespace
+
+try:
+    from hypothesis import given, settings, strategies as st
+except ImportError:
+    given = None
+
+
+def reference_latex_rm_whitespace(s: str):
+    """previous implementation, the regexes are compiled in each iteration until a fixed point."""
+    text_reg = r'(\\(operatorname|mathrm|text|mathbf)\s?\*? {.*?})'
+    letter = '[a-zA-Z]'
+    noletter = r'[\W_^\d]'
+    names = [x[0].replace(' ', '') for x in re.findall(text_reg, s)]
+    s = re.sub(text_reg, lambda match: str(names.pop(0)), s)
+    news = s
+    while True:
+        s = news
+        news = re.sub(r'(?!\\ )(%s)\s+?(%s)' % (noletter, noletter), r'\1\2', s)
+        news = re.sub(r'(?!\\ )(%s)\s+?(%s)' % (noletter, letter), r'\1\2', news)
+        news = re.sub(r'(%s)\s+?(%s)' % (letter, noletter), r'\1\2', news)
+        if news == s:
+            break
+    return s
+
+
+# pieces of the random strings: letters, digits and symbols of each character class (also non ascii letters and
+# digits), runs of spaces, other whitespace, escaped spaces and the groups whose spaces are removed
+STRING_PIECES = ['a', 'Z', 'x', '1', '0', '_', '^', '\\', '{', '}', '(', '+', '=', '*', '\\\\', 'α', '中', 'é', '٣',
+                 ' ', ' ', ' ', '  ', '   ', '\\ ', '\t', '\n', '\xa0', '\\text {', '\\mathrm {', '\\mathbf *{', '\\operatorname {']
+
+# tokens of the formulas, the recognition model outputs them separated by single spaces
+FORMULA_TOKENS = ['x', 'y', 'n', 'i', '1', '2', '0', '=', '+', '-', '(', ')', '^', '_', '{', '}', ',', '\\alpha', '\\beta',
+                  '\\frac', '\\sum', '\\int', '\\left(', '\\right)', '\\mathrm { d }', '\\text { if }', '\\cdot', '\\\\', '&']
+
+
+def random_string(rng):
+    return ''.join(rng.choice(STRING_PIECES) for _ in range(rng.randint(0, 16)))
+
+
+def random_formula(rng):
+    return ' '.join(rng.choice(FORMULA_TOKENS) for _ in range(rng.randint(5, 120)))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_latex_rm_whitespace_random_strings(seed):
+    rng = random.Random(seed)
+    for _ in range(20000):
+        s = random_string(rng)
+        assert latex_rm_whitespace(s) == reference_latex_rm_whitespace(s), f"output differs on {s!r}"
+
+
+def test_latex_rm_whitespace_random_formulas():
+    rng = random.Random(0)
+    for _ in range(2000):
+        formula = random_formula(rng)
+        assert latex_rm_whitespace(formula) == reference_latex_rm_whitespace(formula), f"output differs on {formula!r}"
+
+
+@pytest.mark.parametrize('s, expected', [
+    ('x + y', 'x+y'),
+    ('a b', 'a b'),
+    ('\\alpha \\beta', '\\alpha\\beta'),
+    ('a \\ b', 'a\\ b'),
+    ('\\frac { 1 } { 2 }', '\\frac{1}{2}'),
+    ('\\mathrm { d } x', '\\mathrm{d}x'),
+    ('', ''),
+])
+def test_latex_rm_whitespace_examples(s, expected):
+    assert latex_rm_whitespace(s) == reference_latex_rm_whitespace(s) == expected
+
+
+if given is not None:
+    @settings(max_examples=2000, deadline=None)
+    @given(st.one_of(st.lists(st.sampled_from(STRING_PIECES), max_size=24).map(''.join), st.text(max_size=32)))
+    def test_latex_rm_whitespace_property(s):
+        assert latex_rm_whitespace(s) == reference_latex_rm_whitespace(s)
@@ -0,0 +1,101 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from pdf_extract_kit.utils import merge_blocks_and_spans
+from pdf_extract_kit.utils.merge_blocks_and_spans import SpanGrid, fill_spans_in_blocks
+
+
+# previous implementation of fill_spans_in_blocks, the reference of the overlap matrix and the grid index
+
+def calculate_overlap_area_in_bbox1_area_ratio(bbox1, bbox2):
+    x_left = max(bbox1[0], bbox2[0])
+    y_top = max(bbox1[1], bbox2[1])
+    x_right = min(bbox1[2], bbox2[2])
+    y_bottom = min(bbox1[3], bbox2[3])
+    if x_right < x_left or y_bottom < y_top:
+        return 0.0
+    intersection_area = (x_right - x_left) * (y_bottom - y_top)
+    bbox1_area = (bbox1[2] - bbox1[0]) * (bbox1[3] - bbox1[1])
+    if bbox1_area == 0:
+        return 0
+    return intersection_area / bbox1_area
+
+
+def reference_fill_spans_in_blocks(blocks, spans, radio):
+    block_with_spans = []
+    for block in blocks:
+        L, U, R, D = block['poly'][0], block['poly'][1], block['poly'][2], block['poly'][5]
+        block_bbox = [min(L, R), min(U, D), max(L, R), max(U, D)]
+        block_spans = [span for span in spans if calculate_overlap_area_in_bbox1_area_ratio(span['bbox'], block_bbox) > radio]
+        for span in block_spans:
+            spans.remove(span)
+        block_with_spans.append({'type': block['category_type'], 'bbox': block_bbox, 'saved_info': block, 'spans': block_spans})
+    return block_with_spans, spans
+
+
+def random_page(num_spans, rng):
+    """blocks of text lines made of words, inline and isolated formulas, with jittered overlapping boxes."""
+    blocks, spans = [], []
+    num_blocks = max(num_spans // 100, 1)
+    for block_idx in range(num_blocks):
+        x0, y0 = (block_idx % 2) * 800 + rng.uniform(0, 40), (block_idx // 2) * 420 + rng.uniform(0, 20)
+        block_type = rng.choice(["plain text", "plain text", "title", "isolate_formula"])
+        blocks.append({'category_type': block_type, 'poly': [x0, y0, x0 + 760, y0, x0 + 760, y0 + 400, x0, y0 + 400]})
+        for line_idx in range(20):
+            x, y = x0 + rng.uniform(0, 10), y0 + line_idx * 20 + rng.uniform(-2, 2)
+            for _ in range(5):
+                width, height = rng.uniform(20, 200), rng.uniform(12, 20)
+                span_type = rng.choice(["text", "text", "text", "inline", "isolated"])
+                spans.append({'type': span_type, 'bbox': [x, y + rng.uniform(-3, 3), x + width, y + height], 'content': str(len(spans))})
+                x += width + rng.uniform(-15, 10)
+    rng.shuffle(spans)
+    return blocks, spans[:num_spans]
+
+
+def filled_contents(block_with_spans, spans):
+    return [[span['content'] for span in block['spans']] for block in block_with_spans], [span['content'] for span in spans]
+
+
+def check_fill_spans(blocks, spans, radio, monkeypatch):
+    expected = filled_contents(*reference_fill_spans_in_blocks(*copy.deepcopy((blocks, spans)), radio))
+    for max_dense_pairs in (0, 1 << 62):
+        # 0: grid index, 1 << 62: overlap matrix
+        monkeypatch.setattr(merge_blocks_and_spans, 'MAX_DENSE_PAIRS', max_dense_pairs)
+        assert filled_contents(*fill_spans_in_blocks(*copy.deepcopy((blocks, spans)), radio)) == expected
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_fill_spans_in_blocks_matches_reference(seed, monkeypatch):
+    rng = random.Random(seed)
+    for _ in range(20):
+        blocks, spans = random_page(rng.randint(1, 1500), rng)
+        # overlapping and nested blocks, the first one takes the span
+        blocks.append({'category_type': 'title', 'poly': [0, 0, 1600, 0, 1600, 300, 0, 300]})
+        rng.shuffle(blocks)
+        check_fill_spans(blocks, spans, rng.choice([0, 0.5, 0.6, 1]), monkeypatch)
+
+
+def test_fill_spans_in_blocks_degenerate_spans(monkeypatch):
+    blocks = [{'category_type': 'plain text', 'poly': [0, 0, 100, 0, 100, 50, 0, 50]},
+              {'category_type': 'plain text', 'poly': [200, 0, 100, 0, 100, 50, 200, 50]}]
+    bboxes = [[10, 10, 20, 20], [10, 10, 10, 20], [90, 0, 150, 10], [-1e9, 0, 1e9, 40], [float('nan'), 0, 10, 10],
+              [0, 0, float('inf'), 10], [120, 10, 110, 20], [1e30, 0, 1e30 + 1, 1], [300, 300, 310, 310]]
+    spans = [{'type': 'text', 'bbox': bbox, 'content': str(idx)} for idx, bbox in enumerate(bboxes)]
+    for radio in (-1, 0, 0.5):
+        check_fill_spans(blocks, spans, radio, monkeypatch)
+
+
+def test_span_grid_query_is_superset():
+    rng = np.random.default_rng(0)
+    x0, y0 = rng.uniform(0, 1000, (2, 500))
+    bboxes = np.stack([x0, y0, x0 + rng.uniform(0, 80, 500), y0 + rng.uniform(0, 20, 500)], 1)
+    grid = SpanGrid(bboxes)
+    for bbox in bboxes[:50] + [-5, -5, 5, 5]:
+        overlapping = np.flatnonzero((np.minimum(bboxes[:, 2], bbox[2]) > np.maximum(bboxes[:, 0], bbox[0])) &
+                                     (np.minimum(bboxes[:, 3], bbox[3]) > np.maximum(bboxes[:, 1], bbox[1])))
+        candidates = grid.query(bbox.tolist())
+        assert np.all(np.diff(candidates) > 0)
+        assert np.isin(overlapping, candidates).all()
@@ -0,0 +1,64 @@
+import json
+import math
+import random
+
+import numpy as np
+import pytest
+
+from pdf_extract_kit.utils.page_result import PageResult, dumps_json
+
+
+def random_page(page_no, num_dets, rng):
+    """layout and formula detections with int polys, ocr lines with rectangle float polys and text, and odd detections."""
+    layout_dets = []
+    for _ in range(num_dets):
+        x, y = rng.uniform(0, 1600), rng.uniform(0, 2300)
+        kind = rng.random()
+        if kind < 0.2:
+            xmin, ymin = int(x), int(y)
+            layout_dets.append({'category_type': rng.choice(['title', 'inline']), 'poly': [xmin, ymin, xmin + 80, ymin, xmin + 80, ymin + 20, xmin, ymin + 20],
+                                'score': round(rng.random(), 2), 'latex': '\\frac{a}{b} "q" %s'})
+        elif kind < 0.8:
+            width, height = rng.uniform(50, 700), rng.uniform(15, 30)
+            layout_dets.append({'category_type': 'text', 'poly': [x, y, x + width, y, x + width, y + height, x, y + height],
+                                'score': round(rng.random(), 2), 'text': 'lorem ipsum 中文 ' * rng.randint(0, 2)})
+        elif kind < 0.9:
+            # rotated, mixed int and float, non finite and negative zero coordinates
+            poly = [x, y, x + 10, y + 1, int(x) + 10, y + 20, -0.0, 0.0]
+            poly[rng.randrange(8)] = rng.choice([math.nan, math.inf, -math.inf, 0.0, -0.0, 3])
+            layout_dets.append({'score': rng.choice([0.5, math.nan]), 'poly': poly, 'category_type': 'figure'})
+        else:
+            layout_dets.append({'category_type': 'table', 'poly': [x, y], 'html': {'rows': [1, 2]}, 'text': 'a', 'latex': 'b'})
+    return {'layout_dets': layout_dets, 'page_info': {'page_no': page_no, 'height': 2339, 'width': 1654}}
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_to_json_matches_json_dumps(indent):
+    rng = random.Random(0)
+    pages = [random_page(idx, rng.randint(0, 300), rng) for idx in range(20)] + [{'layout_dets': []}, {}]
+    page_results = [PageResult.from_dict(page) for page in pages]
+    assert dumps_json(page_results, indent=indent) == json.dumps(pages, ensure_ascii=False, indent=indent)
+    for page, page_result in zip(pages, page_results):
+        assert page_result.to_json(indent=indent) == json.dumps(page, ensure_ascii=False, indent=indent)
+        assert json.dumps(page_result.to_dict()) == json.dumps(page)
+
+
+def test_fill_texts():
+    rng = random.Random(1)
+    page = random_page(0, 200, rng)
+    page_result = PageResult.from_dict(page)
+    formulas = [idx for idx, det in enumerate(page['layout_dets']) if 'latex' in det and 'text' not in det]
+    latex_list = [f"x_{{{idx}}}" * (idx % 3) for idx in formulas]
+    page_result.fill_texts(formulas, latex_list)
+    for idx, latex in zip(formulas, latex_list):
+        page['layout_dets'][idx]['latex'] = latex
+    assert json.dumps(page_result.to_dict()) == json.dumps(page)
+    assert page_result.to_json(indent=2) == json.dumps(page, ensure_ascii=False, indent=2)
+
+
+def test_fill_texts_needs_a_text():
+    page_result = PageResult.from_dict({'layout_dets': [{'category_type': 'figure', 'poly': [0] * 8}]})
+    with pytest.raises(AssertionError):
+        page_result.fill_texts([0], ['x'])
+    page_result.fill_texts([], [])
+    assert np.array_equal(page_result.text_offsets, [0, 0])
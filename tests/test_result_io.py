@@ -0,0 +1,23 @@
+import pytest
+
+from pdf_extract_kit.utils.result_io import open_result_writer, iter_result_pages
+
+
+def document_pages():
+    """pages with and without detections, float polys like the pages read back from arrow and parquet."""
+    def page(page_no, layout_dets):
+        return {'layout_dets': layout_dets, 'page_info': {'page_no': page_no, 'height': 2339, 'width': 1654}}
+    text = {'category_type': 'text', 'poly': [0.5, 1.0, 9.5, 1.0, 9.5, 8.0, 0.5, 8.0], 'score': 0.97, 'text': 'lorem'}
+    formula = {'category_type': 'inline', 'poly': [1.0, 2.0, 3.0, 2.0, 3.0, 4.0, 1.0, 4.0], 'score': 0.8, 'latex': 'x+y'}
+    return [page(0, []), page(1, [text, formula]), page(2, []), page(3, []), page(4, [formula]), page(5, [])]
+
+
+@pytest.mark.parametrize('result_format, module', [('jsonl', 'json'), ('msgpack', 'msgpack'), ('arrow', 'pyarrow'), ('parquet', 'pyarrow.parquet')])
+def test_result_pages_round_trip(tmp_path, result_format, module):
+    pytest.importorskip(module)
+    pages = document_pages()
+    path = str(tmp_path / f"doc.{result_format}")
+    with open_result_writer(path) as writer:
+        writer.write_pages(pages[:3])
+        writer.write_pages(pages[3:])
+    assert list(iter_result_pages(path)) == pages